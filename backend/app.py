@@ -1,11 +1,23 @@
 from db_setup import create_db
 create_db.setup_theia_db()
 
-from flask import Flask, jsonify
+import io
+import os
+from flask import Flask, Request, jsonify
 from flask_cors import CORS
 from routes.api_routes import api_bp
+from services.database import database
+
+# uploaded photos are kept in memory, werkzeug would otherwise spool any over 500KB to a temp file
+class in_memory_upload_request(Request) :
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 app = Flask(__name__)
+app.request_class = in_memory_upload_request
+
+# largest request body accepted (photos are held in memory), bigger ones get a 413
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("THEIA_MAX_UPLOAD_MB", 16)) * 1024 * 1024
 
 # CORS configuration - more permissive for development
 CORS(app, 
@@ -20,13 +32,26 @@ CORS(app,
 
 app.secret_key = 'fake_key_seriously_its_fake'
 
+# keep rows serialized in their column order like before
+app.json.sort_keys = False
+
 @app.route('/')
 def home():
     return jsonify({"message": "Hello from Python!", "status": "running"})
 
+# one pooled db connection per request, handed back when the request ends
+app.teardown_appcontext(database.release_request_connection)
+
 # routes - /api
 app.register_blueprint(api_bp)
 
+# THEIA_PRELOAD_MODEL=1 loads and warms up the detection model in the background at startup
+# (the debug reloader runs this file in two processes, only the one serving requests preloads)
+if os.environ.get("THEIA_PRELOAD_MODEL") == "1" and (__name__ != '__main__' or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+    from routes.api_routes import simple_detection
+    if simple_detection:
+        simple_detection.start_warm_up()
+
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,61 @@
+#
+# images per second through the detection model on cpu for different batch sizes
+#
+# run from the backend directory -> [ python benchmarks/bench_detection_batching.py ]
+#
+# "direct" calls the pipeline with a batch of n images
+# "batcher" has n threads calling simple_detection.predict at the same time so the micro batcher groups them
+#
+import os
+import sys
+import time
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from PIL import Image
+import simple_detection
+
+BATCH_SIZES = [1, 2, 4, 8]
+ROUNDS = 3
+PHOTOS_DIR = Path(__file__).parent.parent / "data" / "captured_photos"
+
+def load_images() -> list:
+    return [Image.open(path).convert("RGB") for path in sorted(PHOTOS_DIR.glob("*.jpg"))]
+
+def direct(images: list, batch_size: int) -> float:
+    batch = [images[i % len(images)] for i in range(batch_size)]
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        simple_detection.predict_batch(batch)
+    return batch_size * ROUNDS / (time.perf_counter() - start)
+
+def batched(images: list, batch_size: int) -> float:
+    simple_detection.DETECTION_BATCH_SIZE = batch_size
+    simple_detection._batchers.clear()
+    
+    def worker(index: int):
+        for _ in range(ROUNDS):
+            simple_detection.predict(images[index % len(images)])
+    
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(batch_size)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return batch_size * ROUNDS / (time.perf_counter() - start)
+
+def main():
+    images = load_images()
+    simple_detection.load_model()
+    simple_detection.predict_batch(images[:1])
+    
+    print(f"cpu threads: {os.cpu_count()}")
+    print(f"{'batch':>5} {'direct img/s':>13} {'batcher img/s':>14}")
+    for batch_size in BATCH_SIZES:
+        print(f"{batch_size:>5} {direct(images, batch_size):>13.2f} {batched(images, batch_size):>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#
+# time to the first hazard warning for the sample photos in data/captured_photos
+#
+# run from the backend directory -> [ python benchmarks/bench_hazard_latency.py ]
+#
+# "full path" is when the hazard was first said before the fast path: the photo is detected, drawn, saved and
+# summarized and the hazard is only heard as part of the description
+# "fast path" is detect_hazards_from_bytes, the warning is queued for speech as soon as the predictions are back
+# both are timed from having the uploaded bytes to the text being queued for speech (speaking itself is the same)
+#
+# "model" is the prediction alone, what is left of either path is the cost of everything around it
+#
+# the default coco models have no stairs or roadblock label: on the staircase photo they find nothing to warn about
+# and on the roadblock photo only the coco objects around it (stop sign, car, bench, ...), run it with models trained
+# on them (THEIA_ACCURATE_MODEL_ID) and THEIA_HAZARD_PRIORITIES="stairs:100,roadblock:100,..." to time those warnings
+#
+import io
+import sys
+import time
+import statistics
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from PIL import Image
+
+ROUNDS = 5
+TIER = "accurate"
+PHOTOS_DIR = Path(__file__).parent.parent / "data" / "captured_photos"
+
+def full_path(photo_bytes: bytes, results_dir: Path) -> tuple[float, str]:
+    import simple_detection
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(photo_bytes)).convert("RGB")
+    predictions = simple_detection.predict(image, TIER)
+    result = simple_detection.result_image(image, predictions)
+    result.save(results_dir / "result.jpg")
+    description = simple_detection.summarize_predictions_natural_language(predictions, image.size)
+    return time.perf_counter() - start, description
+
+def fast_path(photo_bytes: bytes) -> tuple[float, str]:
+    import simple_detection
+    start = time.perf_counter()
+    warning, found, predictions, size = simple_detection.detect_hazards_from_bytes(photo_bytes, TIER, speak=False, received_at=start)
+    return time.perf_counter() - start, warning
+
+def model_only(photo_bytes: bytes) -> tuple[float, str]:
+    import simple_detection
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(photo_bytes)).convert("RGB")
+    predictions = simple_detection.predict(image, TIER)
+    return time.perf_counter() - start, ", ".join(sorted({ prediction["label"] for prediction in predictions })) or "nothing"
+
+def median_ms(fn, *args) -> tuple[float, str]:
+    times = []
+    for _ in range(ROUNDS):
+        seconds, text = fn(*args)
+        times.append(seconds)
+    return statistics.median(times) * 1000, text
+
+def main():
+    import simple_detection
+    from hazards import hazards
+    simple_detection.load_model(TIER)
+    # the first inference is slower than the rest
+    simple_detection.predict(Image.new("RGB", (640, 480)), TIER)
+
+    with tempfile.TemporaryDirectory() as results_dir:
+        for path in sorted(PHOTOS_DIR.glob("*.jpg")):
+            photo_bytes = path.read_bytes()
+            print(f"{path.name[:60]}, median of {ROUNDS}")
+            model_ms, labels = median_ms(model_only, photo_bytes)
+            full_ms, description = median_ms(full_path, photo_bytes, Path(results_dir))
+            fast_ms, warning = median_ms(fast_path, photo_bytes)
+            print(f"  {'model':<12} {model_ms:>8.1f} ms  -> {labels}")
+            print(f"  {'full path':<12} {full_ms:>8.1f} ms  -> {description}")
+            print(f"  {'fast path':<12} {fast_ms:>8.1f} ms  -> {warning or 'no hazard found'}")
+
+    print(f"hazards -> {hazards.stats()}")
+
+if __name__ == "__main__":
+    main()
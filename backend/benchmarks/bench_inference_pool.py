@@ -0,0 +1,93 @@
+#
+# cost of handing a decoded frame to another process and getting its predictions back, without the model
+#
+# run from the backend directory -> [ python benchmarks/bench_inference_pool.py ]
+#
+# "pickle" sends the PIL image itself over a pipe like a multiprocessing pool would
+# "shared memory" writes its pixels into a shared memory buffer and only sends the frames size, like inference_pool
+# the other process reads the frame and answers with a handful of predictions either way
+#
+import time
+import statistics
+import multiprocessing
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+ROUNDS = 50
+FRAME_SIZES = [(640, 480), (1280, 720), (1920, 1080), (4032, 3024)]
+PREDICTIONS = [{ "score": 0.9, "label": "person", "box": { "xmin": 10, "ymin": 20, "xmax": 300, "ymax": 400 } }] * 5
+
+def pickle_child(conn):
+    while True:
+        try:
+            image = conn.recv()
+        except EOFError:
+            return
+        image.getpixel((0, 0))
+        conn.send(PREDICTIONS)
+
+def shared_memory_child(conn, memory_name):
+    # forked, so it shares the resource tracker of the parent which unlinks the memory
+    memory = shared_memory.SharedMemory(name=memory_name)
+    while True:
+        try:
+            width, height = conn.recv()
+        except EOFError:
+            break
+        pixels = memory.buf[:width * height * 3]
+        image = Image.frombuffer("RGB", (width, height), pixels, "raw", "RGB", 0, 1)
+        image.getpixel((0, 0))
+        image = None
+        pixels.release()
+        conn.send(PREDICTIONS)
+    memory.close()
+
+def median_ms(fn) -> float:
+    fn()
+    times = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def main():
+    largest = max(width * height * 3 for width, height in FRAME_SIZES)
+    memory = shared_memory.SharedMemory(create=True, size=largest)
+    pickle_conn, pickle_child_conn = multiprocessing.Pipe()
+    shm_conn, shm_child_conn = multiprocessing.Pipe()
+    children = [
+        multiprocessing.Process(target=pickle_child, args=(pickle_child_conn,), daemon=True),
+        multiprocessing.Process(target=shared_memory_child, args=(shm_child_conn, memory.name), daemon=True),
+    ]
+    for child in children:
+        child.start()
+
+    def send_pickled(image):
+        pickle_conn.send(image)
+        return pickle_conn.recv()
+
+    def send_shared(image):
+        width, height = image.size
+        memory.buf[:width * height * 3] = image.tobytes()
+        shm_conn.send((width, height))
+        return shm_conn.recv()
+
+    try:
+        print(f"frame handoff round trip, median of {ROUNDS}")
+        for width, height in FRAME_SIZES:
+            image = Image.effect_noise((width, height), 40).convert("RGB")
+            print(f"{width}x{height} ({width * height * 3 // 1024}KB)")
+            print(f"  {'pickle':<16} {median_ms(lambda: send_pickled(image)):>8.2f} ms")
+            print(f"  {'shared memory':<16} {median_ms(lambda: send_shared(image)):>8.2f} ms")
+    finally:
+        pickle_conn.close()
+        shm_conn.close()
+        for child in children:
+            child.join(timeout=5)
+        memory.close()
+        memory.unlink()
+
+if __name__ == "__main__":
+    main()
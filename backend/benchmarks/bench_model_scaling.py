@@ -0,0 +1,73 @@
+#
+# images per second and latency through one detection model for each model concurrency limit
+#
+# run from the backend directory -> [ python benchmarks/bench_model_scaling.py [tier] ]
+#
+# THEIA_MODEL_CONCURRENCY is how many inferences may run on the one shared model at once (see services/model_registry.py)
+# and THEIA_MODEL_THREADS defaults to the cores divided by it, torch has one thread count for the whole process that every
+# running inference shares, this runs REQUESTS requests at once against each limit with the threads it defaults to
+#   "1" is one inference at a time with torch using every core, the rest wait their turn
+#   more lets that many inferences run at once on the same weights with fewer threads each
+# the best img/s shows whether this machine does better with wide inferences or more of them at once, p95 what the wait costs
+#
+import os
+import sys
+import time
+import statistics
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from PIL import Image
+from detection_backends import create_backend
+from model_registry import model_holder, set_torch_threads, MODEL_TIERS
+import simple_detection
+
+CONCURRENCY_LIMITS = [1, 2, 4, 8]
+REQUESTS = 8
+IMAGES_PER_REQUEST = 4
+PHOTOS_DIR = Path(__file__).parent.parent / "data" / "captured_photos"
+
+def run_requests(holder: model_holder, images: list) -> tuple[float, list[float]]:
+    """(images per second, seconds each image took including the wait for a slot)"""
+    latencies = []
+    lock = threading.Lock()
+    def request(index: int):
+        for n in range(IMAGES_PER_REQUEST):
+            start = time.perf_counter()
+            with holder.use() as model:
+                model(images[(index + n) % len(images)])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+    
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(REQUESTS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return REQUESTS * IMAGES_PER_REQUEST / (time.perf_counter() - start), sorted(latencies)
+
+def main():
+    tier = sys.argv[1] if len(sys.argv) > 1 else "accurate"
+    cores = os.cpu_count() or 1
+    images = [Image.open(path).convert("RGB") for path in sorted(PHOTOS_DIR.glob("*.jpg"))]
+    
+    # loaded once, one copy for every limit like the app has
+    config = MODEL_TIERS[tier]
+    model = create_backend(simple_detection.DETECTION_BACKEND, config["model_id"], config["image_size"])
+    model(images[0])
+    
+    print(f"{simple_detection.DETECTION_BACKEND} backend, {config['model_id']}, {cores} cores, {REQUESTS} requests of {IMAGES_PER_REQUEST} images at once")
+    print(f"{'concurrency':>11} {'torch threads':>13} {'img/s':>7} {'median ms':>10} {'p95 ms':>8}")
+    for concurrency in CONCURRENCY_LIMITS:
+        threads = max(1, cores // concurrency)
+        # what model_holder does when the model loads, done here because the model is already loaded
+        set_torch_threads(threads)
+        holder = model_holder(lambda: model, concurrency, threads)
+        throughput, latencies = run_requests(holder, images)
+        print(f"{concurrency:>11} {threads:>13} {throughput:>7.2f} {statistics.median(latencies) * 1000:>10.1f} {latencies[int(len(latencies) * 0.95)] * 1000:>8.1f}")
+
+if __name__ == "__main__":
+    main()
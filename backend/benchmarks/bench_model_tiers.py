@@ -0,0 +1,79 @@
+#
+# load time, memory and latency of each model tier (see services/model_registry.py) on cpu
+#
+# run from the backend directory -> [ python benchmarks/bench_model_tiers.py ]
+#
+# each tier is measured in its own python process so the memory of one model doesn't count towards the next
+# memory is how much the process grew (rss) loading and running the model, weights is the backends memory_bytes estimate
+# the model registry is bounded by (THEIA_MODEL_REGISTRY_MB)
+#
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+ROUNDS = 5
+
+MEASURE = """
+import json, statistics, sys, time
+sys.path.insert(0, "services")
+from pathlib import Path
+from PIL import Image
+
+def rss_mb():
+    for line in open("/proc/self/status"):
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) / 1024
+    return 0.0
+
+import simple_detection
+images = [Image.open(path).convert("RGB") for path in sorted(Path("data/captured_photos").glob("*.jpg"))] or [Image.new("RGB", (640, 480))]
+tier = sys.argv[1]
+
+before = rss_mb()
+start = time.perf_counter()
+model = simple_detection.load_model(tier)
+load_seconds = time.perf_counter() - start
+model(images[0])
+
+times = []
+objects = 0
+for image in images:
+    for _ in range(%d):
+        start = time.perf_counter()
+        predictions = model(image)
+        times.append(time.perf_counter() - start)
+    objects += len(predictions)
+
+print(json.dumps({
+    "model_id": simple_detection.MODEL_TIERS[tier]["model_id"],
+    "load_seconds": load_seconds,
+    "median_ms": statistics.median(times) * 1000,
+    "p95_ms": sorted(times)[int(len(times) * 0.95)] * 1000,
+    "memory_mb": rss_mb() - before,
+    "weights_mb": getattr(model, "memory_bytes", 0) / 1024 / 1024,
+    "objects": objects,
+}))
+""" % ROUNDS
+
+def measure(tier: str) -> dict:
+    result = subprocess.run([sys.executable, "-c", MEASURE, tier], cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    sys.path.insert(0, str(BACKEND_DIR / "services"))
+    from model_registry import MODEL_TIERS
+    
+    print(f"{'tier':<10} {'model':<26} {'load s':>7} {'median ms':>10} {'p95 ms':>8} {'memory mb':>10} {'weights mb':>11} {'objects':>8}")
+    for tier in MODEL_TIERS:
+        try:
+            r = measure(tier)
+            print(f"{tier:<10} {r['model_id']:<26} {r['load_seconds']:>7.1f} {r['median_ms']:>10.1f} {r['p95_ms']:>8.1f} {r['memory_mb']:>10.0f} {r['weights_mb']:>11.0f} {r['objects']:>8}")
+        except Exception as e:
+            print(f"{tier:<10} failed -> {e}")
+
+if __name__ == "__main__":
+    main()
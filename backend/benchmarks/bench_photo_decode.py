@@ -0,0 +1,83 @@
+#
+# time spent getting an uploaded photo from the request into a decoded image, before the model sees it
+#
+# run from the backend directory -> [ python benchmarks/bench_photo_decode.py ]
+#
+# "upload" parses the multipart request with werkzeugs default stream (spools photos over 500KB to a temp file)
+# and with the in memory stream the app uses
+# "decode" compares the old temp file round trip (save, Image.open, unlink) with decoding the bytes in memory,
+# in full and in jpeg draft mode at the fast and accurate models input sizes
+#
+import io
+import os
+import sys
+import time
+import tempfile
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from PIL import Image
+from flask import Request
+from werkzeug.test import EnvironBuilder
+
+ROUNDS = 30
+PHOTOS_DIR = Path(__file__).parent.parent / "data" / "captured_photos"
+# the captured photos are small, a phone camera sized frame is added to them
+PHONE_SIZE = (1920, 1080)
+
+def sample_photos() -> list[tuple[str, bytes]]:
+    photos = [(path.name, path.read_bytes()) for path in sorted(PHOTOS_DIR.glob("*.jpg"))]
+    image = Image.effect_noise(PHONE_SIZE, 40).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return photos + [(f"noise {PHONE_SIZE[0]}x{PHONE_SIZE[1]}", buffer.getvalue())]
+
+def median_ms(fn) -> float:
+    fn()
+    times = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def parse_upload(request_class, photo_bytes: bytes):
+    builder = EnvironBuilder(method="POST", data={ "photo": (io.BytesIO(photo_bytes), "photo.jpg") })
+    environ = builder.get_environ()
+    request = request_class(environ)
+    return request.files["photo"].read()
+
+def temp_file_decode(photo_bytes: bytes):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
+        temp_file.write(photo_bytes)
+        temp_path = temp_file.name
+    image = Image.open(temp_path).convert("RGB")
+    os.unlink(temp_path)
+    return image
+
+def main():
+    from app import in_memory_upload_request
+    from simple_detection import decode_photo
+    
+    for name, photo_bytes in sample_photos():
+        width, height = Image.open(io.BytesIO(photo_bytes)).size
+        print(f"{name} ({width}x{height}, {len(photo_bytes) // 1024}KB), median of {ROUNDS}")
+        
+        print(f"  {'upload default stream':<28} {median_ms(lambda: parse_upload(Request, photo_bytes)):>8.2f} ms")
+        print(f"  {'upload in memory stream':<28} {median_ms(lambda: parse_upload(in_memory_upload_request, photo_bytes)):>8.2f} ms")
+        
+        cases = [
+            ("decode temp file", lambda: temp_file_decode(photo_bytes)),
+            ("decode in memory", lambda: decode_photo(photo_bytes)),
+            ("decode in memory draft 800", lambda: decode_photo(photo_bytes, 800)),
+            ("decode in memory draft 512", lambda: decode_photo(photo_bytes, 512)),
+        ]
+        for label, fn in cases:
+            decoded = fn()
+            print(f"  {label:<28} {median_ms(fn):>8.2f} ms  -> {decoded.size[0]}x{decoded.size[1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#
+# what a client downscaling photos to the models input size before uploading saves, and the preprocessing cost
+#
+# run from the backend directory -> [ python benchmarks/bench_preprocessing.py ]
+#
+# for a phone sized frame sent as is and downscaled to each shortest edge: upload bytes, decode time,
+# time in image_preprocessor and (when transformers is installed) time in the transformers image processor
+#
+import io
+import sys
+import time
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from PIL import Image
+from preprocessing import image_preprocessor
+
+ROUNDS = 20
+PHONE_SIZE = (1920, 1080)
+JPEG_QUALITY = 85
+# detrs preprocessing, used when transformers can't be imported to read it from the models processor
+DETR_MEAN = [0.485, 0.456, 0.406]
+DETR_STD = [0.229, 0.224, 0.225]
+SHORTEST_EDGES = [800, 512]
+
+def median_ms(fn) -> float:
+    fn()
+    times = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def phone_frame() -> Image.Image:
+    # a blurred noise frame compresses roughly like a camera frame
+    photo = Path(__file__).parent.parent / "data" / "captured_photos" / "roadblockst1.jpg"
+    if photo.exists():
+        return Image.open(photo).convert("RGB").resize(PHONE_SIZE, Image.BICUBIC)
+    return Image.effect_noise(PHONE_SIZE, 30).convert("RGB")
+
+def jpeg_bytes(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=JPEG_QUALITY)
+    return buffer.getvalue()
+
+def transformers_processor(shortest_edge: int):
+    try:
+        from transformers import AutoImageProcessor
+        return AutoImageProcessor.from_pretrained("facebook/detr-resnet-50", size={ "shortest_edge": shortest_edge, "longest_edge": round(shortest_edge * 1333 / 800) })
+    except Exception:
+        return None
+
+def main():
+    frame = phone_frame()
+    print(f"frame {PHONE_SIZE[0]}x{PHONE_SIZE[1]}, jpeg quality {JPEG_QUALITY}, median of {ROUNDS}")
+    print(f"{'model size':>10} {'upload':>8} {'upload KB':>10} {'decode ms':>10} {'preprocess ms':>14} {'transformers ms':>16}")
+    
+    for shortest_edge in SHORTEST_EDGES:
+        preprocessor = image_preprocessor(shortest_edge, round(shortest_edge * 1333 / 800), DETR_MEAN, DETR_STD)
+        processor = transformers_processor(shortest_edge)
+        
+        for label, upload in (("full", frame), ("scaled", preprocessor.resize(frame))):
+            data = jpeg_bytes(upload)
+            decode_ms = median_ms(lambda: Image.open(io.BytesIO(data)).convert("RGB"))
+            decoded = Image.open(io.BytesIO(data)).convert("RGB")
+            preprocess_ms = median_ms(lambda: preprocessor([decoded]))
+            transformers_ms = f"{median_ms(lambda: processor(images=[decoded], return_tensors='pt')):>16.2f}" if processor else f"{'-':>16}"
+            print(f"{shortest_edge:>10} {label:>8} {len(data) / 1024:>10.0f} {decode_ms:>10.2f} {preprocess_ms:>14.2f} {transformers_ms}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#
+# cost of the generic table helpers sql: the old += concatenation vs the cached query_builder
+#
+# run from the backend directory -> [ python benchmarks/bench_query_builder.py ]
+#
+# "build" only times making the sql text (the old path also printed it every call)
+# "insert" runs add_data_by_table style inserts on an in memory db, the old path put the values
+# into the sql so sqlite had to prepare a new statement for every row
+#
+import io
+import sys
+import sqlite3
+import timeit
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.database import query_builder, CURRENT_TIMESTAMP, sql_expression
+
+ROUNDS = 20000
+WHERE = [("impaired_user_id", 1), ("id", 4)]
+COLUMNS = ["id", "notice_status", "small_description", "notice_date"]
+
+# how the select queries were built before the builder (get_data_by_key_and_table, since removed)
+def concat_select(where, tablename, columns):
+    execute_script = """
+            SELECT
+        """
+    first_check = True
+    for col in columns:
+        if (first_check):
+            execute_script += f"""
+                    {col}
+                """
+            first_check = False
+        else:
+            execute_script += f"""
+                    , {col}
+                """
+    execute_script = execute_script + f"""
+            FROM {tablename}
+            WHERE
+        """
+    where_values = ()
+    first_check = True
+    for w in where:
+        if (first_check):
+            execute_script += f"""
+                    {w[0]} = ?
+                """
+            first_check = False
+        else:
+            execute_script += f"""
+                    AND {w[0]} = ?
+                """
+        where_values += (w[1],)
+    print(execute_script)
+    print(where_values)
+    return execute_script, where_values
+
+def builder_select(where, tablename, columns):
+    execute_script = query_builder.select(tablename, tuple(columns), tuple([w[0] for w in where]))
+    return execute_script, tuple([w[1] for w in where])
+
+# how add_data_by_table built its sql before the builder, values were written into the text
+def concat_insert(cursor, tablename, columns):
+    execute_script = f"""
+            INSERT INTO {tablename} (
+        """
+    first_check = True
+    for col in columns:
+        if (first_check):
+            execute_script += f"""
+                    {col[0]}
+                """
+            first_check = False
+        else:
+            execute_script += f"""
+                    , {col[0]}
+                """
+    execute_script += """
+            ) VALUES (
+        """
+    first_check = True
+    for col in columns:
+        if (first_check):
+            execute_script += f"""
+                    {col[1]}
+                """
+            first_check = False
+        else:
+            execute_script += f"""
+                , {col[1]}
+                """
+    execute_script += """
+            )
+        """
+    print(execute_script)
+    cursor.execute(execute_script)
+
+def builder_insert(cursor, tablename, columns):
+    execute_script = query_builder.insert(tablename, tuple([(col[0], col[1] if isinstance(col[1], sql_expression) else None) for col in columns]))
+    cursor.execute(execute_script, tuple([col[1] for col in columns if not isinstance(col[1], sql_expression)]))
+
+def time_per_call(f) -> float:
+    with redirect_stdout(io.StringIO()):
+        return timeit.timeit(f, number=ROUNDS) / ROUNDS * 1e6
+
+def main():
+    for name, build in [("concatenation", concat_select), ("query_builder", builder_select)]:
+        print(f"build  {name:<16} {time_per_call(lambda: build(WHERE, 'activity', COLUMNS)):>7.2f} us per query")
+    
+    db_conn = sqlite3.connect(":memory:")
+    db_conn.execute("CREATE TABLE activity (id INTEGER PRIMARY KEY, impaired_user_id INTEGER, small_description TEXT, notice_date TEXT)")
+    cursor = db_conn.cursor()
+    counter = iter(range(10 ** 9))
+    print(f"insert concatenation    {time_per_call(lambda: concat_insert(cursor, 'activity', [('impaired_user_id', 1), ('small_description', repr(f'walk {next(counter)}')), ('notice_date', 'CURRENT_TIMESTAMP')])):>7.2f} us per row")
+    print(f"insert query_builder    {time_per_call(lambda: builder_insert(cursor, 'activity', [('impaired_user_id', 1), ('small_description', f'walk {next(counter)}'), ('notice_date', CURRENT_TIMESTAMP)])):>7.2f} us per row")
+    db_conn.close()
+    
+    print(query_builder.select.cache_info())
+    print(query_builder.insert.cache_info())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#
+# cost vs recall of running the whole photo, the walking corridor (roi) or tiles through each model tier
+#
+# run from the backend directory -> [ python benchmarks/bench_regions.py ]
+#
+# recall is measured against a reference detection of each photo in data/captured_photos: the accurate model on
+# the full photo and on a 3x3 grid of tiles at full resolution, merged, the most it can find
+# a reference object counts as found when a prediction of the same label overlaps it by at least MATCH_IOU
+# "corridor" is the recall of only the reference objects in the walking corridor, the ones roi is meant for
+#
+import os
+import sys
+import time
+import statistics
+from pathlib import Path
+
+# one photo at a time, batching would only add its wait to the timings
+os.environ["THEIA_DETECTION_BATCH_SIZE"] = "1"
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from PIL import Image
+
+ROUNDS = 3
+MATCH_IOU = 0.5
+REFERENCE_GRID = (3, 3)
+PHOTOS_DIR = Path(__file__).parent.parent / "data" / "captured_photos"
+
+def reference_predictions(image: Image.Image) -> list[dict]:
+    import simple_detection
+    from regions import tile_boxes, merge_regions, TILE_OVERLAP
+    boxes = [(0, 0, image.width, image.height)] + tile_boxes(image.size, REFERENCE_GRID, TILE_OVERLAP)
+    predictions_per_box = [simple_detection.predict(image.crop(box), "accurate") for box in boxes]
+    return merge_regions(predictions_per_box, boxes)
+
+def in_corridor(prediction: dict, image_size: tuple[int, int]) -> bool:
+    from regions import corridor_box
+    left, top, right, bottom = corridor_box(image_size)
+    box = prediction["box"]
+    center_x, center_y = (box["xmin"] + box["xmax"]) / 2, (box["ymin"] + box["ymax"]) / 2
+    return left <= center_x <= right and top <= center_y <= bottom
+
+def recall(reference: list[dict], predictions: list[dict], scale: float) -> float|None:
+    """Fraction of the reference objects found, predictions are multiplied by scale to the references size"""
+    from boxes import iou
+    if not reference:
+        return None
+    scaled = [{ **prediction, "box": { name: value * scale for name, value in prediction["box"].items() } } for prediction in predictions]
+    found = 0
+    for expected in reference:
+        if any(prediction["label"] == expected["label"] and iou(prediction["box"], expected["box"]) >= MATCH_IOU for prediction in scaled):
+            found += 1
+    return found / len(reference)
+
+def format_recall(value: float|None) -> str:
+    return "   -" if value is None else f"{value:>4.0%}"
+
+def main():
+    import simple_detection
+    from regions import REGIONS
+    for tier in simple_detection.MODEL_TIERS:
+        simple_detection.load_model(tier)
+        simple_detection.predict(Image.new("RGB", (640, 480)), tier)
+
+    for path in sorted(PHOTOS_DIR.glob("*.jpg")):
+        photo_bytes = path.read_bytes()
+        full_image = Image.open(path).convert("RGB")
+        reference = reference_predictions(full_image)
+        corridor_reference = [prediction for prediction in reference if in_corridor(prediction, full_image.size)]
+        print(f"{path.name[:60]} ({full_image.width}x{full_image.height}), {len(reference)} reference objects, {len(corridor_reference)} in the corridor")
+        print(f"  {'tier':<10} {'region':<7} {'median ms':>10} {'recall':>7} {'corridor':>9}")
+
+        for tier in simple_detection.MODEL_TIERS:
+            for region in REGIONS:
+                times = []
+                for _ in range(ROUNDS):
+                    # roi and tiles decode the photo bigger, that is part of their cost
+                    start = time.perf_counter()
+                    image = simple_detection.decode_for_region(photo_bytes, tier, region)
+                    predictions = simple_detection.predict_region(image, tier, region)
+                    times.append(time.perf_counter() - start)
+                scale = full_image.width / image.width
+                print(f"  {tier:<10} {region:<7} {statistics.median(times) * 1000:>10.1f} "
+                      f"{format_recall(recall(reference, predictions, scale)):>7} {format_recall(recall(corridor_reference, predictions, scale)):>9}")
+
+if __name__ == "__main__":
+    main()
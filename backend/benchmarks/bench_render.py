@@ -0,0 +1,92 @@
+#
+# time to draw the detections onto a photo, the old matplotlib figure vs drawing straight on the photo with PIL
+#
+# run from the backend directory -> [ python benchmarks/bench_render.py ]
+#
+# also times encoding the drawn photo in each result image format and the size it comes out at
+#
+import io
+import sys
+import time
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from PIL import Image
+from renderer import draw_predictions, encode_image, RESULT_IMAGE_FORMATS
+
+ROUNDS = 10
+PHOTO = Path(__file__).parent.parent / "data" / "captured_photos" / "roadblockst1.jpg"
+SIZES = [(533, 400), (1920, 1080)]
+PREDICTIONS = [
+    { "label": "stop sign", "score": 0.97, "box": { "xmin": 0.28, "ymin": 0.48, "xmax": 0.75, "ymax": 0.69 } },
+    { "label": "person", "score": 0.81, "box": { "xmin": 0.31, "ymin": 0.0, "xmax": 0.5, "ymax": 0.33 } },
+    { "label": "car", "score": 0.64, "box": { "xmin": 0.05, "ymin": 0.3, "xmax": 0.2, "ymax": 0.38 } },
+]
+
+# render_results_in_image before the renderer replaced it
+def legacy_render(in_pil_img, in_results):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    
+    plt.figure(figsize=(16, 10))
+    plt.imshow(in_pil_img)
+    ax = plt.gca()
+    for prediction in in_results:
+        x, y = prediction['box']['xmin'], prediction['box']['ymin']
+        w = prediction['box']['xmax'] - prediction['box']['xmin']
+        h = prediction['box']['ymax'] - prediction['box']['ymin']
+        ax.add_patch(plt.Rectangle((x, y), w, h, fill=False, color="green", linewidth=2))
+        ax.text(x, y, f"{prediction['label']}: {round(prediction['score']*100, 1)}%", color='red')
+    plt.axis("off")
+    
+    img_buf = io.BytesIO()
+    plt.savefig(img_buf, format='png', bbox_inches='tight', pad_inches=0)
+    img_buf.seek(0)
+    modified_image = Image.open(img_buf)
+    modified_image.load()
+    plt.close()
+    return modified_image
+
+def median_ms(fn) -> float:
+    fn()
+    times = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def scaled_predictions(size: tuple[int, int]) -> list[dict]:
+    width, height = size
+    return [{
+        **prediction,
+        "box": { "xmin": prediction["box"]["xmin"] * width, "ymin": prediction["box"]["ymin"] * height,
+                 "xmax": prediction["box"]["xmax"] * width, "ymax": prediction["box"]["ymax"] * height },
+    } for prediction in PREDICTIONS]
+
+def main():
+    try:
+        import matplotlib
+    except ImportError:
+        matplotlib = None
+    
+    source = Image.open(PHOTO).convert("RGB")
+    print(f"median of {ROUNDS}")
+    for size in SIZES:
+        image = source.resize(size)
+        predictions = scaled_predictions(size)
+        print(f"{size[0]}x{size[1]}")
+        if matplotlib:
+            legacy = legacy_render(image, predictions)
+            print(f"  {'matplotlib draw':<18} {median_ms(lambda: legacy_render(image, predictions)):>8.1f} ms  -> {legacy.size[0]}x{legacy.size[1]}")
+        drawn = draw_predictions(image, predictions)
+        print(f"  {'pil draw':<18} {median_ms(lambda: draw_predictions(image, predictions)):>8.1f} ms  -> {drawn.size[0]}x{drawn.size[1]}")
+        for format in RESULT_IMAGE_FORMATS:
+            encoded = encode_image(drawn, format)
+            print(f"  {'encode ' + format:<18} {median_ms(lambda: encode_image(drawn, format)):>8.1f} ms  -> {len(encoded) // 1024}KB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#
+# how long the api takes to import and which imports cost the most (from python -X importtime)
+#
+# run from the backend directory -> [ python benchmarks/bench_startup.py ]
+#
+# also times importing simple_detection and loading the model to show what moved out of startup
+#
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+TOP_IMPORTS = 15
+
+def import_time_report(statement: str) -> tuple[float, list[tuple[int, str]], str|None]:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=BACKEND_DIR, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    
+    # lines look like "import time:       self [us] |  cumulative | imported package"
+    # self times are added up per top level package (transformers.models.detr counts for transformers)
+    packages = {}
+    errors = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        if "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    
+    imports = sorted(((us, package) for package, us in packages.items()), reverse=True)
+    error = errors[-1] if result.returncode != 0 and errors else None
+    return elapsed, imports, error
+
+def main():
+    cases = [
+        ("import app", "import app"),
+        ("import simple_detection", "import sys; sys.path.insert(0, 'services'); import simple_detection"),
+        ("load_model()", "import sys; sys.path.insert(0, 'services'); import simple_detection; simple_detection.load_model()"),
+    ]
+    for label, statement in cases:
+        elapsed, imports, error = import_time_report(statement)
+        print(f"--- {label}: {elapsed:.2f}s wall ---")
+        if error:
+            print(f"failed: {error}")
+        for cumulative_us, name in imports[:TOP_IMPORTS]:
+            print(f"{cumulative_us / 1000:>9.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
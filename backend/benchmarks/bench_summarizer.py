@@ -0,0 +1,90 @@
+#
+# time to turn predictions into the spoken description, the old inflect based function vs the summarizer
+#
+# run from the backend directory -> [ python benchmarks/bench_summarizer.py ]
+#
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from summarizer import summarizer, COCO_LABELS
+
+ROUNDS = 2000
+IMAGE_SIZE = (800, 600)
+PREDICTION_COUNTS = [0, 3, 10, 30]
+
+# summarize_predictions_natural_language before the summarizer replaced it
+def legacy_summarize(predictions):
+    import inflect
+    summary = {}
+    p = inflect.engine()
+
+    for prediction in predictions:
+        label = prediction['label']
+        if label in summary:
+            summary[label] += 1
+        else:
+            summary[label] = 1
+
+    result_string = "In front of you, there are "
+    for i, (label, count) in enumerate(summary.items()):
+        count_string = p.number_to_words(count)
+        result_string += f"{count_string} {label}"
+        if count > 1:
+          result_string += "s"
+
+        result_string += " "
+
+        if i == len(summary) - 2:
+          result_string += "and "
+
+    result_string = result_string.rstrip(', ') + "."
+    return result_string
+
+def random_predictions(count: int, rng: random.Random) -> list[dict]:
+    predictions = []
+    for _ in range(count):
+        x, y = rng.randrange(IMAGE_SIZE[0] - 50), rng.randrange(IMAGE_SIZE[1] - 50)
+        w, h = rng.randrange(10, IMAGE_SIZE[0] - x), rng.randrange(10, IMAGE_SIZE[1] - y)
+        predictions.append({
+            "score": rng.uniform(0.5, 1.0),
+            "label": rng.choice(COCO_LABELS[:12]),
+            "box": { "xmin": x, "ymin": y, "xmax": x + w, "ymax": y + h },
+        })
+    return predictions
+
+def per_call_us(fn, predictions: list[dict], rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(predictions)
+    return (time.perf_counter() - start) / rounds * 1_000_000
+
+def main():
+    rng = random.Random(0)
+    try:
+        import inflect
+    except ImportError:
+        inflect = None
+    
+    print(f"average of {ROUNDS} calls, image {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]}")
+    print(f"{'objects':>7} {'inflect us':>11} {'summarizer us':>14} {'speedup':>8}")
+    for count in PREDICTION_COUNTS:
+        predictions = random_predictions(count, rng)
+        new_us = per_call_us(lambda p: summarizer.summarize(p, IMAGE_SIZE), predictions, ROUNDS)
+        if inflect:
+            # inflect is much slower, fewer rounds keep the run short
+            old_us = per_call_us(legacy_summarize, predictions, ROUNDS // 20)
+            print(f"{count:>7} {old_us:>11.1f} {new_us:>14.1f} {old_us / new_us:>7.1f}x")
+        else:
+            print(f"{count:>7} {'-':>11} {new_us:>14.1f} {'-':>8}")
+    
+    example = random_predictions(6, rng)
+    if inflect:
+        print(f"\nbefore: {legacy_summarize(example)}")
+    print(f"after:  {summarizer.summarize(example, IMAGE_SIZE)}")
+
+if __name__ == "__main__":
+    main()
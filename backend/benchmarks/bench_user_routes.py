@@ -0,0 +1,58 @@
+#
+# requests per second on the user_routes endpoints before and after connection pooling
+#
+# run from the backend directory -> [ python benchmarks/bench_user_routes.py ]
+#
+# "before" reproduces the old behaviour of one new sqlite connection per query
+# "after" uses the pool with one connection per request
+#
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import app
+import services.database as database_module
+
+ENDPOINTS = [
+    "/api/user/",
+    "/api/user/status",
+    "/api/user/caretaker",
+    "/api/user/emergency_contact",
+    "/api/user/current_trip",
+    "/api/user/past_trip",
+    "/api/user/activity",
+]
+ROUNDS = 300
+
+def run(label: str):
+    client = app.test_client()
+    client.post("/api/auth/login", json={ "email": "janedoe@fake.com", "password": "password" })
+    
+    print(f"--- {label} ---")
+    for endpoint in ENDPOINTS:
+        client.get(endpoint)
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            client.get(endpoint)
+        elapsed = time.perf_counter() - start
+        print(f"{endpoint:<32} {ROUNDS / elapsed:>9.1f} req/s")
+
+def main():
+    pool = database_module.pool
+    pooled_size = pool.size
+    has_app_context = database_module.has_app_context
+    
+    pool.close_all()
+    pool.size = 0
+    database_module.has_app_context = lambda: False
+    run("before: connection per query")
+    
+    pool.size = pooled_size
+    database_module.has_app_context = has_app_context
+    run("after: pooled connection per request")
+    pool.close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#
+# checks with EXPLAIN QUERY PLAN that the lookups user_routes makes use an index instead of scanning the table
+# and that its keyset pages (query_builder.select_page) come out of an index in order instead of being sorted
+#
+# run from the backend directory -> [ python benchmarks/check_query_plans.py ]
+# exits with 1 when any of the queries scans a table or a page sorts its rows
+#
+import sys
+import sqlite3
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db_setup import create_db
+from services.database import query_builder
+
+# (table, columns, where keys) for the lookups done by user_routes
+LOOKUPS = [
+    ("users", ("id", "email", "firstname", "lastname", "user_type"), ("id",)),
+    ("users", ("id",), ("email", "pswd")),
+    ("caretaker_info", ("impaired_user_id",), ("caretaker_user_id",)),
+    ("caretaker_info", ("caretaker_user_id",), ("impaired_user_id",)),
+    ("current_trip", ("to_location", "from_location"), ("impaired_user_id",)),
+    ("emergency_contact", ("id", "contact_name", "contact_tel"), ("impaired_user_id",)),
+    ("emergency_contact", ("id", "contact_name", "contact_tel"), ("impaired_user_id", "id")),
+    ("past_trips", ("id", "destination_location", "complete_date"), ("impaired_user_id",)),
+    ("activity", ("id", "notice_status", "small_description", "notice_date"), ("impaired_user_id",)),
+    ("current_caretaker_conversation", ("id",), ("impaired_user_id",)),
+    ("current_caretaker_conversation", ("id",), ("caretaker_user_id",)),
+    ("current_caretaker_conversation_messages", ("msg_ordered_number", "user_type", "msg"), ("ccc_id",)),
+]
+
+# (table, columns, where keys, order key) for the keyset pages of user_routes.list_rows_response and the message polls
+PAGES = [
+    ("past_trips", ("id", "destination_location", "complete_date"), ("impaired_user_id",), "id"),
+    ("activity", ("id", "notice_status", "small_description", "notice_date"), ("impaired_user_id",), "id"),
+    ("current_caretaker_conversation_messages", ("msg_ordered_number", "user_type", "msg"), ("ccc_id",), "msg_ordered_number"),
+]
+
+def query_plan(conn: sqlite3.Connection, sql: str, values: int) -> str:
+    return " | ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, (None,) * values))
+
+def main() -> int:
+    failed = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = Path(temp_dir) / "plan_check.db"
+        conn = sqlite3.connect(str(db_path))
+        conn.executescript((create_db.file_root_path / "tables.sql").read_text())
+        conn.close()
+        version = create_db.run_migrations(db_path)
+        print(f"schema version {version}")
+        
+        conn = sqlite3.connect(str(db_path))
+        for tablename, columns, where_keys in LOOKUPS:
+            sql = query_builder.select(tablename, columns, where_keys)
+            plan = query_plan(conn, sql, len(where_keys))
+            ok = not plan.startswith("SCAN")
+            failed += not ok
+            print(f"{'ok  ' if ok else 'SCAN'} {tablename:<40} {','.join(where_keys):<34} {plan}")
+        
+        for tablename, columns, where_keys, order_key in PAGES:
+            for has_limit in (False, True):
+                sql = query_builder.select_page(tablename, columns, where_keys, order_key, has_limit)
+                plan = query_plan(conn, sql, len(where_keys) + 1 + has_limit)
+                status = "SCAN" if plan.startswith("SCAN") else "SORT" if "TEMP B-TREE" in plan else "ok  "
+                failed += status != "ok  "
+                print(f"{status} {tablename:<40} {','.join(where_keys) + ' > ' + order_key + (' limit' if has_limit else ''):<34} {plan}")
+        conn.close()
+    
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#
+# accuracy vs latency of each detection backend on the sample photos in data/captured_photos
+#
+# run from the backend directory -> [ python benchmarks/compare_detection_backends.py [backend names] ]
+# (the onnx backend needs [ pip install onnx onnxruntime ] and exports the model into data/models the first time)
+#
+# the pipeline backend is the reference, the others are scored by how many of its boxes they find
+# (same label and IoU >= 0.5) and how many of their own boxes match one of its boxes
+#
+import sys
+import time
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "services"))
+
+from PIL import Image
+from detection_backends import BACKENDS, create_backend
+import simple_detection
+
+ROUNDS = 3
+IOU_MATCH = 0.5
+PHOTOS_DIR = Path(__file__).parent.parent / "data" / "captured_photos"
+
+def iou(a: dict, b: dict) -> float:
+    x1, y1 = max(a["xmin"], b["xmin"]), max(a["ymin"], b["ymin"])
+    x2, y2 = min(a["xmax"], b["xmax"]), min(a["ymax"], b["ymax"])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a["xmax"] - a["xmin"]) * (a["ymax"] - a["ymin"]) + (b["xmax"] - b["xmin"]) * (b["ymax"] - b["ymin"]) - inter
+    return inter / union if union > 0 else 0.0
+
+def matches(predictions: list, reference: list) -> int:
+    """how many of predictions line up with a not yet used reference box of the same label"""
+    used = set()
+    found = 0
+    for prediction in predictions:
+        for i, ref in enumerate(reference):
+            if i not in used and ref["label"] == prediction["label"] and iou(ref["box"], prediction["box"]) >= IOU_MATCH:
+                used.add(i)
+                found += 1
+                break
+    return found
+
+def run(backend, images: list) -> tuple[list, float]:
+    backend(images[0])
+    predictions = []
+    times = []
+    for image in images:
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            result = backend(image)
+            times.append(time.perf_counter() - start)
+        predictions.append(result)
+    return predictions, statistics.median(times)
+
+def main():
+    names = sys.argv[1:] or list(BACKENDS)
+    if "pipeline" not in names:
+        names.insert(0, "pipeline")
+    images = [Image.open(path).convert("RGB") for path in sorted(PHOTOS_DIR.glob("*.jpg"))]
+    
+    results = {}
+    for name in names:
+        try:
+            start = time.perf_counter()
+            backend = create_backend(name, simple_detection.DETECTION_MODEL_ID)
+            load_seconds = time.perf_counter() - start
+            predictions, median_seconds = run(backend, images)
+            results[name] = (load_seconds, median_seconds, predictions)
+        except Exception as e:
+            print(f"{name}: failed -> {type(e).__name__}: {e}")
+    
+    reference = results["pipeline"][2]
+    print(f"{len(images)} photos, {ROUNDS} rounds each")
+    print(f"{'backend':<10} {'load s':>7} {'median ms':>10} {'boxes':>6} {'recall':>7} {'precision':>10}")
+    for name, (load_seconds, median_seconds, predictions) in results.items():
+        found = sum(matches(p, r) for p, r in zip(predictions, reference))
+        boxes = sum(len(p) for p in predictions)
+        reference_boxes = sum(len(r) for r in reference)
+        recall = found / reference_boxes if reference_boxes else 1.0
+        precision = found / boxes if boxes else 1.0
+        print(f"{name:<10} {load_seconds:>7.1f} {median_seconds * 1000:>10.1f} {boxes:>6} {recall:>7.2f} {precision:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#
+# many threads adding messages to one conversation at the same time
+# checks every msg_ordered_number from 1 to the total shows up exactly once and reports inserts per second
+#
+# run from the backend directory -> [ python benchmarks/load_conversation_messages.py ]
+# exits with 1 when a sequence number is duplicated or missing
+#
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db_setup import create_db
+import services.database as database_module
+from services.database import database, connection_pool
+
+WRITERS = 16
+MSGS_PER_WRITER = 200
+BULK_SIZE = 5
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = Path(temp_dir) / "load_test.db"
+        conn = sqlite3.connect(str(db_path))
+        conn.executescript((create_db.file_root_path / "tables.sql").read_text())
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.close()
+        create_db.run_migrations(db_path)
+        
+        conn = sqlite3.connect(str(db_path))
+        conn.execute("INSERT INTO users (email, pswd, firstname, lastname, user_type) VALUES ('i@x', 'p', 'I', 'I', 'impaired')")
+        conn.execute("INSERT INTO users (email, pswd, firstname, lastname, user_type) VALUES ('c@x', 'p', 'C', 'C', 'caretaker')")
+        ccc_id = conn.execute("INSERT INTO current_caretaker_conversation (caretaker_user_id, impaired_user_id) VALUES (2, 1)").lastrowid
+        conn.commit()
+        conn.close()
+        
+        database_module.pool = connection_pool(db_path, WRITERS)
+        
+        errors = []
+        def writer(index: int):
+            user_type = "impaired" if index % 2 == 0 else "caretaker"
+            try:
+                # half the writers add one message at a time, the other half in bulk
+                if index % 4 < 2:
+                    for n in range(MSGS_PER_WRITER):
+                        database.add_conversation_msg(ccc_id, user_type, f"{index}-{n}")
+                else:
+                    for n in range(0, MSGS_PER_WRITER, BULK_SIZE):
+                        database.add_conversation_msgs(ccc_id, [(user_type, f"{index}-{n + i}") for i in range(BULK_SIZE)])
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(WRITERS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        database_module.pool.close_all()
+        
+        conn = sqlite3.connect(str(db_path))
+        numbers = [row[0] for row in conn.execute("SELECT msg_ordered_number FROM current_caretaker_conversation_messages WHERE ccc_id = ?", (ccc_id,))]
+        last = conn.execute("SELECT last_msg_ordered_number FROM current_caretaker_conversation WHERE id = ?", (ccc_id,)).fetchone()[0]
+        conn.close()
+    
+    total = WRITERS * MSGS_PER_WRITER
+    duplicates = len(numbers) - len(set(numbers))
+    missing = len(set(range(1, total + 1)) - set(numbers))
+    print(f"{WRITERS} writers, {len(numbers)}/{total} messages in {elapsed:.2f}s -> {len(numbers) / elapsed:.0f} inserts/s")
+    print(f"duplicates: {duplicates}  missing: {missing}  counter: {last}  errors: {len(errors)}")
+    for e in errors[:5]:
+        print(f"  {type(e).__name__}: {e}")
+    
+    return 1 if duplicates or missing or errors or last != total else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,48 @@
 # NOTE: If you need to reset the db just delete the db file in data and run the app.py again
+# NOTE: Schema changes for databases that already exist go in db_setup/migrations as the next numbered .sql file
 
 from pathlib import Path
 import sqlite3
+import logging
 file_root_path = Path(__file__).parent
+migrations_path = file_root_path / "migrations"
+
+logger = logging.getLogger(__name__)
+
+#
+# migrations are the numbered sql files in db_setup/migrations (001_name.sql, 002_name.sql, ...)
+# the number of the last one applied is kept in the dbs user_version so each only runs once
+#
+# returns the version the database is at after running
+#
+def run_migrations (db_path: Path) -> int:
+    conn = sqlite3.connect(str(db_path))
+    current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    
+    for migration_path in sorted(migrations_path.glob("*.sql")):
+        version = int(migration_path.name.split("_", 1)[0])
+        if (version <= current_version):
+            continue
+        
+        # the whole migration and the version bump happen in one transaction
+        try:
+            conn.executescript(f"""
+                BEGIN;
+                {migration_path.read_text()}
+                PRAGMA user_version = {version};
+                COMMIT;
+            """)
+        except sqlite3.Error:
+            if (conn.in_transaction):
+                conn.rollback()
+            conn.close()
+            raise
+        
+        logger.info("applied db migration %s", migration_path.name)
+        current_version = version
+    
+    conn.close()
+    return current_version
 
 def setup_theia_db ():
     db_path = file_root_path.parent / "data" / "theia_db.db"
@@ -37,4 +77,12 @@ def setup_theia_db ():
         #"""
 
         conn.commit()
-        conn.close()
\ No newline at end of file
+        conn.close()
+    
+    # brings new and existing databases up to the latest schema
+    run_migrations(db_path)
+    
+    # WAL lets readers keep going while a write is happening, it stays set in the db file
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
\ No newline at end of file
@@ -0,0 +1,19 @@
+-- indexes for the columns user_routes filters on so those lookups stop scanning the whole table
+
+CREATE INDEX IF NOT EXISTS idx_caretaker_info_caretaker_user_id
+    ON caretaker_info (caretaker_user_id);
+
+CREATE INDEX IF NOT EXISTS idx_emergency_contact_impaired_user_id
+    ON emergency_contact (impaired_user_id);
+
+CREATE INDEX IF NOT EXISTS idx_past_trips_impaired_user_id
+    ON past_trips (impaired_user_id);
+
+CREATE INDEX IF NOT EXISTS idx_activity_impaired_user_id_notice_date
+    ON activity (impaired_user_id, notice_date);
+
+CREATE INDEX IF NOT EXISTS idx_current_caretaker_conversation_caretaker_user_id
+    ON current_caretaker_conversation (caretaker_user_id);
+
+CREATE INDEX IF NOT EXISTS idx_ccc_messages_ccc_id_msg_ordered_number
+    ON current_caretaker_conversation_messages (ccc_id, msg_ordered_number);
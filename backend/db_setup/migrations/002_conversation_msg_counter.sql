@@ -0,0 +1,11 @@
+-- per conversation counter for msg_ordered_number so adding a message doesn't need a MAX() over its messages
+
+ALTER TABLE current_caretaker_conversation
+    ADD COLUMN last_msg_ordered_number INTEGER NOT NULL DEFAULT 0;
+
+UPDATE current_caretaker_conversation
+SET last_msg_ordered_number = (
+    SELECT COALESCE(MAX(msg_ordered_number), 0)
+    FROM current_caretaker_conversation_messages
+    WHERE ccc_id = current_caretaker_conversation.id
+);
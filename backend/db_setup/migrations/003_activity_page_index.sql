@@ -0,0 +1,7 @@
+-- activity is paged by id (like past_trips), nothing filters or orders it by notice_date, so the
+-- (impaired_user_id, notice_date) index made every page sort its rows, (impaired_user_id) keeps them in id order
+
+DROP INDEX IF EXISTS idx_activity_impaired_user_id_notice_date;
+
+CREATE INDEX IF NOT EXISTS idx_activity_impaired_user_id
+    ON activity (impaired_user_id);
@@ -1,6 +1,10 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request, session, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
 from routes.auth_routes import auth_bp
 from routes.user_routes import user_bp
+import hashlib
+import hmac
+import io
 import os
 import sys
 import time
@@ -9,14 +13,31 @@ from pathlib import Path
 # Add services directory to Python path
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'services'))
 
+# simple_detection only loads its heavy dependencies (transformers, torch) when first used
 try:
-    import simple_camera
     import simple_detection
 except ImportError as e:
-    print(f"Warning: Could not import camera modules: {e}")
-    simple_camera = None
+    print(f"Warning: Could not import detection module: {e}")
     simple_detection = None
 
+def get_simple_camera():
+    """Imports the camera module (and OpenCV with it) the first time a camera capture is asked for"""
+    try:
+        import simple_camera
+        return simple_camera
+    except ImportError as e:
+        print(f"Warning: Could not import camera module: {e}")
+        return None
+
+from detection_executor import executor, queue_full, job_timeout
+from frame_cache import frame_cache, frame_signature
+from stream_tracker import streams
+from hazards import hazards
+from regions import REGIONS
+from tts_service import tts, tts_unavailable, tts_busy, TTS_MAX_TEXT_LENGTH
+from renderer import RESULT_IMAGE_FORMAT, RESULT_IMAGE_FORMATS, RESULT_IMAGE_QUALITY
+from PIL import Image
+
 api_bp = Blueprint(
     'api',           
     __name__,        
@@ -30,9 +51,116 @@ api_bp.register_blueprint(user_bp)
 def get_data():
     return jsonify({"data": ["Item 1", "Item 2", "Item 3"]})
 
+@api_bp.route('/health/ready')
+def health_ready():
+    """Ready once the detection model is loaded and warmed up, 503 until then"""
+    if not simple_detection:
+        model = {"state": "unavailable", "error": "Detection module not available"}
+    else:
+        model = simple_detection.model_status()
+    
+    ready = model["state"] == "ready"
+    return jsonify({
+        "ready": ready,
+        "model": model,
+        "detection": executor.stats(),
+        "frame_cache": frame_cache.stats(),
+        "streams": streams.stats(),
+        "hazards": hazards.stats(),
+        "tts": tts.stats()
+    }), 200 if ready else 503
+
+def detection_session_key():
+    """Who a stream of auto-detect frames comes from, the session_id the client sent, the logged in user or else its address"""
+    return request.form.get("session_id") or session.get("user_id") or request.remote_addr
+
+def detect_with_frame_cache(photo_bytes: bytes, session_key, region: str):
+    """Runs on a detection worker so decoding the frame for its signature waits its turn like detection does,
+    a frame that hardly changed from the last one this session ran through the model reuses its detection
+    returns (description, predictions, cached)"""
+    signature = frame_signature(Image.open(io.BytesIO(photo_bytes)))
+    # detections of other regions of the same frame aren't reused
+    cache_tier = "fast" if region == "full" else f"fast/{region}"
+    cached = frame_cache.lookup(session_key, signature, cache_tier)
+    if cached is not None:
+        description, predictions = cached
+        return description, predictions, True
+    # detection only (no saving) with the fast model
+    description, predictions = simple_detection.detect_only_from_bytes(photo_bytes, "fast", region)
+    frame_cache.store(session_key, signature, (description, predictions), cache_tier)
+    return description, predictions, False
+
+def detect_stream_keyframe(photo_bytes: bytes):
+    """The predictions of a streams keyframe and the size of the decoded image their boxes are in"""
+    image = simple_detection.decode_for_region(photo_bytes, "fast")
+    return simple_detection.predict(image, "fast"), image.size
+
+def detection_region():
+    """The region=full|roi|tiles a detection asks for (see services/regions.py), None when it isn't one of them"""
+    region = request.values.get("region", "full")
+    return region if region in REGIONS else None
+
+def unknown_region_response():
+    return jsonify({
+        "success": False,
+        "error": f"Unknown region, expected one of {', '.join(REGIONS)}"
+    }), 400
+
+def audio_requested(speak: bool = True) -> bool:
+    """Whether the client plays the audio itself, when the server doesn't speak it or audio=true was asked for"""
+    return not speak or request.values.get("audio") == "true"
+
+def audio_signature(text: str) -> str:
+    """Signs a text the server itself decided to say, /camera/audio only speaks signed texts"""
+    return hmac.new(current_app.secret_key.encode(), text.encode(), hashlib.sha256).hexdigest()[:32]
+
+def audio_url(text: str) -> str:
+    return url_for("api.camera_audio", text=text, sig=audio_signature(text))
+
+def detection_busy_response(e: queue_full):
+    response = jsonify({
+        "success": False,
+        "error": "Detection is busy, try again later",
+        "retry_after": e.retry_after
+    })
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 503
+
+def detection_timeout_response():
+    return jsonify({
+        "success": False,
+        "error": "Detection timed out"
+    }), 504
+
+def photo_too_large_response():
+    return jsonify({
+        "success": False,
+        "error": "Photo is too large"
+    }), 413
+
+@api_bp.route('/camera/input-size')
+def camera_input_size():
+    """Size photos are resized to before detection, a photo downscaled to the shortest_edge before uploading loses nothing"""
+    if not simple_detection:
+        return jsonify({"error": "Detection module not available"}), 500
+    try:
+        return jsonify({
+            "success": True,
+            "tiers": simple_detection.input_sizes(),
+            "endpoints": {"auto-detect": "fast", "streams": "fast", "process-photo": "accurate", "jobs": "accurate"},
+            "regions": list(REGIONS),
+            "max_upload_bytes": current_app.config["MAX_CONTENT_LENGTH"]
+        })
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Reading the input size failed: {str(e)}"
+        }), 500
+
 @api_bp.route('/camera/detect', methods=['POST'])
 def camera_detection():
     try:
+        simple_camera = get_simple_camera()
         if not simple_camera or not simple_detection:
             return jsonify({"error": "Camera modules not available"}), 500
             
@@ -69,8 +197,14 @@ def camera_detection():
             "error": f"Camera detection failed: {str(e)}"
         }), 500
 
+def hazard_fields(found: list[dict]) -> list[dict]:
+    return [{"label": hazard["label"], "score": hazard["score"], "priority": hazards.priority(hazard["label"])} for hazard in found]
+
 @api_bp.route('/camera/process-photo', methods=['POST'])
 def process_uploaded_photo():
+    """Detects and describes an uploaded photo, hazards are warned about first, ?mode=hazards answers with only them"""
+    # the time to the first hazard warning is measured from here
+    received_at = time.perf_counter()
     try:
         if 'photo' not in request.files:
             return jsonify({"error": "No photo uploaded"}), 400
@@ -90,42 +224,93 @@ def process_uploaded_photo():
         # photo_file.save(str(photo_path))
         # photo_file.save(str(latest_path))
         
-        # Create a temporary file-like object for processing without saving
-        import io
-        from PIL import Image
+        # Read the photo into memory for processing without saving
         photo_bytes = photo_file.read()
         photo_file.seek(0)  # Reset file pointer for potential reuse
         
-        # Load detection model if not already loaded
         if not simple_detection:
             return jsonify({"error": "Detection module not available"}), 500
-            
-        simple_detection.load_model()
+        
+        region = detection_region()
+        if region is None:
+            return unknown_region_response()
         
         # Process the photo for detection without saving - using in-memory processing
         # result_img, description, result_path = simple_detection.detect_and_save(photo_path)
         
-        # Use detect_only for in-memory processing
-        image = Image.open(io.BytesIO(photo_bytes))
-        description, predictions = simple_detection.detect_only_from_image(image)
+        # Detect on a detection worker with the accurate model (loads the model if not already loaded),
+        # hazards are spoken on the server as soon as the predictions are back unless the client plays the audio
+        speak = request.form.get("speak", "true") != "false"
+        warning, found, predictions, size = executor.run(simple_detection.detect_hazards_from_bytes, photo_bytes, "accurate", speak, received_at, region)
         
-        # Play audio narration
-        simple_detection.play_audio(description)
+        if request.values.get("mode") == "hazards":
+            response = {"success": True, "warning": warning, "hazards": hazard_fields(found)}
+            if warning and audio_requested(speak):
+                tts.prefetch(warning)
+                response["audio_url"] = audio_url(warning)
+            return jsonify(response)
         
-        return jsonify({
+        description = simple_detection.summarize_predictions_natural_language(predictions, size)
+        
+        # Play audio narration on the server (queued after the warning, the response doesn't wait for it) unless the client plays it
+        if speak:
+            simple_detection.play_audio(description)
+        
+        response = {
             "success": True,
             "description": description,
+            "warning": warning,
+            "hazards": hazard_fields(found),
             # "photo_path": str(photo_path),  # Temporarily commented out
             # "result_path": str(result_path)  # Temporarily commented out
             "note": "Photo saving temporarily disabled"
-        })
+        }
+        # Synthesize the narration in the background only for a client that fetches it from audio_url
+        if audio_requested(speak):
+            tts.prefetch(description)
+            response["audio_url"] = audio_url(description)
+        return jsonify(response)
             
+    except queue_full as e:
+        return detection_busy_response(e)
+    except RequestEntityTooLarge:
+        return photo_too_large_response()
+    except job_timeout:
+        return detection_timeout_response()
     except Exception as e:
         return jsonify({
             "success": False,
             "error": f"Photo processing failed: {str(e)}"
         }), 500
 
+@api_bp.route('/camera/audio')
+def camera_audio():
+    """?text=&sig= spoken as a wav file, so the client can play a description instead of the server speaking it
+    only texts from an audio_url the server gave out are spoken, anyone else can't drive the speech engine with their own"""
+    text = request.args.get("text", "")
+    if not text:
+        return jsonify({"error": "No text given"}), 400
+    if not hmac.compare_digest(request.args.get("sig", ""), audio_signature(text)):
+        return jsonify({"error": "Only audio_url links given out by the server can be spoken"}), 403
+    if len(text) > TTS_MAX_TEXT_LENGTH:
+        return jsonify({"error": f"Text is longer than {TTS_MAX_TEXT_LENGTH} characters"}), 400
+    
+    try:
+        audio = tts.synthesize(text)
+    except tts_busy as e:
+        response = jsonify({"success": False, "error": str(e), "retry_after": 1})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+    except tts_unavailable as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except TimeoutError:
+        return jsonify({"success": False, "error": "Speech timed out"}), 504
+    
+    response = Response(audio, mimetype="audio/wav")
+    # the same text always sounds the same
+    response.headers["Cache-Control"] = "public, max-age=86400"
+    return response
+
 @api_bp.route('/camera/auto-detect', methods=['POST'])
 def auto_detect():
     """Auto-detection endpoint that doesn't save images"""
@@ -137,33 +322,201 @@ def auto_detect():
         if photo_file.filename == '':
             return jsonify({"error": "No photo selected"}), 400
             
-        # Save temporary photo for processing only (no permanent storage)
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            photo_file.save(temp_file.name)
-            temp_path = temp_file.name
-        
-        # Load detection model if not already loaded
         if not simple_detection:
             return jsonify({"error": "Detection module not available"}), 500
-            
-        simple_detection.load_model()
         
-        # Process the photo for detection only (no saving)
-        description, predictions = simple_detection.detect_only(temp_path)
+        region = detection_region()
+        if region is None:
+            return unknown_region_response()
+        
+        # The photo is decoded straight from the uploaded bytes, nothing is written to disk
+        photo_bytes = photo_file.read()
         
-        # Clean up temporary file
-        import os
-        os.unlink(temp_path)
+        # The frame cache check and the detection both run on a detection worker, a full queue turns the photo away before it is decoded
+        description, predictions, cached = executor.run(detect_with_frame_cache, photo_bytes, detection_session_key(), region)
         
         return jsonify({
             "success": True,
             "description": description,
-            "objects": [pred['label'] for pred in predictions]
+            "objects": [pred['label'] for pred in predictions],
+            "cached": cached
         })
             
+    except queue_full as e:
+        return detection_busy_response(e)
+    except RequestEntityTooLarge:
+        return photo_too_large_response()
+    except job_timeout:
+        return detection_timeout_response()
     except Exception as e:
         return jsonify({
             "success": False,
             "error": f"Auto-detection failed: {str(e)}"
-        }), 500
\ No newline at end of file
+        }), 500
+
+@api_bp.route('/camera/streams', methods=['POST'])
+def open_detection_stream():
+    """Starts a stream of camera frames that only reports what changed, frames are posted to the returned frames_url"""
+    if not simple_detection:
+        return jsonify({"error": "Detection module not available"}), 500
+    
+    stream = streams.create()
+    response = jsonify({
+        "success": True,
+        "stream_id": stream.id,
+        "keyframe_interval": stream.keyframe_interval,
+        "frames_url": url_for("api.stream_frames", stream_id=stream.id)
+    })
+    response.headers["Location"] = url_for("api.stream_frames", stream_id=stream.id)
+    return response, 201
+
+@api_bp.route('/camera/streams/<stream_id>/frames', methods=['POST'])
+def stream_frames(stream_id):
+    """One or more frames of a stream (each a photo field, oldest first), answers with the objects that appeared or went away"""
+    stream = streams.get(stream_id)
+    if stream is None:
+        return jsonify({"success": False, "error": "Stream not found"}), 404
+    
+    try:
+        photo_files = [photo_file for photo_file in request.files.getlist('photo') if photo_file.filename != '']
+        if not photo_files:
+            return jsonify({"error": "No photo uploaded"}), 400
+        
+        frames = []
+        changes = []
+        # frames of one stream are tracked in order, a second request for it waits for this one
+        with stream.lock:
+            for photo_file in photo_files:
+                photo_bytes = photo_file.read()
+                # decoding and tracking the frame run on a detection worker, only keyframes are run through the model (fast tier)
+                keyframe, frame_changes = executor.run(stream.track_frame, photo_bytes, detect_stream_keyframe)
+                
+                frames.append({"frame": stream.frames, "keyframe": keyframe, "changes": frame_changes})
+                changes.extend(frame_changes)
+            objects = stream.objects()
+        
+        description = ", ".join(change["text"] for change in changes)
+        response = {
+            "success": True,
+            "stream_id": stream.id,
+            "frames": frames,
+            "description": description,
+            "objects": objects
+        }
+        if description and audio_requested():
+            tts.prefetch(description)
+            response["audio_url"] = audio_url(description)
+        return jsonify(response)
+    
+    except queue_full as e:
+        return detection_busy_response(e)
+    except RequestEntityTooLarge:
+        return photo_too_large_response()
+    except job_timeout:
+        return detection_timeout_response()
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Stream detection failed: {str(e)}"
+        }), 500
+
+@api_bp.route('/camera/streams/<stream_id>', methods=['DELETE'])
+def close_detection_stream(stream_id):
+    if not streams.close(stream_id):
+        return jsonify({"success": False, "error": "Stream not found"}), 404
+    return jsonify({"success": True, "stream_id": stream_id})
+
+@api_bp.route('/camera/jobs', methods=['POST'])
+def submit_detection_job():
+    """Queues a photo for detection and returns a job id to poll for the result"""
+    try:
+        if 'photo' not in request.files:
+            return jsonify({"error": "No photo uploaded"}), 400
+            
+        photo_file = request.files['photo']
+        if photo_file.filename == '':
+            return jsonify({"error": "No photo selected"}), 400
+        
+        if not simple_detection:
+            return jsonify({"error": "Detection module not available"}), 500
+        
+        region = detection_region()
+        if region is None:
+            return unknown_region_response()
+        
+        # the result image is kept undrawn with the job until /image asks for it
+        job = executor.submit(simple_detection.detect_result_from_bytes, photo_file.read(), None, region)
+        
+        response = jsonify({
+            "success": True,
+            "job_id": job.id,
+            "status": job.status
+        })
+        response.headers["Location"] = url_for("api.get_detection_job", job_id=job.id)
+        return response, 202
+    
+    except queue_full as e:
+        return detection_busy_response(e)
+    except RequestEntityTooLarge:
+        return photo_too_large_response()
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Submitting detection failed: {str(e)}"
+        }), 500
+
+@api_bp.route('/camera/jobs/<job_id>', methods=['GET'])
+def get_detection_job(job_id):
+    """Status of a detection job, ?wait=<seconds> holds the request until it finishes or the wait runs out"""
+    job = executor.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Detection job not found"}), 404
+    
+    wait = min(request.args.get("wait", 0, type=float), executor.job_timeout)
+    try:
+        if wait > 0:
+            job.result(wait)
+    except Exception:
+        pass
+    
+    status = job.status
+    if status == "done":
+        description, predictions, result = job.future.result()
+        return jsonify({
+            "success": True,
+            "job_id": job.id,
+            "status": status,
+            "description": description,
+            "objects": [pred['label'] for pred in predictions],
+            "image_url": url_for("api.get_detection_job_image", job_id=job.id)
+        })
+    elif status in ("failed", "timed_out"):
+        return jsonify({
+            "success": False,
+            "job_id": job.id,
+            "status": status,
+            "error": "Detection timed out" if status == "timed_out" else f"Detection failed: {str(job.future.exception())}"
+        })
+    
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "status": status
+    }), 202
+
+@api_bp.route('/camera/jobs/<job_id>/image', methods=['GET'])
+def get_detection_job_image(job_id):
+    """The photo of a finished job with its detections drawn on, ?format=jpeg|webp|png&quality=1-100"""
+    job = executor.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Detection job not found"}), 404
+    if job.status != "done":
+        return jsonify({"success": False, "job_id": job.id, "status": job.status, "error": "Detection job has no result"}), 409
+    
+    format = request.args.get("format", RESULT_IMAGE_FORMAT)
+    if format not in RESULT_IMAGE_FORMATS:
+        return jsonify({"error": f"Unknown image format {format}, expected one of {', '.join(RESULT_IMAGE_FORMATS)}"}), 400
+    quality = min(max(request.args.get("quality", RESULT_IMAGE_QUALITY, type=int), 1), 100)
+    
+    description, predictions, result = job.future.result()
+    return Response(result.encode(format, quality), mimetype=RESULT_IMAGE_FORMATS[format][1])
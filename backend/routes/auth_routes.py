@@ -1,6 +1,5 @@
 from flask import Blueprint, request, session, g
 from services.database import database
-import json
 
 auth_bp = Blueprint(
     'auth',           
@@ -18,11 +17,11 @@ def after_request(response):
 def login():
     data_json = request.get_json();
     
-    row_data = database.get_user_id_if_exists(data_json['email'], data_json['password'])
-    if ( row_data is None):
+    user_id = database.find_user_id(data_json['email'], data_json['password'])
+    if ( user_id is None):
         return { "error": { "message": "credentials were incorrect" } }
     
-    session["user_id"] = json.loads(row_data)["id"]
+    session["user_id"] = user_id
     return { "success": { "message": "successfully logged in" } }
 
 @auth_bp.post("/logout")
@@ -1,5 +1,8 @@
-from flask import Blueprint, request, session
-from services.database import database
+from flask import Blueprint, Response, request, session, stream_with_context
+from services.database import database, CURRENT_TIMESTAMP
+from services.principal import current_principal, invalidate_principals
+from services.pubsub import broker
+from services.trip_status import feed as trip_status_feed
 from functools import wraps
 import json
 
@@ -12,13 +15,13 @@ user_bp = Blueprint(
 def check_if_user_has_caretaker_impaired_pair(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        user_type = (json.loads(database.get_user_data(session.get("user_id"))))["user_type"]
+        user = current_principal()
         
-        if (user_type == 'impaired'):
-            if( database.get_user_id_of_caretaker_if_session_user_is_their_impaired(session.get("user_id")) is None):
+        if (user.user_type == 'impaired'):
+            if( user.caretaker_user_id is None):
                 return { "error": { "message": "user currently does not have an assigned caretaker please assign one before using this feature" } }
-        elif (user_type == 'caretaker'):
-            if( database.get_user_id_of_impaired_if_session_user_is_their_caretaker(session.get("user_id")) is None):
+        elif (user.user_type == 'caretaker'):
+            if( user.impaired_user_id is None):
                 return { "error": { "message": "user currently does not have an assigned impaired user please assign one before using this feature" } }
         
         return f(*args, **kwargs)
@@ -27,8 +30,7 @@ def check_if_user_has_caretaker_impaired_pair(f):
 def allow_access_if_caretaker(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        user_type = (json.loads(database.get_user_data(session.get("user_id"))))["user_type"]
-        if (user_type != 'caretaker'):
+        if (current_principal().user_type != 'caretaker'):
             return { "error": { "message": "user must be a caretaker user to access this information" } }        
         return f(*args, **kwargs)
     return wrapper
@@ -36,23 +38,69 @@ def allow_access_if_caretaker(f):
 def allow_access_if_impaired(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        user_type = (json.loads(database.get_user_data(session.get("user_id"))))["user_type"]
-        if (user_type != 'impaired'):
+        if (current_principal().user_type != 'impaired'):
             return { "error": { "message": "user must be a impaired user to access this information" } }        
         return f(*args, **kwargs)
     return wrapper
 
+#
+# id of the sessions current caretaker conversation or None if it hasn't been created
+#
+def get_current_conversation_id() -> int|None:
+    user = current_principal()
+    
+    convo_data = None
+    if (user.user_type == 'impaired'):
+        convo_data = database.get_rows_by_key_and_table([("impaired_user_id", user.user_id)], "current_caretaker_conversation", ["id"], True)
+    elif (user.user_type == 'caretaker'):
+        convo_data = database.get_rows_by_key_and_table([("caretaker_user_id", user.user_id)], "current_caretaker_conversation", ["id"], True)
+    
+    return None if convo_data is None else convo_data["id"]
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+#
+# responds with the rows of a list endpoint, paged and/or streamed when the query args ask for it
+#
+#   ?after_id=<order_key of the last row seen>&limit=<n> -> { "items": [...], "next_after_id": n|null }
+#   ?format=ndjson -> one json row per line streamed from the cursor (after_id and limit still apply)
+#   no args -> the whole list like before
+#
+def list_rows_response(where: list[tuple[str,any]], tablename: str, columns: list[str], order_key: str, empty_message: str):
+    after_id = request.args.get("after_id", type=int)
+    limit = request.args.get("limit", type=int)
+    if (limit is not None):
+        limit = max(1, min(limit, MAX_PAGE_LIMIT))
+    
+    if (request.args.get("format") == "ndjson"):
+        rows = database.iter_rows_page_by_key_and_table(where, tablename, columns, order_key, after_id, limit)
+        return Response(stream_with_context(json.dumps(row) + "\n" for row in rows), mimetype="application/x-ndjson")
+    
+    if (after_id is None and limit is None):
+        data = database.get_rows_by_key_and_table(where, tablename, columns, False)
+        if(data is None):
+            return { "error": { "message": empty_message}}
+        return data
+    
+    if (limit is None):
+        limit = DEFAULT_PAGE_LIMIT
+    items = database.get_rows_page_by_key_and_table(where, tablename, columns, order_key, after_id, limit)
+    next_after_id = items[-1][order_key] if len(items) == limit else None
+    return { "items": items, "next_after_id": next_after_id }
+
 # gets the users status by the id in the path only if they are that user or they are that users caretaker
 @user_bp.get("<int:user_id>/status")
 def get_user_status_by_id(user_id):
-    if(session.get("user_id") is not None):
-        if ( database.get_user_data(session.get("user_id"))["user_type"] == "caretaker" ):
-            return { "error": { "message": "caretaker does not have a status since they dont go on trips" } },
-        elif (session.get("user_id") == user_id  or database.get_user_id_of_impaired_if_session_user_is_their_caretaker(session.get("user_id")) == user_id ):
+    user = current_principal()
+    if(user is not None):
+        if ( user.user_type == "caretaker" and user.impaired_user_id != user_id ):
+            return { "error": { "message": "caretaker does not have a status since they dont go on trips" } }
+        elif (user.impaired_user_id == user_id):
             if (database.is_impaired_user_on_trip(user_id)):
-                return { "status": { "active" } }
+                return { "status": "active"   }
             else:
-                return { "status": { "inactive" } }
+                return { "status": "inactive" }
         
     return { "error": { "message": "cannot access status of user if they exist" } }
 
@@ -74,7 +122,7 @@ def authorize():
 @user_bp.get("/")
 def get_data():
     id = session.get("user_id")
-    return database.get_user_data(id)
+    return database.get_user(id)
 
 # updates the current sessions user data -> (Checked In Insomnia)
 @user_bp.put("/")
@@ -95,6 +143,7 @@ def update_data():
             
     id = session.get("user_id")
     database.update_data_by_id_and_table(("id", id), 'users', dataList)
+    invalidate_principals(id)
     return { "success": { "message": "updated user account" } }
 
 # gets the current sessions users status only if they are a impaired user -> (Checked In Insomnia)
@@ -111,9 +160,7 @@ def get_user_status():
 @check_if_user_has_caretaker_impaired_pair
 @allow_access_if_impaired
 def get_caretaker_data():
-    data = database.get_data_by_key_and_table([("impaired_user_id", session["user_id"])], "caretaker_info", ["caretaker_user_id"], True)
-    caretaker_user_id = (json.loads(data))["caretaker_user_id"]
-    return database.get_user_data(caretaker_user_id)
+    return database.get_user(current_principal().caretaker_user_id)
     
 # adds or updates a caretaker on a  impaired user  -> (Checked In Insomnia)
 @user_bp.put("/caretaker")
@@ -124,20 +171,22 @@ def update_caretaker_data():
     if("email" not in data or "password" not in data):
         return { "error": { "message": "error adding caretaker to account"}}
     
-    caretaker_user_id = (json.loads(database.get_user_id_if_exists(data["email"], data["password"])))["id"]
+    caretaker_user_id = database.find_user_id(data["email"], data["password"])
     if (caretaker_user_id is None):
         return { "error": { "message": "error adding caretaker to account"}}
     
-    caretaker_data = json.loads(database.get_user_data(caretaker_user_id))
+    caretaker_data = database.get_user(caretaker_user_id)
     if (caretaker_data is None or caretaker_data["user_type"] != "caretaker"):
         return { "error": { "message": "error adding caretaker to account"}}
     
-    if (database.get_user_id_of_caretaker_if_session_user_is_their_impaired(user_id) is None) :
+    old_caretaker_user_id = current_principal().caretaker_user_id
+    if (old_caretaker_user_id is None) :
         database.add_data_by_table("caretaker_info", [("impaired_user_id", user_id), ("caretaker_user_id", caretaker_user_id)])
     else:
-        print("HerE")
         database.update_data_by_id_and_table(("impaired_user_id", user_id), "caretaker_info", [("caretaker_user_id", caretaker_user_id)])
     
+    invalidate_principals(user_id, old_caretaker_user_id, caretaker_user_id)
+    
     return { "success": { "message": "successfully added new caretaker" } }
     
 # adds or updates a caretaker on a  impaired user -> (Checked In Insomnia)
@@ -146,7 +195,9 @@ def update_caretaker_data():
 @allow_access_if_impaired
 def delete_caretaker_data():
     user_id = session.get("user_id")
+    caretaker_user_id = current_principal().caretaker_user_id
     database.delete_data_by_where_and_table([("impaired_user_id", user_id)],"caretaker_info")
+    invalidate_principals(user_id, caretaker_user_id)
     return { "success": { "message": "successfully deleted caretaker" } }
 
 # gets a caretakers impaired user if they are a caretaker otherwise error if not caretaker or no set impaired user
@@ -154,16 +205,14 @@ def delete_caretaker_data():
 @check_if_user_has_caretaker_impaired_pair
 @allow_access_if_caretaker
 def get_impaired_data():
-    data = database.get_data_by_key_and_table([("caretaker_user_id", session["user_id"])], "caretaker_info", ["impaired_user_id"], True)
-    impaired_user_id = (json.loads(data))["impaired_user_id"]
-    return database.get_user_data(impaired_user_id)
+    return database.get_user(current_principal().impaired_user_id)
 
 # get all of the emergency contacts -> (Checked In Insomnia)
 @user_bp.get("/emergency_contact")
 @allow_access_if_impaired
 def get_emergency_contacts():
     user_id = session.get("user_id")
-    data = database.get_data_by_key_and_table([("impaired_user_id", user_id)], "emergency_contact", ["id", "contact_name", "contact_tel"], False)
+    data = database.get_rows_by_key_and_table([("impaired_user_id", user_id)], "emergency_contact", ["id", "contact_name", "contact_tel"], False)
     if(data is None):
         return { "error": { "message": "user has no emergency contacts"}}
     return data
@@ -177,7 +226,7 @@ def add_a_emergency_contact():
         return { "error": { "message": "must contain a json with contact_name and contact_tel to add a emergency contact"}}
     
     user_id = session.get("user_id")
-    database.add_data_by_table("emergency_contact", [("impaired_user_id", user_id), ("contact_name", ("\'" + data["contact_name"] + "\'")), ("contact_tel", ("\'" + data["contact_tel"] + "\'"))])
+    database.add_data_by_table("emergency_contact", [("impaired_user_id", user_id), ("contact_name", data["contact_name"]), ("contact_tel", data["contact_tel"])])
     return { "success": { "message": "successfully added emergency contact" } }
 
 # deletes a emergency contact -> (Checked In Insomnia)
@@ -193,7 +242,7 @@ def delete_a_emergency_contact(ec_id: int):
 @allow_access_if_impaired
 def get_a_emergency_contact(ec_id: int):
     user_id = session.get("user_id")
-    data = database.get_data_by_key_and_table([("impaired_user_id", user_id), ("id", ec_id)], "emergency_contact", ["id", "contact_name", "contact_tel"], True)
+    data = database.get_rows_by_key_and_table([("impaired_user_id", user_id), ("id", ec_id)], "emergency_contact", ["id", "contact_name", "contact_tel"], True)
     if(data is None):
         return { "error": { "message": "emergency contact doesn't exist"}}
     return data
@@ -201,22 +250,43 @@ def get_a_emergency_contact(ec_id: int):
 # gets the current trip -> (Checked In Insomnia)
 @user_bp.get("/current_trip")
 def get_current_trip():
-    user_id = session.get("user_id")
-    user_type = (json.loads(database.get_user_data(user_id)))["user_type"]
-    
-    if (user_type == 'impaired'):
-        impaired_user_id = user_id
-    elif (user_type == 'caretaker'):
-        impaired_user_id = database.get_user_id_of_impaired_if_session_user_is_their_caretaker(user_id)
-        if (impaired_user_id is None):
-             return { "error": { "message": "caretaker does not have a impaired user to look at their current trip"}}
-    
+    impaired_user_id = current_principal().impaired_user_id
+    if (impaired_user_id is None):
+         return { "error": { "message": "caretaker does not have a impaired user to look at their current trip"}}
     
-    data = database.get_data_by_key_and_table([("impaired_user_id", impaired_user_id)], "current_trip", ["to_location", "from_location"], True)
+    data = database.get_rows_by_key_and_table([("impaired_user_id", impaired_user_id)], "current_trip", ["to_location", "from_location"], True)
     if(data is None):
         return { "error": { "message": "user is not on a trip"}}
     return data
 
+TRIP_STATUS_STREAM_HEARTBEAT_SECONDS = 15.0
+
+# streams the trip status of the impaired user (the caretakers impaired user or the user themself) as server sent events
+# the first event is the current snapshot then one event per trip started, removed or completed
+@user_bp.get("/current_trip/stream")
+def stream_current_trip_status():
+    impaired_user_id = current_principal().impaired_user_id
+    if (impaired_user_id is None):
+         return { "error": { "message": "caretaker does not have a impaired user to look at their current trip"}}
+    
+    snapshot = trip_status_feed.snapshot(impaired_user_id)
+    channel = trip_status_feed.channel(impaired_user_id)
+    
+    def events(snapshot: dict):
+        yield f"id: {snapshot['seq']}\nevent: trip_status\ndata: {json.dumps(snapshot)}\n\n"
+        seq = snapshot["seq"]
+        while True:
+            changes = channel.wait_for(seq, TRIP_STATUS_STREAM_HEARTBEAT_SECONDS)
+            if (changes == []):
+                yield ": keep-alive\n\n"
+                continue
+            # missed changes that fell out of the history only need the latest status
+            for change in (changes if changes is not None else [trip_status_feed.snapshot(impaired_user_id)]):
+                seq = change["seq"]
+                yield f"id: {seq}\nevent: trip_status\ndata: {json.dumps(change)}\n\n"
+    
+    return Response(events(snapshot), mimetype="text/event-stream", headers={ "Cache-Control": "no-cache", "X-Accel-Buffering": "no" })
+
 # add a current trip if one doesn't already exist otherwise error -> (Checked In Insomnia)
 @user_bp.route("/current_trip", methods=['OPTIONS'])
 def current_trip_options():
@@ -230,12 +300,13 @@ def add_a_current_trip():
         return { "error": { "message": "must contain a json with from_location and to_location to add a current trip"}}
     
     user_id = session.get("user_id")
-    trip_data = database.get_data_by_key_and_table([("impaired_user_id", user_id)],"current_trip",["impaired_user_id"],True)
+    trip_data = database.get_rows_by_key_and_table([("impaired_user_id", user_id)],"current_trip",["impaired_user_id"],True)
     
     if (trip_data is not None):
         return { "error": { "message": "the user is on a trip that is already in progress first complete the trip by removing it"}}
     
-    database.add_data_by_table("current_trip", [("impaired_user_id", user_id), ("to_location", ("\'" + data["to_location"] + "\'")), ("from_location", ("\'" + data["from_location"] + "\'"))])
+    database.add_data_by_table("current_trip", [("impaired_user_id", user_id), ("to_location", data["to_location"]), ("from_location", data["from_location"])])
+    trip_status_feed.emit(user_id, "trip_started", { "to_location": data["to_location"], "from_location": data["from_location"] })
     return { "success": { "message": "successfully added current trip" } }
 
 # deletes a current trip if one doesn't exist error -> (Checked In Insomnia)
@@ -243,26 +314,19 @@ def add_a_current_trip():
 @allow_access_if_impaired
 def delete_a_current_trip():
     user_id = session.get("user_id")
-    database.delete_data_by_where_and_table([("impaired_user_id", user_id)], "current_trip")
+    if (database.delete_data_by_where_and_table([("impaired_user_id", user_id)], "current_trip")):
+        trip_status_feed.emit(user_id, "trip_removed", None)
     return { "success": { "message": "successfully deleted current trip" } }
 
 # get all past trips -> (Checked In Insomnia)
+# pages with ?after_id=&limit= and streams with ?format=ndjson
 @user_bp.get("/past_trip")
 def get_past_trips():
-    user_id = session.get("user_id")
-    user_type = (json.loads(database.get_user_data(user_id)))["user_type"]
+    impaired_user_id = current_principal().impaired_user_id
+    if (impaired_user_id is None):
+         return { "error": { "message": "caretaker does not have a impaired user to look at their past trips"}}
     
-    if (user_type == 'impaired'):
-        impaired_user_id = user_id
-    elif (user_type == 'caretaker'):
-        impaired_user_id = database.get_user_id_of_impaired_if_session_user_is_their_caretaker(user_id)
-        if (impaired_user_id is None):
-             return { "error": { "message": "caretaker does not have a impaired user to look at their past trips"}}
-    
-    data = database.get_data_by_key_and_table([("impaired_user_id", impaired_user_id)], "past_trips", ["id", "destination_location", "complete_date"], False)
-    if(data is None):
-        return { "error": { "message": "user has no past trips"}}
-    return data
+    return list_rows_response([("impaired_user_id", impaired_user_id)], "past_trips", ["id", "destination_location", "complete_date"], "id", "user has no past trips")
 
 # add a past trip -> (Checked In Insomnia)
 @user_bp.post("/past_trip")
@@ -273,44 +337,33 @@ def add_a_past_trip():
         return { "error": { "message": "must contain a json with destination_location to add a past trip"}}
     
     user_id = session.get("user_id")
-    database.add_data_by_table("past_trips", [("impaired_user_id", user_id), ("destination_location", ("\'" + data["destination_location"] + "\'")), ("complete_date", "CURRENT_TIMESTAMP")])
+    database.add_data_by_table("past_trips", [("impaired_user_id", user_id), ("destination_location", data["destination_location"]), ("complete_date", CURRENT_TIMESTAMP)])
+    # a completed trip is over, the current trip goes with it so the event and the db agree
+    database.delete_data_by_where_and_table([("impaired_user_id", user_id)], "current_trip")
+    trip_status_feed.emit(user_id, "trip_completed", None, { "destination_location": data["destination_location"] })
     return { "success": { "message": "successfully added past trips" } }
 
 # get a past trip by id -> (Checked In Insomnia)
 @user_bp.get("/past_trip/<int:pt_id>")
 def get_a_past_trip(pt_id: int):
-    user_id = session.get("user_id")
-    user_type = (json.loads(database.get_user_data(user_id)))["user_type"]
+    impaired_user_id = current_principal().impaired_user_id
+    if (impaired_user_id is None):
+         return { "error": { "message": "caretaker does not have a impaired user to look at their past trip"}}
     
-    if (user_type == 'impaired'):
-        impaired_user_id = user_id
-    elif (user_type == 'caretaker'):
-        impaired_user_id = database.get_user_id_of_impaired_if_session_user_is_their_caretaker(user_id)
-        if (impaired_user_id is None):
-             return { "error": { "message": "caretaker does not have a impaired user to look at their past trip"}}
-    
-    data = database.get_data_by_key_and_table([("impaired_user_id", impaired_user_id), ("id", pt_id)], "past_trips", ["id", "destination_location", "complete_date"], True)
+    data = database.get_rows_by_key_and_table([("impaired_user_id", impaired_user_id), ("id", pt_id)], "past_trips", ["id", "destination_location", "complete_date"], True)
     if(data is None):
         return { "error": { "message": "past trip doesn't exist"}}
     return data
 
 # get all activities -> (Checked In Insomnia)
+# pages with ?after_id=&limit= and streams with ?format=ndjson
 @user_bp.get("/activity")
 def get_activities():
-    user_id = session.get("user_id")
-    user_type = (json.loads(database.get_user_data(user_id)))["user_type"]
+    impaired_user_id = current_principal().impaired_user_id
+    if (impaired_user_id is None):
+         return { "error": { "message": "caretaker does not have a impaired user to look at their activities"}}
     
-    if (user_type == 'impaired'):
-        impaired_user_id = user_id
-    elif (user_type == 'caretaker'):
-        impaired_user_id = database.get_user_id_of_impaired_if_session_user_is_their_caretaker(user_id)
-        if (impaired_user_id is None):
-             return { "error": { "message": "caretaker does not have a impaired user to look at their activities"}}
-    
-    data = database.get_data_by_key_and_table([("impaired_user_id", impaired_user_id)], "activity", ["id", "notice_status", "small_description", "notice_date"], False)
-    if(data is None):
-        return { "error": { "message": "user has no activities"}}
-    return data
+    return list_rows_response([("impaired_user_id", impaired_user_id)], "activity", ["id", "notice_status", "small_description", "notice_date"], "id", "user has no activities")
 
 # add a activity -> (Checked In Insomnia)
 # status must be Good, Okay, Bad
@@ -325,24 +378,18 @@ def add_a_activity():
         return { "error": { "message": "notice_status must contain the value Good, Okay, or Bad "}}
 
     user_id = session.get("user_id")
-    database.add_data_by_table("activity", [("impaired_user_id", user_id), ("notice_status", ("\'" + data["notice_status"] + "\'")), ("small_description", ("\'" + data["small_description"] + "\'")), ("notice_date", "CURRENT_TIMESTAMP")])
+    database.add_data_by_table("activity", [("impaired_user_id", user_id), ("notice_status", data["notice_status"]), ("small_description", data["small_description"]), ("notice_date", CURRENT_TIMESTAMP)])
     return { "success": { "message": "successfully added activity" } }
 
 # get a activity by id -> (Checked In Insomnia)
 @user_bp.get("/activity/<int:a_id>")
 @allow_access_if_impaired
 def get_a_activity(a_id: int):
-    user_id = session.get("user_id")
-    user_type = (json.loads(database.get_user_data(user_id)))["user_type"]
-    
-    if (user_type == 'impaired'):
-        impaired_user_id = user_id
-    elif (user_type == 'caretaker'):
-        impaired_user_id = database.get_user_id_of_impaired_if_session_user_is_their_caretaker(user_id)
-        if (impaired_user_id is None):
-             return { "error": { "message": "caretaker does not have a impaired user to look at their activity"}}
+    impaired_user_id = current_principal().impaired_user_id
+    if (impaired_user_id is None):
+         return { "error": { "message": "caretaker does not have a impaired user to look at their activity"}}
     
-    data = database.get_data_by_key_and_table([("impaired_user_id", impaired_user_id), ("id", a_id)], "activity", ["id", "notice_status", "small_description", "notice_date"], True)
+    data = database.get_rows_by_key_and_table([("impaired_user_id", impaired_user_id), ("id", a_id)], "activity", ["id", "notice_status", "small_description", "notice_date"], True)
     if(data is None):
         return { "error": { "message": "activity doesn't exist"}}
     return data
@@ -352,7 +399,7 @@ def get_a_activity(a_id: int):
 @check_if_user_has_caretaker_impaired_pair
 def remove_current_conversation():
     user_id = session.get("user_id")
-    user_type = (json.loads(database.get_user_data(user_id)))["user_type"]
+    user_type = current_principal().user_type
         
     if (user_type == 'impaired'):
         database.delete_data_by_where_and_table([("impaired_user_id", user_id)], "current_caretaker_conversation")
@@ -365,56 +412,105 @@ def remove_current_conversation():
 @user_bp.post("/caretaker_conversation")
 @check_if_user_has_caretaker_impaired_pair
 def create_current_conversation():
-    user_id = session.get("user_id")
-    user_type = (json.loads(database.get_user_data(user_id)))["user_type"]
-        
-    if (user_type == 'impaired'):
-        data = database.get_data_by_key_and_table([("impaired_user_id", user_id)], "caretaker_info", ["caretaker_user_id"], True)
-        database.add_data_by_table("current_caretaker_conversation", [("caretaker_user_id", (json.loads(data))["caretaker_user_id"]), ("impaired_user_id", user_id)])
-    elif (user_type == 'caretaker'):
-        data = database.get_data_by_key_and_table([("caretaker_user_id", user_id)], "caretaker_info", ["impaired_user_id"], True)
-        database.add_data_by_table("current_caretaker_conversation", [("caretaker_user_id", user_id), ("impaired_user_id", (json.loads(data))["impaired_user_id"])])
+    user = current_principal()
+    database.add_data_by_table("current_caretaker_conversation", [("caretaker_user_id", user.caretaker_user_id), ("impaired_user_id", user.impaired_user_id)])
    
     return { "success": { "message": "successfully added conversation" } }
 
 # gets all messages of conversation -> (Checked In Insomnia)
 # use user type to detect which person is doing the messaging
+# pages with ?after_id=<msg_ordered_number>&limit= and streams with ?format=ndjson
 @user_bp.get("/caretaker_conversation/messages")
 @check_if_user_has_caretaker_impaired_pair
 def get_conversation_messages():
-    user_id = session.get("user_id")
-    user_type = (json.loads(database.get_user_data(user_id)))["user_type"]
+    ccc_id = get_current_conversation_id()
+    if(ccc_id is None):
+        return { "error": { "message": "conversation between users has not been created"}}
     
-    convo_data = None
-    if (user_type == 'impaired'):
-        convo_data = database.get_data_by_key_and_table([("impaired_user_id", user_id)], "current_caretaker_conversation", ["id"], True)
-    elif (user_type == 'caretaker'):
-        convo_data = database.get_data_by_key_and_table([("caretaker_user_id", user_id)], "current_caretaker_conversation", ["id"], True)
+    return list_rows_response([("ccc_id", ccc_id)], "current_caretaker_conversation_messages", ["msg_ordered_number", "user_type", "msg"], "msg_ordered_number", "user has no messages in existing current conversation")
+
+MESSAGES_POLL_TIMEOUT_SECONDS = 25.0
+MESSAGES_STREAM_HEARTBEAT_SECONDS = 15.0
+
+#
+# the conversations messages after since read from the db (a keyset read so it only touches the new rows)
+#
+def get_conversation_messages_after(ccc_id: int, since: int) -> list[dict]:
+    return database.get_rows_page_by_key_and_table([("ccc_id", ccc_id)], "current_caretaker_conversation_messages", ["msg_ordered_number", "user_type", "msg"], "msg_ordered_number", since, MAX_PAGE_LIMIT)
+
+# long polls for new messages after ?since=<msg_ordered_number>
+# answers right away when there are some otherwise waits up to ?timeout= seconds and returns [] if nothing came
+@user_bp.get("/caretaker_conversation/messages/poll")
+@check_if_user_has_caretaker_impaired_pair
+def poll_conversation_messages():
+    ccc_id = get_current_conversation_id()
+    if(ccc_id is None):
+        return { "error": { "message": "conversation between users has not been created"}}
+    
+    since = request.args.get("since", 0, type=int)
+    timeout = min(request.args.get("timeout", MESSAGES_POLL_TIMEOUT_SECONDS, type=float), MESSAGES_POLL_TIMEOUT_SECONDS)
+    channel = broker.channel(("conversation", ccc_id))
+    
+    # the first read falls back to the db so messages from before this server started publishing are found too
+    messages = channel.events_since(since)
+    if (not messages):
+        messages = get_conversation_messages_after(ccc_id, since)
     
-    if(convo_data is None):
+    if (messages == []):
+        messages = channel.wait_for(since, timeout)
+        if (messages is None):
+            messages = get_conversation_messages_after(ccc_id, since)
+    return messages
+
+# streams new messages as server sent events after ?since= (or the Last-Event-ID header when reconnecting)
+@user_bp.get("/caretaker_conversation/messages/stream")
+@check_if_user_has_caretaker_impaired_pair
+def stream_conversation_messages():
+    ccc_id = get_current_conversation_id()
+    if(ccc_id is None):
         return { "error": { "message": "conversation between users has not been created"}}
     
-    data = database.get_data_by_key_and_table([("ccc_id", (json.loads(convo_data))["id"])], "current_caretaker_conversation_messages", ["msg_ordered_number", "user_type", "msg"], False)
-    if(data is None):
-        return { "error": { "message": "user has no messages in existing current conversation"}}
-    return data
+    since = request.headers.get("Last-Event-ID", type=int)
+    if (since is None):
+        since = request.args.get("since", 0, type=int)
+    channel = broker.channel(("conversation", ccc_id))
+    
+    # runs after the request has ended so it doesn't keep the requests db connection checked out
+    def events(since: int):
+        messages = get_conversation_messages_after(ccc_id, since)
+        while True:
+            if (messages == []):
+                yield ": keep-alive\n\n"
+            for message in messages:
+                since = message["msg_ordered_number"]
+                yield f"id: {since}\nevent: message\ndata: {json.dumps(message)}\n\n"
+            
+            messages = channel.wait_for(since, MESSAGES_STREAM_HEARTBEAT_SECONDS)
+            if (messages is None):
+                messages = get_conversation_messages_after(ccc_id, since)
+    
+    return Response(events(since), mimetype="text/event-stream", headers={ "Cache-Control": "no-cache", "X-Accel-Buffering": "no" })
 
 # adds a message to conversation -> (Checked In Insomnia)
+# also takes { "msgs": [...] } to add several messages in order at once
 @user_bp.post("/caretaker_conversation/messages")
 @check_if_user_has_caretaker_impaired_pair
 def add_message_to_conversation():
     data = request.get_json()
-    if("msg" not in data):
+    if("msg" in data):
+        msgs = [data["msg"]]
+    elif("msgs" in data and isinstance(data["msgs"], list) and len(data["msgs"]) > 0):
+        msgs = data["msgs"]
+    else:
         return { "error": { "message": "must contain a json with msg to add a conversation message"}}
     
-    user_id = session.get("user_id")
-    user_type = (json.loads(database.get_user_data(user_id)))["user_type"]
+    ccc_id = get_current_conversation_id()
+    if(ccc_id is None):
+        return { "error": { "message": "conversation between users has not been created"}}
     
-    if (user_type == 'impaired'):
-        convo_data = database.get_data_by_key_and_table([("impaired_user_id", user_id)],"current_caretaker_conversation",["id"],True)
-        database.add_conversation_msg((json.loads(convo_data))["id"], user_type,  data["msg"])
-    elif (user_type == 'caretaker'):
-        convo_data = database.get_data_by_key_and_table([("caretaker_user_id", user_id)],"current_caretaker_conversation",["id"],True)
-        database.add_conversation_msg((json.loads(convo_data))["id"], user_type, data["msg"])
-   
-    return { "success": { "message": "successfully added conversation" } }
+    user_type = current_principal().user_type
+    msg_ordered_numbers = database.add_conversation_msgs(ccc_id, [(user_type, msg) for msg in msgs])
+    
+    # wakes up anyone polling or streaming this conversation
+    broker.publish(("conversation", ccc_id), [(msg_ordered_number, { "msg_ordered_number": msg_ordered_number, "user_type": user_type, "msg": msg }) for msg_ordered_number, msg in zip(msg_ordered_numbers, msgs)])
+    return { "success": { "message": "successfully added conversation", "msg_ordered_numbers": msg_ordered_numbers } }
@@ -0,0 +1,23 @@
+#
+# helpers for the boxes in predictions -> { "xmin", "ymin", "xmax", "ymax" } in pixels
+#
+
+def box_area(box: dict) -> float:
+    return max(0, box["xmax"] - box["xmin"]) * max(0, box["ymax"] - box["ymin"])
+
+def iou(a: dict, b: dict) -> float:
+    """Intersection over union of two boxes, 0 when they don't overlap"""
+    inter_w = min(a["xmax"], b["xmax"]) - max(a["xmin"], b["xmin"])
+    inter_h = min(a["ymax"], b["ymax"]) - max(a["ymin"], b["ymin"])
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    return inter / (box_area(a) + box_area(b) - inter)
+
+def non_max_suppression(predictions: list[dict], iou_threshold: float) -> list[dict]:
+    """Keeps the highest scoring of each group of same label predictions overlapping by more than iou_threshold"""
+    kept = []
+    for prediction in sorted(predictions, key=lambda prediction: prediction["score"], reverse=True):
+        if all(kept_prediction["label"] != prediction["label"] or iou(kept_prediction["box"], prediction["box"]) <= iou_threshold for kept_prediction in kept):
+            kept.append(prediction)
+    return kept
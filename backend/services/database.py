@@ -1,26 +1,166 @@
 from pathlib import Path
+from flask import g, has_app_context
+from functools import lru_cache
 import sqlite3
-import json
+import threading
+import logging
+import os
 db_path = Path(__file__).parent.parent / "data" / "theia_db.db"
 
+logger = logging.getLogger(__name__)
+
+# how many idle connections are kept open for reuse (0 opens a new connection every time)
+DB_POOL_SIZE = int(os.environ.get("THEIA_DB_POOL_SIZE", 8))
+DB_BUSY_TIMEOUT_SECONDS = 5.0
+
+# set on every connection when it is first opened (journal_mode=WAL is set once at startup in create_db)
+CONNECTION_PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+]
+
+#
+# keeps sqlite connections open so they can be reused by the next query instead of reconnecting
+#
+# size: max number of idle connections kept, extra connections get closed when released
+#
+class connection_pool :
+
+    def __init__(self, path: Path, size: int):
+        self.path = path
+        self.size = size
+        self.__idle = []
+        self.__lock = threading.Lock()
+
+    def __connect(self) -> sqlite3.Connection:
+        # connections move between the server threads but are only used by one at a time
+        db_conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        db_conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            db_conn.execute(pragma)
+        return db_conn
+
+    def acquire(self) -> sqlite3.Connection:
+        with self.__lock:
+            if self.__idle:
+                return self.__idle.pop()
+        return self.__connect()
+
+    def release(self, db_conn: sqlite3.Connection):
+        if db_conn.in_transaction:
+            db_conn.rollback()
+        with self.__lock:
+            if len(self.__idle) < self.size:
+                self.__idle.append(db_conn)
+                return
+        db_conn.close()
+
+    def close_all(self):
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+        for db_conn in idle:
+            db_conn.close()
+
+pool = connection_pool(db_path, DB_POOL_SIZE)
+
+# how many different query shapes keep their built sql text
+QUERY_CACHE_SIZE = 128
+
+#
+# a value written into the sql as is instead of being bound as a parameter
+#
+class sql_expression(str) :
+    pass
+
+CURRENT_TIMESTAMP = sql_expression("CURRENT_TIMESTAMP")
+
+#
+# builds the sql text for the generic table helpers on database
+# the text only depends on the table and column names so it is cached per shape and every value is bound with ?
+#
+class query_builder :
+
+    @staticmethod
+    @lru_cache(maxsize=QUERY_CACHE_SIZE)
+    def select(tablename: str, columns: tuple[str, ...], where_keys: tuple[str, ...]) -> str:
+        return f"SELECT {', '.join(columns)} FROM {tablename} WHERE {' AND '.join(f'{key} = ?' for key in where_keys)}"
+
+    #
+    # columns: tuple of (name, sql_expression) where the expression is None for bound values
+    #
+    @staticmethod
+    @lru_cache(maxsize=QUERY_CACHE_SIZE)
+    def insert(tablename: str, columns: tuple[tuple[str, sql_expression|None], ...]) -> str:
+        names = ", ".join(col[0] for col in columns)
+        values = ", ".join("?" if col[1] is None else col[1] for col in columns)
+        return f"INSERT INTO {tablename} ({names}) VALUES ({values})"
+
+    @staticmethod
+    @lru_cache(maxsize=QUERY_CACHE_SIZE)
+    def update(tablename: str, columns: tuple[str, ...], key: str) -> str:
+        return f"UPDATE {tablename} SET {', '.join(f'{col} = ?' for col in columns)} WHERE {key} = ?"
+
+    #
+    # keyset page: rows after the given order_key value in order_key order, limit is optional
+    #
+    @staticmethod
+    @lru_cache(maxsize=QUERY_CACHE_SIZE)
+    def select_page(tablename: str, columns: tuple[str, ...], where_keys: tuple[str, ...], order_key: str, has_limit: bool) -> str:
+        conditions = " AND ".join([f"{key} = ?" for key in where_keys] + [f"{order_key} > ?"])
+        execute_script = f"SELECT {', '.join(columns)} FROM {tablename} WHERE {conditions} ORDER BY {order_key}"
+        if has_limit:
+            execute_script += " LIMIT ?"
+        return execute_script
+
+    @staticmethod
+    @lru_cache(maxsize=QUERY_CACHE_SIZE)
+    def delete(tablename: str, where_keys: tuple[str, ...]) -> str:
+        return f"DELETE FROM {tablename} WHERE {' AND '.join(f'{key} = ?' for key in where_keys)}"
+
 class database :
 
     #
-    # returns none when none otherwise a json of rows or row if singular
+    # inside of a flask request every query shares one connection stored on g
+    # outside of a request (scripts, threads) a connection is taken from the pool per query
     #
     @staticmethod
-    def __create_json(data):
+    def __open_connection() -> sqlite3.Connection:
+        if has_app_context():
+            if "db_conn" not in g:
+                g.db_conn = pool.acquire()
+            return g.db_conn
+        return pool.acquire()
+    
+    @staticmethod
+    def __close_connection(db_conn: sqlite3.Connection):
+        if not has_app_context():
+            pool.release(db_conn)
+    
+    #
+    # gives the requests connection back to the pool, registered as a teardown in app.py
+    #
+    @staticmethod
+    def release_request_connection(exception=None):
+        db_conn = g.pop("db_conn", None)
+        if db_conn is not None:
+            pool.release(db_conn)
+
+    #
+    # returns none when none otherwise a dict of the row or a list of dicts for rows
+    #
+    @staticmethod
+    def __create_rows(data) -> dict|list[dict]|None:
         if (data is None):
             return None
         elif (isinstance(data, list)): 
-            return json.dumps( [dict(data_item) for data_item in data]) 
+            return [dict(data_item) for data_item in data]
         else: 
-            return json.dumps( dict(data) ) 
-        
+            return dict(data)
+    
     @staticmethod
-    def get_user_data(id: int):
-        db_conn = sqlite3.connect(db_path)
-        db_conn.row_factory = sqlite3.Row
+    def get_user(id: int) -> dict|None:
+        db_conn = database.__open_connection()
         cursor = db_conn.cursor()
         
         cursor.execute("""
@@ -31,14 +171,13 @@ class database :
         
         user_data = cursor.fetchone()
         cursor.close()
-        db_conn.close()
+        database.__close_connection(db_conn)
         
-        return database.__create_json(user_data)
+        return database.__create_rows(user_data)
     
     @staticmethod
-    def get_user_id_if_exists(email: str, password: str):
-        db_conn = sqlite3.connect(db_path)
-        db_conn.row_factory = sqlite3.Row
+    def find_user_id(email: str, password: str) -> int|None:
+        db_conn = database.__open_connection()
         cursor = db_conn.cursor()
         
         cursor.execute("""
@@ -47,11 +186,13 @@ class database :
             WHERE email = ? AND pswd = ?
         """, (email.lower(), password))
         
-        user_id = cursor.fetchone()
+        fetched = cursor.fetchone()
         cursor.close()
-        db_conn.close()
+        database.__close_connection(db_conn)
         
-        return database.__create_json(user_id)
+        if (fetched is None):
+            return None
+        return fetched["id"]
     
     #
     # assuming only one caretaker and impaired users pair
@@ -60,8 +201,7 @@ class database :
     #
     @staticmethod
     def get_user_id_of_impaired_if_session_user_is_their_caretaker(id: int) -> int|None:
-        db_conn = sqlite3.connect(db_path)
-        db_conn.row_factory = sqlite3.Row
+        db_conn = database.__open_connection()
         cursor = db_conn.cursor()
         
         cursor.execute("""
@@ -77,7 +217,7 @@ class database :
             impaired_user_id = None
         
         cursor.close()
-        db_conn.close()
+        database.__close_connection(db_conn)
         
         return impaired_user_id
     
@@ -88,8 +228,7 @@ class database :
     #
     @staticmethod
     def get_user_id_of_caretaker_if_session_user_is_their_impaired(id: int) -> int|None:
-        db_conn = sqlite3.connect(db_path)
-        db_conn.row_factory = sqlite3.Row
+        db_conn = database.__open_connection()
         cursor = db_conn.cursor()
         
         cursor.execute("""
@@ -105,7 +244,7 @@ class database :
             caretaker_user_id = None
             
         cursor.close()
-        db_conn.close()
+        database.__close_connection(db_conn)
         
         return caretaker_user_id
     
@@ -115,7 +254,7 @@ class database :
     #
     @staticmethod
     def is_impaired_user_on_trip(id: int) -> bool:
-        db_conn = sqlite3.connect(db_path)
+        db_conn = database.__open_connection()
         cursor = db_conn.cursor()
         
         cursor.execute("""
@@ -128,37 +267,64 @@ class database :
         
         is_on_trip = bool((cursor.fetchone())[0])
         cursor.close()
-        db_conn.close()
+        database.__close_connection(db_conn)
         
         return is_on_trip
     
         #
     
-    # columns: list[tuple[name:str, value:any]]
-    #
     @staticmethod
     def add_conversation_msg(ccc_id, user_type, msg) ->  bool:        
-        db_conn = sqlite3.connect(db_path)
-        db_conn.row_factory = sqlite3.Row
-        cursor = db_conn.cursor()        
-        
-        execute_script = f"""
-            INSERT INTO current_caretaker_conversation_messages (ccc_id, msg_ordered_number, user_type, msg)
-            VALUES ({ccc_id}, (
-                SELECT (COALESCE(MAX(msg_ordered_number), 0) + 1)
-                FROM current_caretaker_conversation_messages
-                WHERE ccc_id = {ccc_id} 
-            ), '{user_type}', '{msg}')
-        """
-        
-        print(execute_script)
-        cursor.execute(execute_script)
+        return database.add_conversation_msgs(ccc_id, [(user_type, msg)]) != []
+    
+    #
+    # adds the messages in order to the end of the conversation
+    #
+    # msgs: list[tuple[user_type:str, msg:str]]
+    #
+    # the conversations last_msg_ordered_number is bumped and the messages inserted in one BEGIN IMMEDIATE
+    # transaction so users posting at the same time can't get the same msg_ordered_number
+    #
+    # returns the msg_ordered_number of each added message (empty when the conversation doesn't exist)
+    #
+    @staticmethod
+    def add_conversation_msgs(ccc_id: int, msgs: list[tuple[str,str]]) -> list[int]:
+        if len(msgs) <= 0:
+            return []
         
-        db_conn.commit()
-        cursor.close()
-        db_conn.close()
+        db_conn = database.__open_connection()
+        cursor = db_conn.cursor()
         
-        return True
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                UPDATE current_caretaker_conversation
+                SET last_msg_ordered_number = last_msg_ordered_number + ?
+                WHERE id = ?
+                RETURNING last_msg_ordered_number
+            """, (len(msgs), ccc_id))
+            
+            fetched = cursor.fetchone()
+            if (fetched is None):
+                db_conn.rollback()
+                return []
+            
+            first_msg_ordered_number = fetched[0] - len(msgs) + 1
+            msg_ordered_numbers = list(range(first_msg_ordered_number, fetched[0] + 1))
+            cursor.executemany("""
+                INSERT INTO current_caretaker_conversation_messages (ccc_id, msg_ordered_number, user_type, msg)
+                VALUES (?, ?, ?, ?)
+            """, [(ccc_id, msg_ordered_number, user_type, msg) for msg_ordered_number, (user_type, msg) in zip(msg_ordered_numbers, msgs)])
+            
+            db_conn.commit()
+        except sqlite3.Error:
+            db_conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            database.__close_connection(db_conn)
+        
+        return msg_ordered_numbers
     
     #
     # columns: list[tuple[name:str, value:any]]
@@ -169,34 +335,18 @@ class database :
         if columns == []:
             return False
         
-        db_conn = sqlite3.connect(db_path)
-        db_conn.row_factory = sqlite3.Row
+        db_conn = database.__open_connection()
         cursor = db_conn.cursor()        
         
-        execute_script = f"""
-            UPDATE {tablename}
-            SET 
-        """
-        update_values = ()
-        
-        for col in columns:
-            execute_script += f"""
-                {col[0]} = ?
-            """
-            update_values += (col[1],)
+        execute_script = query_builder.update(tablename, tuple([col[0] for col in columns]), key[0])
+        update_values = tuple([col[1] for col in columns]) + (key[1],)
         
-        
-        if(update_values != ()):
-            execute_script = execute_script + f"""
-                WHERE {key[0]} = ?
-            """ 
-            update_values += (key[1],)
-            
-            cursor.execute(execute_script, update_values)
-            db_conn.commit()
+        logger.debug("%s %s", execute_script, update_values)
+        cursor.execute(execute_script, update_values)
+        db_conn.commit()
             
         cursor.close()
-        db_conn.close()
+        database.__close_connection(db_conn)
         
         return True
     
@@ -204,97 +354,52 @@ class database :
     
     #
     # columns: list[tuple[name:str, value:any]]
+    # values are bound as parameters unless they are a sql_expression like CURRENT_TIMESTAMP
     #
     @staticmethod
     def add_data_by_table(tablename: str, columns: list[tuple[str,any]]) ->  bool:
         if len(columns) <= 0:
             return False
         
-        db_conn = sqlite3.connect(db_path)
-        db_conn.row_factory = sqlite3.Row
+        db_conn = database.__open_connection()
         cursor = db_conn.cursor()        
         
-        execute_script = f"""
-            INSERT INTO {tablename} (
-        """
-        
-        first_check = True
-        for col in columns:
-            if (first_check):
-                execute_script += f"""
-                    {col[0]}
-                """
-                first_check = False
-            else:
-                execute_script += f"""
-                    , {col[0]}
-                """
-        execute_script += """
-            ) VALUES (
-        """
-        
-        first_check = True
-        for col in columns:
-            if (first_check):
-                execute_script += f"""
-                    {col[1]}
-                """
-                first_check = False
-            else:
-                execute_script += f"""
-                , {col[1]}
-                """
-        execute_script += """
-            )
-        """
+        execute_script = query_builder.insert(tablename, tuple([(col[0], col[1] if isinstance(col[1], sql_expression) else None) for col in columns]))
+        insert_values = tuple([col[1] for col in columns if not isinstance(col[1], sql_expression)])
         
-        print(execute_script)
-        cursor.execute(execute_script)
+        logger.debug("%s %s", execute_script, insert_values)
+        cursor.execute(execute_script, insert_values)
         
         db_conn.commit()
         cursor.close()
-        db_conn.close()
+        database.__close_connection(db_conn)
         
         return True
     
     #
     # where: list[tuple[name:str, value:any]]
+    # returns True when a row was deleted
     #
     @staticmethod
     def delete_data_by_where_and_table(where: list[tuple[str,any]], tablename: str) -> bool:
         if len(where) <= 0:
             return False
         
-        db_conn = sqlite3.connect(db_path)
-        db_conn.row_factory = sqlite3.Row
+        db_conn = database.__open_connection()
         cursor = db_conn.cursor()        
         
-        execute_script = f"""
-            DELETE FROM {tablename}
-            WHERE 
-        """
-        
-        delete_values = ()
-        first_check = True
-        for w in where:
-            if (first_check):
-                execute_script += f"""
-                    {w[0]} = ?
-                """
-                first_check = False
-            else:
-                execute_script += f"""
-                    AND {w[0]} = ?
-                """
-            delete_values += (w[1],)
+        execute_script = query_builder.delete(tablename, tuple([w[0] for w in where]))
+        delete_values = tuple([w[1] for w in where])
         
+        logger.debug("%s %s", execute_script, delete_values)
         cursor.execute(execute_script, delete_values) 
+        deleted = cursor.rowcount > 0
         
         db_conn.commit()
         cursor.close()
-        db_conn.close()
+        database.__close_connection(db_conn)
         
-        return True
+        return deleted
     
     
     #
@@ -303,65 +408,66 @@ class database :
     # isSingle: true when only getting one row
     #
     @staticmethod
-    def get_data_by_key_and_table(where: list[tuple[str,any]], tablename: str, columns: list[str], isSingle: bool = True):
+    def get_rows_by_key_and_table(where: list[tuple[str,any]], tablename: str, columns: list[str], isSingle: bool = True) -> dict|list[dict]|None:
         
         if len(columns) <= 0:
             return None
         
-        db_conn = sqlite3.connect(db_path)
-        db_conn.row_factory = sqlite3.Row
+        db_conn = database.__open_connection()
         cursor = db_conn.cursor()        
         
-        execute_script = f"""
-            SELECT
-        """
-        
-        first_check = True
-        for col in columns:
-            if (first_check):
-                execute_script += f"""
-                    {col}
-                """
-                first_check = False
-            else:
-                execute_script += f"""
-                    , {col}
-                """
-        
-        execute_script = execute_script + f"""
-            FROM {tablename}
-            WHERE
-        """
-         
-        where_values = ()
-        first_check = True
-        for w in where:
-            if (first_check):
-                execute_script += f"""
-                    {w[0]} = ?
-                """
-                first_check = False
-            else:
-                execute_script += f"""
-                    AND {w[0]} = ?
-                """
-            where_values += (w[1],)
+        execute_script = query_builder.select(tablename, tuple(columns), tuple([w[0] for w in where]))
+        where_values = tuple([w[1] for w in where])
          
         user_data = None
-        print(execute_script)
-        print(where_values)
+        logger.debug("%s %s", execute_script, where_values)
         cursor.execute(execute_script, where_values)
         if (isSingle):
             user_data = cursor.fetchone()
         else:
             user_data = cursor.fetchall()
             if user_data == []:
-                return None
+                user_data = None
         
         cursor.close()
-        db_conn.close()
+        database.__close_connection(db_conn)
         
         
-        return database.__create_json(user_data)
+        return database.__create_rows(user_data)
+    
+    #
+    # where: list[tuple[name:str,value:any]]
+    # order_key: column the rows are ordered and paged by, must be unique within the where
+    # after: only rows with order_key greater than this (None starts from the beginning)
+    # limit: max rows (None for all of them)
+    #
+    # yields rows as dicts, fetching chunk_size rows from the cursor at a time
+    #
+    @staticmethod
+    def iter_rows_page_by_key_and_table(where: list[tuple[str,any]], tablename: str, columns: list[str], order_key: str, after: int|None = None, limit: int|None = None, chunk_size: int = 100):
+        execute_script = query_builder.select_page(tablename, tuple(columns), tuple([w[0] for w in where]), order_key, limit is not None)
+        page_values = tuple([w[1] for w in where]) + (after if after is not None else -1,)
+        if limit is not None:
+            page_values += (limit,)
         
-        
\ No newline at end of file
+        db_conn = database.__open_connection()
+        cursor = db_conn.cursor()
+        try:
+            logger.debug("%s %s", execute_script, page_values)
+            cursor.execute(execute_script, page_values)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            cursor.close()
+            database.__close_connection(db_conn)
+    
+    #
+    # same as iter_rows_page_by_key_and_table but returns the whole page as a list
+    #
+    @staticmethod
+    def get_rows_page_by_key_and_table(where: list[tuple[str,any]], tablename: str, columns: list[str], order_key: str, after: int|None = None, limit: int|None = None) -> list[dict]:
+        return list(database.iter_rows_page_by_key_and_table(where, tablename, columns, order_key, after, limit))
@@ -0,0 +1,211 @@
+from pathlib import Path
+from types import SimpleNamespace
+import inspect
+import abc
+import os
+
+# where exported models (onnx) are kept between runs
+MODELS_DIR = Path(__file__).parent.parent / "data" / "models"
+# same default as the transformers object-detection pipeline
+DETECTION_SCORE_THRESHOLD = float(os.environ.get("THEIA_DETECTION_SCORE_THRESHOLD", 0.5))
+
+def image_processor(model_id: str, image_size: int|None):
+    """The models image processor, resizing to image_size on the shortest edge when given (keeping detrs 800:1333 ratio)"""
+    from transformers import AutoImageProcessor
+    if image_size is None:
+        return AutoImageProcessor.from_pretrained(model_id)
+    return AutoImageProcessor.from_pretrained(model_id, size={ "shortest_edge": image_size, "longest_edge": round(image_size * 1333 / 800) })
+
+def tensor_bytes(values) -> int:
+    """Bytes of the tensors in a state_dicts values, quantized layers keep theirs packed in tuples"""
+    total = 0
+    for value in values:
+        if isinstance(value, (tuple, list)):
+            total += tensor_bytes(value)
+        elif hasattr(value, "element_size"):
+            total += value.numel() * value.element_size()
+    return total
+
+#
+# every backend is called like the transformers pipeline:
+#   backend(image) -> [{ "score", "label", "box": { "xmin", "ymin", "xmax", "ymax" } }, ...]
+#   backend([images], batch_size=n) -> one of those lists per image
+#   backend.preprocessor -> the image_preprocessor with the sizes images are resized to before the model
+#   backend.input_size -> shortest edge images are resized to, photos never need decoding any bigger than it
+#   backend.memory_bytes -> estimated size of the models weights, what model_registry bounds the loaded models by
+#
+
+#
+# the stock transformers object-detection pipeline
+#
+class pipeline_backend :
+    name = "pipeline"
+
+    def __init__(self, model_id: str, image_size: int|None = None, threads: int|None = None):
+        from transformers import pipeline
+        # numpy comes with it, it is only imported once a model is loaded so the api starts without it
+        from preprocessing import image_preprocessor
+        self.model_id = model_id
+        self.pipe = pipeline("object-detection", model_id, image_processor=image_processor(model_id, image_size))
+        # the pipeline still preprocesses with transformers, this is only used for its sizes
+        self.preprocessor = image_preprocessor.from_processor(self.pipe.image_processor)
+        self.input_size = self.preprocessor.shortest_edge
+        self.memory_bytes = tensor_bytes(self.pipe.model.state_dict().values())
+
+    def __call__(self, images, batch_size: int|None = None):
+        if isinstance(images, list):
+            return self.pipe(images, batch_size=batch_size or len(images), threshold=DETECTION_SCORE_THRESHOLD)
+        return self.pipe(images, threshold=DETECTION_SCORE_THRESHOLD)
+
+#
+# runs the preprocessing (see preprocessing.image_preprocessor) and post processing itself
+# so subclasses only have to do the forward pass
+#
+class model_backend(abc.ABC) :
+    name = None
+
+    def __init__(self, model_id: str, image_size: int|None = None, threads: int|None = None):
+        from transformers import AutoConfig
+        from preprocessing import image_preprocessor
+        self.model_id = model_id
+        self.threads = threads
+        self.processor = image_processor(model_id, image_size)
+        self.preprocessor = image_preprocessor.from_processor(self.processor)
+        self.input_size = self.preprocessor.shortest_edge
+        self.id2label = AutoConfig.from_pretrained(model_id).id2label
+
+    #
+    # inputs: { "pixel_values", "pixel_mask" } as numpy arrays (views into the preprocessors buffers)
+    # returns (logits, pred_boxes) as torch tensors
+    #
+    @abc.abstractmethod
+    def forward(self, inputs: dict):
+        pass
+
+    def __call__(self, images, batch_size: int|None = None):
+        single = not isinstance(images, list)
+        batch = [images] if single else images
+
+        logits, pred_boxes = self.forward(self.preprocessor(batch))
+        results = self.processor.post_process_object_detection(
+            SimpleNamespace(logits=logits, pred_boxes=pred_boxes),
+            threshold=DETECTION_SCORE_THRESHOLD,
+            target_sizes=[(image.height, image.width) for image in batch],
+        )
+        predictions = [self.to_predictions(result) for result in results]
+        return predictions[0] if single else predictions
+
+    def to_predictions(self, result: dict) -> list[dict]:
+        predictions = []
+        for score, label, box in zip(result["scores"].tolist(), result["labels"].tolist(), result["boxes"].tolist()):
+            predictions.append({
+                "score": score,
+                "label": self.id2label[label],
+                "box": { "xmin": int(box[0]), "ymin": int(box[1]), "xmax": int(box[2]), "ymax": int(box[3]) },
+            })
+        return predictions
+
+#
+# the model run with torch on cpu, the same model and post processing as the pipeline with the preprocessing done once
+#
+class torch_backend(model_backend) :
+    name = "torch"
+
+    def __init__(self, model_id: str, image_size: int|None = None, threads: int|None = None):
+        super().__init__(model_id, image_size, threads)
+        from transformers import AutoModelForObjectDetection
+        self.model = self.load(AutoModelForObjectDetection.from_pretrained(model_id).eval())
+        self.input_names = set(inspect.signature(self.model.forward).parameters)
+        self.memory_bytes = tensor_bytes(self.model.state_dict().values())
+
+    def load(self, model):
+        return model
+
+    def forward(self, inputs: dict):
+        import torch
+        # the tensors share memory with the numpy buffers, nothing is copied
+        tensors = { name: torch.from_numpy(array) for name, array in inputs.items() if name in self.input_names }
+        with torch.inference_mode():
+            outputs = self.model(**tensors)
+        return outputs.logits, outputs.pred_boxes
+
+#
+# the model with its Linear layers dynamically quantized to int8, smaller and faster on cpu
+#
+class quantized_backend(torch_backend) :
+    name = "quantized"
+
+    def load(self, model):
+        import torch
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+#
+# the model exported to onnx (once, into data/models) and run with onnxruntime on cpu
+# needs the optional onnx and onnxruntime packages
+#
+class onnx_backend(model_backend) :
+    name = "onnx"
+
+    def __init__(self, model_id: str, image_size: int|None = None, threads: int|None = None):
+        super().__init__(model_id, image_size, threads)
+        import onnxruntime
+        onnx_path = MODELS_DIR / f"{model_id.replace('/', '--')}.onnx"
+        if not onnx_path.exists():
+            self.export(model_id, onnx_path)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # onnxruntime keeps its own thread pool per session instead of following torch.set_num_threads
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {input.name for input in self.session.get_inputs()}
+        # the weights are in the exported file
+        self.memory_bytes = onnx_path.stat().st_size
+
+    @staticmethod
+    def export(model_id: str, onnx_path: Path):
+        import torch
+        from transformers import AutoModelForObjectDetection
+        model = AutoModelForObjectDetection.from_pretrained(model_id).eval()
+        model.config.return_dict = False
+
+        onnx_path.parent.mkdir(parents=True, exist_ok=True)
+        inputs = { "pixel_values": torch.randn(1, 3, 800, 1066) }
+        dynamic_axes = {
+            "pixel_values": { 0: "batch", 2: "height", 3: "width" },
+            "logits": { 0: "batch" },
+            "pred_boxes": { 0: "batch" },
+        }
+        # detr takes a padding mask, yolos only the pixels
+        if "pixel_mask" in inspect.signature(model.forward).parameters:
+            inputs["pixel_mask"] = torch.ones(1, 800, 1066, dtype=torch.int64)
+            dynamic_axes["pixel_mask"] = { 0: "batch", 1: "height", 2: "width" }
+        
+        torch.onnx.export(
+            model,
+            tuple(inputs.values()),
+            str(onnx_path),
+            input_names=list(inputs),
+            output_names=["logits", "pred_boxes"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+
+    def forward(self, inputs: dict):
+        import torch
+        feed = { name: array for name, array in inputs.items() if name in self.input_names }
+        logits, pred_boxes = self.session.run(["logits", "pred_boxes"], feed)
+        return torch.from_numpy(logits), torch.from_numpy(pred_boxes)
+
+# there is no torchscript backend: tracing bakes the input shape into detr and yolos (yolos interpolates its position
+# embeddings with python ints) so a traced model only takes photos of the size it was traced with
+BACKENDS = { backend.name: backend for backend in (pipeline_backend, torch_backend, quantized_backend, onnx_backend) }
+
+#
+# threads: cpu threads an inference uses (onnx sessions take it here, torch backends get it from model_registry.set_torch_threads)
+#
+def create_backend(name: str, model_id: str, image_size: int|None = None, threads: int|None = None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detection backend {name}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_id, image_size, threads)
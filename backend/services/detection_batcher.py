@@ -0,0 +1,65 @@
+from concurrent.futures import Future
+import threading
+import queue
+import time
+
+#
+# groups images that arrive close together into one batched model call
+#
+# the first image waits at most max_wait_seconds for others to join it, a batch is sent as soon as it
+# has max_batch_size images, then each caller gets back the predictions for its own image
+#
+# predict_batch: fn(list[image]) -> list[predictions] in the same order
+# workers: batches that can be run at the same time (as many as a model can run at once)
+#
+class micro_batcher :
+
+    def __init__(self, predict_batch, max_batch_size: int, max_wait_seconds: float, workers: int = 1):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.__pending = queue.Queue()
+        self.__stats_lock = threading.Lock()
+        self.batches = 0
+        self.images = 0
+        self.__threads = [threading.Thread(target=self.__run, name=f"detection-batcher-{n}", daemon=True) for n in range(max(1, workers))]
+        for thread in self.__threads:
+            thread.start()
+
+    def submit(self, image) -> Future:
+        future = Future()
+        self.__pending.put((image, future))
+        return future
+
+    def predict(self, image):
+        return self.submit(image).result()
+
+    def __run(self):
+        while True:
+            batch = [self.__pending.get()]
+            deadline = time.monotonic() + self.max_wait_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.__pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            images = [image for image, future in batch]
+            try:
+                predictions = self.predict_batch(images)
+                for (image, future), image_predictions in zip(batch, predictions):
+                    future.set_result(image_predictions)
+            except Exception as e:
+                for image, future in batch:
+                    future.set_exception(e)
+
+            with self.__stats_lock:
+                self.batches += 1
+                self.images += len(batch)
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.images / self.batches if self.batches else 0.0
@@ -0,0 +1,168 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
+import threading
+import secrets
+import queue
+import time
+import os
+
+# worker threads running detection jobs
+DETECTION_WORKERS = int(os.environ.get("THEIA_DETECTION_WORKERS", 4))
+# jobs that can wait for a worker before new ones are turned away
+DETECTION_QUEUE_SIZE = int(os.environ.get("THEIA_DETECTION_QUEUE_SIZE", 8))
+# seconds a job can take from being submitted to finishing
+DETECTION_JOB_TIMEOUT_SECONDS = float(os.environ.get("THEIA_DETECTION_JOB_TIMEOUT", 30))
+# seconds a finished job is kept around for polling
+DETECTION_RESULT_TTL_SECONDS = float(os.environ.get("THEIA_DETECTION_RESULT_TTL", 120))
+# how many submitted jobs are kept for polling at most, the oldest is forgotten past it (each can hold a photo)
+DETECTION_MAX_RESULTS = int(os.environ.get("THEIA_DETECTION_MAX_RESULTS", 32))
+
+#
+# raised by submit when the queue is full, retry_after is a guess in seconds of when there will be room
+#
+class queue_full(Exception) :
+    def __init__(self, retry_after: int):
+        super().__init__(f"detection queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+#
+# raised when a job didn't finish before its deadline
+#
+class job_timeout(Exception) :
+    pass
+
+class detection_job :
+    __slots__ = ("id", "future", "submitted_at", "started_at", "finished_at", "deadline", "fn", "args")
+
+    def __init__(self, id: str, fn, args: tuple, timeout: float):
+        self.id = id
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.deadline = self.submitted_at + timeout
+        self.fn = fn
+        self.args = args
+
+    @property
+    def status(self) -> str:
+        if not self.future.done():
+            if time.monotonic() > self.deadline:
+                return "timed_out"
+            return "queued" if self.started_at is None else "running"
+        exception = self.future.exception()
+        if isinstance(exception, job_timeout):
+            return "timed_out"
+        return "failed" if exception is not None else "done"
+
+    #
+    # waits up to timeout seconds (or the jobs deadline, whichever is first) for the result
+    #
+    def result(self, timeout: float|None = None):
+        remaining = max(0.0, self.deadline - time.monotonic())
+        try:
+            return self.future.result(remaining if timeout is None else min(timeout, remaining))
+        except FutureTimeoutError:
+            if time.monotonic() >= self.deadline:
+                raise job_timeout(f"detection job {self.id} timed out")
+            raise
+
+#
+# runs detection jobs on a fixed number of worker threads behind a bounded queue
+# so slow inference only ties up these workers and not the threads serving the rest of the api
+#
+# only jobs from submit are kept to be looked up by id (ids are random so one client can't guess anothers),
+# for at most result_ttl seconds after finishing and max_results jobs, jobs from run are only known to their caller
+#
+class detection_executor :
+
+    def __init__(self, workers: int, queue_size: int, job_timeout: float, result_ttl: float, max_results: int):
+        self.workers = workers
+        self.job_timeout = job_timeout
+        self.result_ttl = result_ttl
+        self.max_results = max(1, max_results)
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__jobs = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__threads = []
+        # running average of how long a job takes, used for Retry-After
+        self.__average_seconds = 1.0
+
+    def __start_workers(self):
+        with self.__lock:
+            if self.__threads:
+                return
+            for n in range(self.workers):
+                thread = threading.Thread(target=self.__work, name=f"detection-worker-{n}", daemon=True)
+                thread.start()
+                self.__threads.append(thread)
+
+    def __work(self):
+        while True:
+            job = self.__queue.get()
+            # nobody is waiting on a job that is already past its deadline
+            if time.monotonic() > job.deadline:
+                job.future.set_exception(job_timeout(f"detection job {job.id} timed out in the queue"))
+                job.finished_at = time.monotonic()
+                # the photo in args isn't needed anymore
+                job.fn = job.args = None
+                continue
+
+            job.started_at = time.monotonic()
+            try:
+                job.future.set_result(job.fn(*job.args))
+            except Exception as e:
+                job.future.set_exception(e)
+            finally:
+                job.finished_at = time.monotonic()
+                job.fn = job.args = None
+            self.__average_seconds = 0.8 * self.__average_seconds + 0.2 * (job.finished_at - job.started_at)
+
+    def __forget_old_jobs(self):
+        now = time.monotonic()
+        with self.__lock:
+            expired = [id for id, job in self.__jobs.items() if job.finished_at is not None and now - job.finished_at > self.result_ttl]
+            for id in expired:
+                del self.__jobs[id]
+
+    def __enqueue(self, fn, args: tuple, timeout: float|None) -> detection_job:
+        self.__start_workers()
+        job = detection_job(secrets.token_urlsafe(12), fn, args, self.job_timeout if timeout is None else timeout)
+        try:
+            self.__queue.put_nowait(job)
+        except queue.Full:
+            job.fn = job.args = None
+            raise queue_full(self.retry_after())
+        return job
+
+    #
+    # queues fn(*args) and returns its job right away to be looked up with get, raises queue_full when there is no room
+    #
+    def submit(self, fn, *args, timeout: float|None = None) -> detection_job:
+        self.__forget_old_jobs()
+        job = self.__enqueue(fn, args, timeout)
+        with self.__lock:
+            self.__jobs[job.id] = job
+            while len(self.__jobs) > self.max_results:
+                self.__jobs.popitem(last=False)
+        return job
+
+    #
+    # queues and waits for the result without keeping the job, raises queue_full or job_timeout
+    #
+    def run(self, fn, *args, timeout: float|None = None):
+        return self.__enqueue(fn, args, timeout).result()
+
+    def get(self, job_id: str) -> detection_job|None:
+        with self.__lock:
+            return self.__jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        return max(1, round(self.__average_seconds * (self.__queue.qsize() + 1) / self.workers))
+
+    def stats(self) -> dict:
+        with self.__lock:
+            kept = len(self.__jobs)
+        return { "workers": self.workers, "queued": self.__queue.qsize(), "queue_size": self.__queue.maxsize, "kept_jobs": kept, "average_job_seconds": round(self.__average_seconds, 3) }
+
+executor = detection_executor(DETECTION_WORKERS, DETECTION_QUEUE_SIZE, DETECTION_JOB_TIMEOUT_SECONDS, DETECTION_RESULT_TTL_SECONDS, DETECTION_MAX_RESULTS)
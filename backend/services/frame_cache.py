@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from PIL import Image, ImageChops
+import threading
+import time
+import os
+
+# fraction of the downsampled frame that can change with the frame still counting as the same (0 turns the cache off)
+FRAME_CACHE_THRESHOLD = float(os.environ.get("THEIA_FRAME_CACHE_THRESHOLD", 0.03))
+# how much (0 - 255) a downsampled pixel has to change by to count as changed, below it is camera noise
+FRAME_PIXEL_TOLERANCE = 20
+# seconds a detection is reused for before the frame is run through the model again anyway
+FRAME_CACHE_TTL_SECONDS = float(os.environ.get("THEIA_FRAME_CACHE_TTL", 10))
+# how many sessions keep their last frame, the least recently seen session is dropped past it
+FRAME_CACHE_SIZE = int(os.environ.get("THEIA_FRAME_CACHE_SIZE", 256))
+# frames are compared as SIGNATURE_SIZE x SIGNATURE_SIZE grayscale
+SIGNATURE_SIZE = 16
+
+def frame_signature(image: Image.Image) -> Image.Image:
+    """Small grayscale copy of the frame to compare with, jpegs are decoded at a reduced size to get it"""
+    if image.format == "JPEG":
+        image.draft("L", (SIGNATURE_SIZE * 4, SIGNATURE_SIZE * 4))
+    return image.convert("L").resize((SIGNATURE_SIZE, SIGNATURE_SIZE), Image.BILINEAR)
+
+def frame_difference(a: Image.Image, b: Image.Image) -> float:
+    """Fraction of the signature pixels that changed, something new in one part of the frame counts even when the rest is the same"""
+    histogram = ImageChops.difference(a, b).histogram()
+    return sum(histogram[FRAME_PIXEL_TOLERANCE + 1:]) / (SIGNATURE_SIZE * SIGNATURE_SIZE)
+
+class cached_frame :
+    __slots__ = ("signature", "tier", "result", "stored_at")
+
+    def __init__(self, signature: Image.Image, tier: str|None, result, stored_at: float):
+        self.signature = signature
+        self.tier = tier
+        self.result = result
+        self.stored_at = stored_at
+
+#
+# remembers the last frame run through the model for each session (like a phone running auto-detect)
+# so a frame that hardly changed from it can reuse its detection instead of running the model again
+#
+class frame_similarity_cache :
+
+    def __init__(self, threshold: float, ttl: float, max_sessions: int):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.__frames = OrderedDict()
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0 and self.max_sessions > 0
+
+    #
+    # the result stored for the sessions last frame when signature is close enough to it, otherwise None
+    #
+    def lookup(self, session_key, signature: Image.Image, tier: str|None = None):
+        if not self.enabled:
+            return None
+        with self.__lock:
+            frame = self.__frames.get(session_key)
+            if frame is None or frame.tier != tier:
+                self.misses += 1
+                return None
+            if time.monotonic() - frame.stored_at > self.ttl:
+                del self.__frames[session_key]
+                self.expired += 1
+                self.misses += 1
+                return None
+
+        if frame_difference(frame.signature, signature) > self.threshold:
+            with self.__lock:
+                self.misses += 1
+            return None
+
+        with self.__lock:
+            self.hits += 1
+            if session_key in self.__frames:
+                self.__frames.move_to_end(session_key)
+        return frame.result
+
+    def store(self, session_key, signature: Image.Image, result, tier: str|None = None):
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.__frames[session_key] = cached_frame(signature, tier, result, time.monotonic())
+            self.__frames.move_to_end(session_key)
+            while len(self.__frames) > self.max_sessions:
+                self.__frames.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "sessions": len(self.__frames),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "threshold": self.threshold,
+            }
+
+frame_cache = frame_similarity_cache(FRAME_CACHE_THRESHOLD, FRAME_CACHE_TTL_SECONDS, FRAME_CACHE_SIZE)
@@ -0,0 +1,84 @@
+from collections import deque
+from boxes import box_area, non_max_suppression
+import threading
+import os
+
+#
+# objects to warn the user about before anything else -> label: priority, higher is said first
+#
+# only coco labels, the ones the default fast and accurate models can report: what is in the way on a sidewalk or a
+# crossing (vehicles, bicycles, animals, street furniture), a stop sign or traffic light also means a street is close
+# stairs, a roadblock, a hole or a barrier aren't coco labels, with the default models nothing warns about them, photos
+# of them are only warned about for the coco objects around them (a stop sign or a bench by a roadblock, nothing on stairs)
+# with a model trained on them (THEIA_ACCURATE_MODEL_ID / THEIA_FAST_MODEL_ID) add them to the table with
+# THEIA_HAZARD_PRIORITIES="stairs:100,roadblock:100,hole:100,barrier:90,traffic cone:90"
+# THEIA_HAZARD_PRIORITIES="label:priority,..." adds to or changes the table, a priority of 0 takes a label out of it
+#
+HAZARD_PRIORITIES = {
+    "car": 90, "bus": 90, "truck": 90, "train": 90, "motorcycle": 85, "bicycle": 80,
+    "traffic light": 70, "stop sign": 70,
+    "horse": 60, "cow": 60, "dog": 50, "skateboard": 50,
+    "fire hydrant": 40, "parking meter": 40, "bench": 30, "suitcase": 30, "potted plant": 20,
+}
+# lower than the descriptions threshold, a false warning is cheaper than a missed one
+HAZARD_SCORE_THRESHOLD = float(os.environ.get("THEIA_HAZARD_SCORE_THRESHOLD", 0.5))
+HAZARD_IOU_THRESHOLD = 0.7
+# how many kinds of hazard are said in one announcement, the rest are in the full description
+HAZARD_ANNOUNCE_LIMIT = 2
+# announcements the time to first hazard is averaged over
+HAZARD_LATENCY_WINDOW = 100
+
+def parse_priorities(setting: str) -> dict:
+    priorities = {}
+    for entry in setting.split(","):
+        if entry.strip():
+            label, priority = entry.rsplit(":", 1)
+            priorities[label.strip()] = int(priority)
+    return priorities
+
+def hazard_priorities() -> dict:
+    priorities = { **HAZARD_PRIORITIES, **parse_priorities(os.environ.get("THEIA_HAZARD_PRIORITIES", "")) }
+    return { label: priority for label, priority in priorities.items() if priority > 0 }
+
+#
+# picks the hazards out of predictions, most urgent first, and keeps how long they took to be announced
+#
+class hazard_table :
+
+    def __init__(self, priorities: dict, score_threshold: float, iou_threshold: float):
+        self.priorities = priorities
+        self.score_threshold = score_threshold
+        self.iou_threshold = iou_threshold
+        self.__latencies = deque(maxlen=HAZARD_LATENCY_WINDOW)
+        self.__lock = threading.Lock()
+        self.checked = 0
+        self.announced = 0
+
+    def priority(self, label: str) -> int:
+        return self.priorities.get(label, 0)
+
+    def find(self, predictions: list[dict]) -> list[dict]:
+        """The predictions that are hazards, highest priority first and the biggest (closest) first within one priority"""
+        found = [prediction for prediction in predictions if prediction["label"] in self.priorities and prediction["score"] >= self.score_threshold]
+        found = non_max_suppression(found, self.iou_threshold)
+        return sorted(found, key=lambda prediction: (self.priority(prediction["label"]), box_area(prediction["box"])), reverse=True)
+
+    def record(self, seconds: float|None):
+        """seconds from a photo arriving to its first hazard being announced, None when it had none"""
+        with self.__lock:
+            self.checked += 1
+            if seconds is not None:
+                self.announced += 1
+                self.__latencies.append(seconds)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            latencies = sorted(self.__latencies)
+            return {
+                "checked": self.checked,
+                "announced": self.announced,
+                "time_to_first_hazard_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+                "time_to_first_hazard_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+            }
+
+hazards = hazard_table(hazard_priorities(), HAZARD_SCORE_THRESHOLD, HAZARD_IOU_THRESHOLD)
@@ -0,0 +1,223 @@
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+from pathlib import Path
+from PIL import Image
+import subprocess
+import itertools
+import threading
+import atexit
+import socket
+import queue
+import time
+import sys
+import os
+
+# inference processes to run the models in, 0 runs them in the api process like before
+INFERENCE_PROCESSES = int(os.environ.get("THEIA_INFERENCE_PROCESSES", 0))
+# shared memory for each processes frames, bigger frames are scaled down to fit (24MB holds 4096x2048)
+INFERENCE_FRAME_BYTES = int(os.environ.get("THEIA_INFERENCE_FRAME_MB", 24)) * 1024 * 1024
+# seconds one frame can take before its process is treated as stuck and restarted
+INFERENCE_TIMEOUT_SECONDS = float(os.environ.get("THEIA_INFERENCE_TIMEOUT", 60))
+# seconds a process gets to start and load its models
+INFERENCE_START_TIMEOUT_SECONDS = 600
+WORKER_SCRIPT = Path(__file__).parent / "inference_worker.py"
+
+#
+# raised when a frame couldn't be run, the process is restarted if it was its fault
+#
+class inference_failed(Exception) :
+    pass
+
+def scale_predictions(predictions: list[dict], scale: float) -> list[dict]:
+    if scale == 1:
+        return predictions
+    return [{ **prediction, "box": { name: int(value * scale) for name, value in prediction["box"].items() } } for prediction in predictions]
+
+#
+# one inference process, its end of the socketpair and the shared memory frames are handed over in
+#
+class inference_worker :
+
+    def __init__(self, index: int, frame_bytes: int):
+        self.index = index
+        self.memory = shared_memory.SharedMemory(create=True, size=frame_bytes)
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.requests = 0
+        self.model_memory_mb = 0.0
+        self.__ids = itertools.count(1)
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        parent_socket, child_socket = socket.socketpair()
+        self.process = subprocess.Popen(
+            [sys.executable, str(WORKER_SCRIPT), str(child_socket.fileno()), self.memory.name],
+            pass_fds=(child_socket.fileno(),),
+        )
+        child_socket.close()
+        self.conn = Connection(parent_socket.detach())
+
+        deadline = time.monotonic() + INFERENCE_START_TIMEOUT_SECONDS
+        while not self.conn.poll(1):
+            if not self.alive or time.monotonic() > deadline:
+                self.stop()
+                raise inference_failed(f"inference process {self.index} didn't start")
+        ready, pid, self.model_memory_mb = self.conn.recv()
+        self.ready = True
+
+    def stop(self):
+        self.ready = False
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.alive:
+            self.process.kill()
+        if self.process is not None:
+            self.process.wait()
+
+    def predict(self, image: Image.Image, tier: str|None, timeout: float) -> list[dict]:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        # frames too big for the shared memory are sent smaller and their boxes scaled back up
+        scale = 1.0
+        if image.width * image.height * 3 > self.memory.size:
+            scale = (image.width * image.height * 3 / self.memory.size) ** 0.5
+            image = image.resize((int(image.width / scale), int(image.height / scale)), Image.BILINEAR)
+
+        request_id = next(self.__ids)
+        width, height = image.size
+        self.memory.buf[:width * height * 3] = image.tobytes()
+        try:
+            self.conn.send((request_id, tier, width, height))
+            if not self.conn.poll(timeout):
+                raise inference_failed(f"inference process {self.index} timed out")
+            reply_id, status, result = self.conn.recv()
+        except EOFError:
+            raise inference_failed(f"inference process {self.index} stopped")
+        except OSError as e:
+            raise inference_failed(f"inference process {self.index} stopped: {e}")
+        self.requests += 1
+
+        if reply_id != request_id:
+            raise inference_failed(f"inference process {self.index} answered the wrong frame")
+        if status != "ok":
+            raise RuntimeError(result)
+        return scale_predictions(result, scale)
+
+    def close(self):
+        self.stop()
+        self.memory.close()
+        self.memory.unlink()
+
+#
+# runs the models in separate processes so inference doesn't compete with the api for the gil
+# and a crash in it doesn't take the api down
+#
+# each process has a shared memory buffer the decoded frame is written into, only the frames size and the
+# predictions go over its socket, a process that crashes or gets stuck is restarted in the background
+#
+# any process can be handed a frame of any tier, so each one loads every tiers model: the models take
+# processes times the memory they take in the api process (model_memory_mb in status adds them up)
+#
+class inference_pool :
+
+    def __init__(self, processes: int, frame_bytes: int, timeout: float):
+        self.processes = processes
+        self.frame_bytes = frame_bytes
+        self.timeout = timeout
+        self.__workers = []
+        self.__idle = queue.Queue()
+        self.__lock = threading.Lock()
+        # sends the frames of predict_many, one thread per process is enough to keep them all busy
+        self.__senders = ThreadPoolExecutor(max_workers=processes, thread_name_prefix="inference-send")
+        self.restarts = 0
+        self.failures = 0
+
+    def start(self):
+        """Starts every process in the background, predict waits for the first one to be ready"""
+        with self.__lock:
+            if self.__workers:
+                return
+            self.__workers = [inference_worker(index, self.frame_bytes) for index in range(self.processes)]
+            atexit.register(self.close)
+        for worker in self.__workers:
+            self.__start_in_background(worker)
+
+    def __start_in_background(self, worker: inference_worker):
+        def start():
+            try:
+                worker.start()
+                self.__idle.put(worker)
+            except inference_failed as e:
+                print(f"Warning: {e}, trying again")
+                time.sleep(5)
+                self.__restart(worker)
+        threading.Thread(target=start, name=f"inference-start-{worker.index}", daemon=True).start()
+
+    def __restart(self, worker: inference_worker):
+        worker.stop()
+        with self.__lock:
+            self.restarts += 1
+        self.__start_in_background(worker)
+
+    def predict(self, image: Image.Image, tier: str|None = None) -> list[dict]:
+        self.start()
+        try:
+            worker = self.__idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise inference_failed("no inference process was free")
+
+        if not worker.alive:
+            self.__restart(worker)
+            raise inference_failed(f"inference process {worker.index} had stopped")
+        try:
+            predictions = worker.predict(image, tier, self.timeout)
+        except inference_failed:
+            with self.__lock:
+                self.failures += 1
+            self.__restart(worker)
+            raise
+        except Exception:
+            self.__idle.put(worker)
+            raise
+        self.__idle.put(worker)
+        return predictions
+
+    def predict_many(self, images: list[Image.Image], tier: str|None = None) -> list[list[dict]]:
+        """The predictions of each image, the images are sent to the idle processes at the same time instead of one after another"""
+        if len(images) == 1:
+            return [self.predict(images[0], tier)]
+        futures = [self.__senders.submit(self.predict, image, tier) for image in images]
+        return [future.result() for future in futures]
+
+    def status(self) -> dict:
+        with self.__lock:
+            workers = list(self.__workers)
+        ready = sum(worker.ready for worker in workers)
+        if not workers:
+            state = "cold"
+        else:
+            state = "ready" if ready == len(workers) else "loading"
+        return {
+            "state": state,
+            "processes": len(workers),
+            "ready": ready,
+            "idle": self.__idle.qsize(),
+            "requests": sum(worker.requests for worker in workers),
+            "model_memory_mb": round(sum(worker.model_memory_mb for worker in workers if worker.ready), 1),
+            "restarts": self.restarts,
+            "failures": self.failures,
+        }
+
+    def close(self):
+        with self.__lock:
+            workers, self.__workers = self.__workers, []
+        for worker in workers:
+            worker.close()
+
+pool = inference_pool(INFERENCE_PROCESSES, INFERENCE_FRAME_BYTES, INFERENCE_TIMEOUT_SECONDS) if INFERENCE_PROCESSES > 0 else None
@@ -0,0 +1,58 @@
+#
+# one inference process of the inference_pool, started by it as -> python services/inference_worker.py <fd> <shared memory name>
+#
+# fd: this ends socket of a socketpair with the api process, messages are pickled tuples
+#   -> ("ready", pid, model_memory_mb) once the models are loaded, model_memory_mb is the registrys estimate of their weights
+#   <- (request_id, tier, width, height) when a width x height rgb frame has been written to the shared memory
+#   -> (request_id, "ok", predictions) or (request_id, "error", message)
+#
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+import os
+import sys
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    memory = shared_memory.SharedMemory(name=name)
+    # the api process owns the memory, without this the resource tracker would unlink it when this process exits
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
+
+def main():
+    fd, memory_name = int(sys.argv[1]), sys.argv[2]
+    # this process runs the models itself, one frame at a time
+    os.environ["THEIA_INFERENCE_PROCESSES"] = "0"
+    os.environ["THEIA_DETECTION_BATCH_SIZE"] = "1"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from PIL import Image
+    import simple_detection
+
+    conn = Connection(fd)
+    memory = attach_shared_memory(memory_name)
+    # every process serves every tier so each loads all of them, the pool holds processes x the tiers models
+    # (THEIA_INFERENCE_PROCESSES=2 with the default tiers is two yolos-tiny and two detr-resnet-50)
+    simple_detection.warm_up()
+    conn.send(("ready", os.getpid(), simple_detection.registry.stats()["memory_mb"]))
+
+    while True:
+        try:
+            request_id, tier, width, height = conn.recv()
+        except EOFError:
+            break
+
+        # the rgb frame is copied once out of the shared memory into the image (pillow only maps 4 byte modes),
+        # the socket only carried its size
+        pixels = memory.buf[:width * height * 3]
+        try:
+            frame = Image.frombuffer("RGB", (width, height), pixels, "raw", "RGB", 0, 1)
+            conn.send((request_id, "ok", simple_detection.predict(frame, tier)))
+        except Exception as e:
+            conn.send((request_id, "error", f"{type(e).__name__}: {e}"))
+        finally:
+            frame = None
+            pixels.release()
+
+    memory.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from detection_backends import create_backend
+import threading
+import sys
+import os
+
+#
+# the detection models a request can ask for by tier
+#   fast -> small model for the auto-detect loop
+#   accurate -> the full model for photos the user takes on purpose
+#
+# image_size is the shortest edge images are resized to before the model (None keeps the models default)
+#
+MODEL_TIERS = {
+    "fast": {
+        "model_id": os.environ.get("THEIA_FAST_MODEL_ID", "hustvl/yolos-tiny"),
+        "image_size": int(os.environ["THEIA_FAST_MODEL_SIZE"]) if os.environ.get("THEIA_FAST_MODEL_SIZE") else None,
+    },
+    "accurate": {
+        "model_id": os.environ.get("THEIA_ACCURATE_MODEL_ID", "facebook/detr-resnet-50"),
+        "image_size": int(os.environ["THEIA_ACCURATE_MODEL_SIZE"]) if os.environ.get("THEIA_ACCURATE_MODEL_SIZE") else None,
+    },
+}
+DEFAULT_TIER = "accurate"
+# how many models are kept loaded at once (a count, a tiny yolos counts the same as detr), the least recently used is dropped to make room
+MODEL_REGISTRY_SIZE = int(os.environ.get("THEIA_MODEL_REGISTRY_SIZE", len(MODEL_TIERS)))
+# megabytes of weights (each backends memory_bytes estimate) the loaded models can add up to, past it the least recently
+# used are dropped once a model has loaded and its size is known, the one just loaded is always kept (0 only bounds the count)
+MODEL_REGISTRY_MEMORY_BYTES = int(float(os.environ.get("THEIA_MODEL_REGISTRY_MB", 1024)) * 1024 * 1024)
+# how many inferences can run on one model at the same time, a concurrency limit over one copy of the model, not copies of it
+MODEL_CONCURRENCY = int(os.environ.get("THEIA_MODEL_CONCURRENCY", 1))
+# threads torch uses for one operation, torch has a single setting for the whole process that every running inference
+# follows (they all share one intra op pool), by default the cores are split by the concurrency so they don't oversubscribe them
+MODEL_THREADS = int(os.environ.get("THEIA_MODEL_THREADS", max(1, (os.cpu_count() or 1) // MODEL_CONCURRENCY)))
+
+def set_torch_threads(threads: int):
+    """Sets torchs thread count for the whole process, once a torch backend has imported it"""
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+
+#
+# one loaded model handed out to at most concurrency callers at a time
+#
+# the model is loaded by the first checkout (later ones wait for that load instead of loading it again) and there
+# is only ever one copy of it, torch and onnxruntime inference can run on the same weights from several threads
+# so concurrency only limits how many inferences run at once, the running ones share torchs intra op threads
+#
+# threads is set once when the model is loaded, for torch backends it is the thread count of the whole process
+# (the last model loaded wins) and onnx sessions get it as their own intra op threads
+#
+#   model = holder.checkout()    ...    holder.checkin(model)
+#   with holder.use() as model:  ...
+#
+class model_holder :
+
+    def __init__(self, load, concurrency: int, threads: int):
+        self.concurrency = max(1, concurrency)
+        self.threads = max(1, threads)
+        self.__load = load
+        self.__model = None
+        self.__load_lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(self.concurrency)
+        self.__stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.in_use = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.__model is not None
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated bytes of the models weights, 0 until it is loaded"""
+        return getattr(self.__model, "memory_bytes", 0)
+
+    def model(self):
+        """The model, loading it if this is the first time it is asked for"""
+        if self.__model is None:
+            with self.__load_lock:
+                if self.__model is None:
+                    self.__model = self.__load()
+                    set_torch_threads(self.threads)
+        return self.__model
+
+    #
+    # waits for a free slot (up to timeout seconds, None waits as long as it takes) and returns the model
+    # raises TimeoutError when none was free in time
+    #
+    def checkout(self, timeout: float|None = None):
+        waited = not self.__slots.acquire(blocking=False)
+        if waited and not self.__slots.acquire(timeout=timeout):
+            raise TimeoutError("no free model slot")
+        try:
+            model = self.model()
+        except Exception:
+            self.__slots.release()
+            raise
+
+        with self.__stats_lock:
+            self.checkouts += 1
+            self.waits += waited
+            self.in_use += 1
+        return model
+
+    def checkin(self, model):
+        with self.__stats_lock:
+            self.in_use -= 1
+        self.__slots.release()
+
+    @contextmanager
+    def use(self, timeout: float|None = None):
+        model = self.checkout(timeout)
+        try:
+            yield model
+        finally:
+            self.checkin(model)
+
+    def stats(self) -> dict:
+        with self.__stats_lock:
+            return { "concurrency": self.concurrency, "threads": self.threads, "in_use": self.in_use, "checkouts": self.checkouts, "waits": self.waits }
+
+#
+# keeps a model_holder for each (backend, model, image size) so each is loaded once and shared between every
+# request asking for it, requests for models that are already loaded never wait on another model loading
+#
+# bounded by the number of models and by the estimated bytes of their weights (max_bytes, 0 for no bound),
+# the least recently used models are dropped past either
+#
+class model_registry :
+
+    def __init__(self, backend: str, max_models: int, concurrency: int = 1, threads: int = 1, max_bytes: int = 0):
+        self.backend = backend
+        self.max_models = max(1, max_models)
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.threads = threads
+        self.__holders = OrderedDict()
+        self.__lock = threading.Lock()
+        self.evictions = 0
+
+    @staticmethod
+    def tier(name: str|None) -> dict:
+        name = name or DEFAULT_TIER
+        if name not in MODEL_TIERS:
+            raise ValueError(f"Unknown model tier {name}, expected one of {', '.join(MODEL_TIERS)}")
+        return MODEL_TIERS[name]
+
+    def key(self, tier: str|None) -> tuple:
+        config = self.tier(tier)
+        return (self.backend, config["model_id"], config["image_size"])
+
+    def holder(self, tier: str|None = None) -> model_holder:
+        key = self.key(tier)
+        with self.__lock:
+            holder = self.__holders.get(key)
+            if holder is None:
+                backend, model_id, image_size = key
+                holder = model_holder(lambda: self.__loaded(key, create_backend(backend, model_id, image_size, self.threads)), self.concurrency, self.threads)
+                self.__holders[key] = holder
+                # an evicted model is freed once the requests still using it are done with it
+                while len(self.__holders) > self.max_models:
+                    self.__holders.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self.__holders.move_to_end(key)
+            return holder
+
+    def __loaded(self, key: tuple, model):
+        """Drops the least recently used other models while the loaded ones weigh more than max_bytes"""
+        if self.max_bytes <= 0:
+            return model
+        with self.__lock:
+            total = getattr(model, "memory_bytes", 0) + sum(holder.memory_bytes for other, holder in self.__holders.items() if other != key)
+            for other, holder in list(self.__holders.items()):
+                if total <= self.max_bytes:
+                    break
+                if other != key and holder.loaded:
+                    total -= holder.memory_bytes
+                    del self.__holders[other]
+                    self.evictions += 1
+        return model
+
+    def get(self, tier: str|None = None):
+        """The tiers model without checking out a slot, for looking at it rather than running it"""
+        return self.holder(tier).model()
+
+    def checkout(self, tier: str|None = None, timeout: float|None = None):
+        """with registry.checkout(tier) as model: runs the tiers model once one of its slots is free"""
+        return self.holder(tier).use(timeout)
+
+    def is_loaded(self, tier: str|None = None) -> bool:
+        with self.__lock:
+            holder = self.__holders.get(self.key(tier))
+        return holder is not None and holder.loaded
+
+    def clear(self):
+        with self.__lock:
+            self.__holders.clear()
+
+    def stats(self) -> dict:
+        with self.__lock:
+            holders = list(self.__holders.items())
+        return {
+            "loaded": [model_id for (backend, model_id, image_size), holder in holders if holder.loaded],
+            "max_models": self.max_models,
+            "memory_mb": round(sum(holder.memory_bytes for key, holder in holders) / 1024 / 1024, 1),
+            "max_memory_mb": round(self.max_bytes / 1024 / 1024, 1),
+            "evictions": self.evictions,
+            "models": { model_id: holder.stats() for (backend, model_id, image_size), holder in holders },
+        }
@@ -0,0 +1,92 @@
+from PIL import Image
+import numpy as np
+import threading
+
+#
+# turns photos into the models pixel_values (and pixel_mask) the way the detr/yolos image processors do
+# but resizing and converting each photo once and writing the normalized pixels into a buffer reused between calls
+#
+#   resize: shortest edge to shortest_edge without the longest going past longest_edge
+#   normalize: (pixel * rescale_factor - mean) / std per channel, done as one multiply and add
+#   pad: photos in a batch are padded at the bottom/right to the biggest one, pixel_mask is 1 where the photo is
+#
+class image_preprocessor :
+
+    def __init__(self, shortest_edge: int, longest_edge: int|None, mean, std, rescale_factor: float = 1 / 255):
+        self.shortest_edge = shortest_edge
+        self.longest_edge = longest_edge
+        mean = np.asarray(mean, dtype=np.float32)
+        std = np.asarray(std, dtype=np.float32)
+        self.scale = (rescale_factor / std).reshape(3, 1, 1)
+        self.offset = (-mean / std).reshape(3, 1, 1)
+        # one set of buffers per thread, the batcher and each detection worker fill their own
+        self.__local = threading.local()
+
+    @classmethod
+    def from_processor(cls, processor):
+        """Reads the sizes and normalization from a transformers image processor"""
+        size = processor.size or {}
+        if "shortest_edge" in size:
+            shortest_edge, longest_edge = size["shortest_edge"], size.get("longest_edge")
+        else:
+            shortest_edge, longest_edge = min(size["height"], size["width"]), max(size["height"], size["width"])
+        return cls(shortest_edge, longest_edge, processor.image_mean, processor.image_std, processor.rescale_factor)
+
+    def output_size(self, width: int, height: int) -> tuple[int, int]:
+        """(width, height) a photo is resized to, the same as transformers get_size_with_aspect_ratio"""
+        size = self.shortest_edge
+        short, long = min(width, height), max(width, height)
+        raw_size = None
+        if self.longest_edge is not None and long / short * size > self.longest_edge:
+            raw_size = self.longest_edge * short / long
+            size = int(round(raw_size))
+        if short == size:
+            return width, height
+        if width < height:
+            return size, int((raw_size or size) * height / width)
+        return int((raw_size or size) * width / height), size
+
+    def resize(self, image: Image.Image) -> Image.Image:
+        """The photo as rgb at the models input size, converted and resized once"""
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        size = self.output_size(*image.size)
+        if size != image.size:
+            image = image.resize(size, Image.BILINEAR, reducing_gap=3.0)
+        return image
+
+    def __buffers(self, batch: int, height: int, width: int) -> tuple[np.ndarray, np.ndarray]:
+        # contiguous views over the front of flat buffers that only grow, so steady state calls allocate nothing
+        values_size = batch * 3 * height * width
+        mask_size = batch * height * width
+        local = self.__local
+        if getattr(local, "values", None) is None or local.values.size < values_size:
+            local.values = np.empty(values_size, dtype=np.float32)
+        if getattr(local, "mask", None) is None or local.mask.size < mask_size:
+            local.mask = np.empty(mask_size, dtype=np.int64)
+        return local.values[:values_size].reshape(batch, 3, height, width), local.mask[:mask_size].reshape(batch, height, width)
+
+    #
+    # returns { "pixel_values": float32 (batch, 3, h, w), "pixel_mask": int64 (batch, h, w) }
+    # both are views into this threads buffers, they are overwritten by the threads next call
+    #
+    def __call__(self, images: list) -> dict:
+        resized = [self.resize(image) for image in images]
+        height = max(image.height for image in resized)
+        width = max(image.width for image in resized)
+        pixel_values, pixel_mask = self.__buffers(len(resized), height, width)
+
+        for i, image in enumerate(resized):
+            h, w = image.height, image.width
+            pixels = np.asarray(image).transpose(2, 0, 1)
+            values = pixel_values[i, :, :h, :w]
+            np.multiply(pixels, self.scale, out=values)
+            values += self.offset
+
+            pixel_values[i, :, h:, :] = 0
+            pixel_values[i, :, :h, w:] = 0
+            pixel_mask[i, :h, :w] = 1
+            pixel_mask[i, h:, :] = 0
+            pixel_mask[i, :h, w:] = 0
+
+        return { "pixel_values": pixel_values, "pixel_mask": pixel_mask }
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from flask import g, session
+from services.database import database
+import threading
+import time
+import os
+
+# seconds a loaded principal can be reused by later requests (0 turns the cross request cache off)
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get("THEIA_PRINCIPAL_CACHE_TTL", 0))
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("THEIA_PRINCIPAL_CACHE_SIZE", 256))
+
+#
+# the logged in user with their user_type and caretaker/impaired pair loaded once
+#
+# impaired_user_id: the user themself if impaired otherwise the impaired user of the caretaker
+# caretaker_user_id: the user themself if caretaker otherwise the caretaker of the impaired user
+#
+class principal :
+    __slots__ = ("user_id", "user", "user_type", "impaired_user_id", "caretaker_user_id")
+
+    def __init__(self, user: dict):
+        self.user_id = user["id"]
+        self.user = user
+        self.user_type = user["user_type"]
+
+        if (self.user_type == 'impaired'):
+            self.impaired_user_id = self.user_id
+            self.caretaker_user_id = database.get_user_id_of_caretaker_if_session_user_is_their_impaired(self.user_id)
+        else:
+            self.caretaker_user_id = self.user_id
+            self.impaired_user_id = database.get_user_id_of_impaired_if_session_user_is_their_caretaker(self.user_id)
+
+    @property
+    def has_pair(self) -> bool:
+        return self.impaired_user_id is not None and self.caretaker_user_id is not None
+
+#
+# lru of principals by user id where entries expire after the ttl
+#
+class principal_cache :
+
+    def __init__(self, ttl: float, size: int):
+        self.ttl = ttl
+        self.size = size
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, user_id: int) -> principal|None:
+        if self.ttl <= 0:
+            return None
+        with self.__lock:
+            entry = self.__entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.__entries[user_id]
+                return None
+            self.__entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id: int, loaded: principal):
+        if self.ttl <= 0:
+            return
+        with self.__lock:
+            self.__entries[user_id] = (time.monotonic() + self.ttl, loaded)
+            self.__entries.move_to_end(user_id)
+            while len(self.__entries) > self.size:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, *user_ids: int|None):
+        with self.__lock:
+            for user_id in user_ids:
+                self.__entries.pop(user_id, None)
+
+cache = principal_cache(PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_SIZE)
+
+def load_principal(user_id: int) -> principal|None:
+    loaded = cache.get(user_id)
+    if loaded is None:
+        user_data = database.get_user(user_id)
+        if user_data is None:
+            return None
+        loaded = principal(user_data)
+        cache.put(user_id, loaded)
+    return loaded
+
+#
+# the sessions principal, only looked up the first time it is asked for in a request
+#
+def current_principal() -> principal|None:
+    if "principal" not in g:
+        user_id = session.get("user_id")
+        g.principal = None if user_id is None else load_principal(user_id)
+    return g.principal
+
+#
+# drops the cached principals of users whose data or pairing changed
+#
+def invalidate_principals(*user_ids: int|None):
+    cache.invalidate(*user_ids)
+    if "principal" in g and g.principal is not None and g.principal.user_id in user_ids:
+        g.pop("principal")
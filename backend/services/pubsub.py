@@ -0,0 +1,108 @@
+from collections import OrderedDict, deque
+import threading
+import weakref
+import time
+import os
+
+# how many recent events each channel keeps so subscribers can catch up without going to the db
+CHANNEL_HISTORY_SIZE = int(os.environ.get("THEIA_CHANNEL_HISTORY_SIZE", 100))
+# seconds a channel nobody is subscribed to is kept after its last event, for its history
+CHANNEL_IDLE_SECONDS = float(os.environ.get("THEIA_CHANNEL_IDLE_TTL", 300))
+
+#
+# in process pub/sub for one stream of ordered events (like the messages of one conversation)
+#
+# every event has a sequence number that only goes up, subscribers ask for everything after the last one they saw
+# waiting subscribers just sleep on the condition so idle ones cost nothing until something is published
+#
+class event_channel :
+
+    def __init__(self, history_size: int):
+        self.__condition = threading.Condition()
+        self.__events = deque(maxlen=history_size)
+        self.last_seq = 0
+
+    #
+    # events: list[tuple[seq:int, payload:any]] in seq order
+    #
+    def publish(self, events: list[tuple[int,any]]):
+        with self.__condition:
+            for seq, payload in events:
+                # publishers can finish out of order, history only keeps a gap free run
+                if self.__events and seq != self.__events[-1][0] + 1:
+                    self.__events.clear()
+                self.__events.append((seq, payload))
+                self.last_seq = max(self.last_seq, seq)
+            self.__condition.notify_all()
+
+    #
+    # returns the payloads after since when history has all of them, otherwise None so the caller reads the db
+    #
+    def events_since(self, since: int) -> list|None:
+        with self.__condition:
+            return self.__events_since(since)
+
+    #
+    # blocks until there is something after since or the timeout runs out
+    #
+    # returns the payloads like events_since, [] on timeout
+    #
+    def wait_for(self, since: int, timeout: float) -> list|None:
+        with self.__condition:
+            if not self.__condition.wait_for(lambda: self.last_seq > since, timeout):
+                return []
+            return self.__events_since(since)
+
+    def __events_since(self, since: int) -> list|None:
+        if since >= self.last_seq:
+            return []
+        if not self.__events or self.__events[0][0] > since + 1 or self.__events[-1][0] != self.last_seq:
+            return None
+        return [payload for seq, payload in self.__events if seq > since]
+
+#
+# channels by key, made the first time they are asked for
+#
+# a channel lives as long as a subscriber holds it (a long poll or a stream waiting on it) or it had an event in the
+# last idle_seconds, after that it is dropped so there isn't one left behind for every conversation and trip there
+# ever was, the next subscriber gets a new one and catches up from the db like after a restart
+#
+class event_broker :
+
+    def __init__(self, history_size: int, idle_seconds: float):
+        self.history_size = history_size
+        self.idle_seconds = idle_seconds
+        self.__channels = weakref.WeakValueDictionary()
+        # key -> (channel, time.monotonic() of its last event), oldest first, keeps recently used channels alive
+        self.__recent = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def channel(self, key) -> event_channel:
+        with self.__lock:
+            channel = self.__channels.get(key)
+            if channel is None:
+                channel = self.__channels[key] = event_channel(self.history_size)
+            return channel
+
+    def publish(self, key, events: list[tuple[int,any]]):
+        channel = self.channel(key)
+        with self.__lock:
+            self.__recent[key] = (channel, time.monotonic())
+            self.__recent.move_to_end(key)
+            self.__expire()
+        channel.publish(events)
+
+    def __expire(self):
+        now = time.monotonic()
+        while self.__recent:
+            channel, published_at = next(iter(self.__recent.values()))
+            if now - published_at <= self.idle_seconds:
+                break
+            self.__recent.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            self.__expire()
+            return { "channels": len(self.__channels), "recent": len(self.__recent) }
+
+broker = event_broker(CHANNEL_HISTORY_SIZE, CHANNEL_IDLE_SECONDS)
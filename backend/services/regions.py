@@ -0,0 +1,81 @@
+from boxes import non_max_suppression
+import os
+
+#
+# the parts of a photo that are run through the model, a request can ask for
+#   full -> the whole photo (the default)
+#   roi -> only the walking corridor, the part of the photo ahead of the users feet, in more detail for the same cost
+#   tiles -> the photo split into overlapping tiles run through the model together (one batch, or one tile per
+#            inference process at the same time), small far away obstacles get many more pixels, boxes found twice
+#            where tiles overlap are merged
+#
+REGIONS = ("full", "roi", "tiles")
+
+def parse_fractions(setting: str) -> tuple[float, ...]:
+    return tuple(float(value) for value in setting.split(","))
+
+# left, top, right, bottom of the walking corridor as fractions of the photo
+ROI_CORRIDOR = parse_fractions(os.environ.get("THEIA_ROI_CORRIDOR", "0.2,0.3,0.8,1.0"))
+# columns x rows of tiles and how much (fraction of a tile) neighbouring tiles overlap so objects on a seam are whole in one
+TILE_GRID = tuple(int(value) for value in os.environ.get("THEIA_TILE_GRID", "2x2").split("x"))
+TILE_OVERLAP = float(os.environ.get("THEIA_TILE_OVERLAP", 0.2))
+# same label boxes of neighbouring tiles overlapping more than this are the same object
+TILE_IOU_THRESHOLD = 0.5
+
+def corridor_box(image_size: tuple[int, int], corridor: tuple[float, ...] = ROI_CORRIDOR) -> tuple[int, int, int, int]:
+    width, height = image_size
+    left, top, right, bottom = corridor
+    return (round(left * width), round(top * height), round(right * width), round(bottom * height))
+
+def tile_boxes(image_size: tuple[int, int], grid: tuple[int, int] = TILE_GRID, overlap: float = TILE_OVERLAP) -> list[tuple[int, int, int, int]]:
+    """(left, top, right, bottom) of each tile, row by row"""
+    width, height = image_size
+    columns, rows = grid
+    # tiles of this size overlapping by overlap of a tile cover the photo exactly
+    tile_width = width / (columns - (columns - 1) * overlap)
+    tile_height = height / (rows - (rows - 1) * overlap)
+    boxes = []
+    for row in range(rows):
+        top = row * tile_height * (1 - overlap)
+        for column in range(columns):
+            left = column * tile_width * (1 - overlap)
+            boxes.append((round(left), round(top), min(width, round(left + tile_width)), min(height, round(top + tile_height))))
+    return boxes
+
+def region_boxes(region: str, image_size: tuple[int, int]) -> list[tuple[int, int, int, int]]:
+    """The crops of the photo run through the model for region"""
+    if region not in REGIONS:
+        raise ValueError(f"Unknown region {region}, expected one of {', '.join(REGIONS)}")
+    if region == "roi":
+        return [corridor_box(image_size)]
+    if region == "tiles":
+        return tile_boxes(image_size)
+    return [(0, 0, image_size[0], image_size[1])]
+
+def region_scale(region: str) -> float:
+    """How many times bigger the photo has to be decoded for its crops to still fill the models input"""
+    if region == "roi":
+        left, top, right, bottom = ROI_CORRIDOR
+        return 1 / min(right - left, bottom - top)
+    if region == "tiles":
+        tiles = max(TILE_GRID)
+        return tiles - (tiles - 1) * TILE_OVERLAP
+    return 1.0
+
+def offset_predictions(predictions: list[dict], left: int, top: int) -> list[dict]:
+    """Predictions made on a crop moved back to where the crop is in the photo"""
+    if left == 0 and top == 0:
+        return predictions
+    return [{ **prediction, "box": {
+        "xmin": prediction["box"]["xmin"] + left, "ymin": prediction["box"]["ymin"] + top,
+        "xmax": prediction["box"]["xmax"] + left, "ymax": prediction["box"]["ymax"] + top,
+    } } for prediction in predictions]
+
+def merge_regions(predictions_per_box: list[list[dict]], boxes: list[tuple[int, int, int, int]]) -> list[dict]:
+    """The predictions of every crop in photo coordinates, duplicates of an object seen by two tiles merged"""
+    if len(boxes) == 1:
+        return offset_predictions(predictions_per_box[0], boxes[0][0], boxes[0][1])
+    merged = []
+    for predictions, (left, top, right, bottom) in zip(predictions_per_box, boxes):
+        merged.extend(offset_predictions(predictions, left, top))
+    return non_max_suppression(merged, TILE_IOU_THRESHOLD)
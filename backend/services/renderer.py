@@ -0,0 +1,104 @@
+from PIL import Image, ImageDraw, ImageFont
+import threading
+import io
+import os
+
+# format result images are saved and sent in when none is asked for
+RESULT_IMAGE_FORMAT = os.environ.get("THEIA_RESULT_IMAGE_FORMAT", "jpeg")
+RESULT_IMAGE_QUALITY = int(os.environ.get("THEIA_RESULT_IMAGE_QUALITY", 85))
+# format -> (pillow format, mimetype, file suffix)
+RESULT_IMAGE_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "png": ("PNG", "image/png", ".png"),
+}
+BOX_COLOR = (0, 200, 0)
+LABEL_COLOR = (220, 0, 0)
+LABEL_BACKGROUND = (255, 255, 255)
+
+def label_font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # pillow before 10.1 only has the small bitmap font
+        return ImageFont.load_default()
+
+def draw_predictions(image: Image.Image, predictions: list[dict], scale: float = 1.0) -> Image.Image:
+    """A copy of image with each prediction boxed and labelled, boxes are multiplied by scale to fit the image"""
+    result = image.convert("RGB") if image.mode != "RGB" else image.copy()
+    draw = ImageDraw.Draw(result)
+    # lines and labels grow with the photo so they are as readable on a phone photo as a thumbnail
+    short_edge = min(result.size)
+    line_width = max(2, round(short_edge / 300))
+    font = label_font(max(12, round(short_edge / 40)))
+
+    for prediction in predictions:
+        box = prediction['box']
+        xmin, ymin = box['xmin'] * scale, box['ymin'] * scale
+        xmax, ymax = box['xmax'] * scale, box['ymax'] * scale
+        draw.rectangle((xmin, ymin, xmax, ymax), outline=BOX_COLOR, width=line_width)
+
+        text = f"{prediction['label']}: {round(prediction['score'] * 100, 1)}%"
+        left, top, right, bottom = draw.textbbox((xmin, ymin), text, font=font)
+        # above the box when there is room, otherwise just inside it
+        offset = bottom - top + line_width if ymin - (bottom - top) - line_width >= 0 else 0
+        draw.rectangle((left, top - offset, right, bottom - offset), fill=LABEL_BACKGROUND)
+        draw.text((xmin, ymin - offset), text, fill=LABEL_COLOR, font=font)
+
+    return result
+
+def encode_image(image: Image.Image, format: str = RESULT_IMAGE_FORMAT, quality: int = RESULT_IMAGE_QUALITY) -> bytes:
+    if format not in RESULT_IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format {format}, expected one of {', '.join(RESULT_IMAGE_FORMATS)}")
+    buffer = io.BytesIO()
+    if format == "png":
+        image.save(buffer, "PNG")
+    elif format == "webp":
+        # method 2 is about twice as fast as the default 4 for a few percent bigger files
+        image.save(buffer, "WEBP", quality=quality, method=2)
+    else:
+        image.save(buffer, RESULT_IMAGE_FORMATS[format][0], quality=quality)
+    return buffer.getvalue()
+
+#
+# a detection result image that is only drawn (and encoded) the first time something asks for it
+#
+# source: the photo as a PIL image or its uploaded bytes (decoded again at full size when drawn)
+# predicted_size: (width, height) of the image the predictions were made on, when the photo was decoded
+# smaller for the model the boxes are scaled back up to the full photo
+#
+class result_image :
+
+    def __init__(self, source, predictions: list[dict], predicted_size: tuple[int, int]|None = None):
+        self.__source = source
+        self.predictions = predictions
+        self.predicted_size = predicted_size
+        self.__image = None
+        self.__encoded = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def image(self) -> Image.Image:
+        with self.__lock:
+            if self.__image is None:
+                source = self.__source
+                if not isinstance(source, Image.Image):
+                    source = Image.open(io.BytesIO(source))
+                scale = source.width / self.predicted_size[0] if self.predicted_size else 1.0
+                self.__image = draw_predictions(source, self.predictions, scale)
+                # the drawn image is all that is needed from here on
+                self.__source = None
+            return self.__image
+
+    def encode(self, format: str = RESULT_IMAGE_FORMAT, quality: int = RESULT_IMAGE_QUALITY) -> bytes:
+        key = (format, quality)
+        if key not in self.__encoded:
+            self.__encoded[key] = encode_image(self.image, format, quality)
+        return self.__encoded[key]
+
+    def save(self, path, format: str = RESULT_IMAGE_FORMAT, quality: int = RESULT_IMAGE_QUALITY):
+        with open(path, "wb") as file:
+            file.write(self.encode(format, quality))
+
+    def show(self):
+        self.image.show()
@@ -1,37 +1,158 @@
 import warnings
+import io
 import os
 from pathlib import Path
-from transformers import pipeline
-import transformers.utils.logging as logging
 
-# Set matplotlib backend before importing matplotlib
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-
-from helper import render_results_in_image, summarize_predictions_natural_language
+# transformers, torch and pyttsx3 (in tts_service) are imported where they are first used
+# so the api can start without paying for them until a camera endpoint needs them
+from helper import summarize_predictions_natural_language
+from summarizer import summarizer
+from hazards import hazards
+from regions import region_boxes, region_scale, merge_regions
+from renderer import result_image, RESULT_IMAGE_FORMAT, RESULT_IMAGE_FORMATS
+from detection_batcher import micro_batcher
+from tts_service import tts
+from model_registry import model_registry, MODEL_TIERS, DEFAULT_TIER, MODEL_REGISTRY_SIZE, MODEL_REGISTRY_MEMORY_BYTES, MODEL_CONCURRENCY, MODEL_THREADS
+from inference_pool import pool as inference_pool
 from PIL import Image
-import pyttsx3
+import threading
 import time
 
 warnings.filterwarnings("ignore")
 os.environ['PYTHONWARNINGS'] = 'ignore'
-logging.set_verbosity_error()
 
-_od_pipe = None
+# which inference backend runs the models: torch, pipeline, quantized or onnx (see detection_backends)
+DETECTION_BACKEND = os.environ.get("THEIA_DETECTION_BACKEND", "torch")
+DETECTION_MODEL_ID = MODEL_TIERS[DEFAULT_TIER]["model_id"]
 
-def load_model():
-    global _od_pipe
-    if _od_pipe is None:
-        _od_pipe = pipeline("object-detection", "facebook/detr-resnet-50")
-    return _od_pipe
+# frames arriving within the wait are run through the model together (a batch size of 1 turns batching off)
+DETECTION_BATCH_SIZE = int(os.environ.get("THEIA_DETECTION_BATCH_SIZE", 4))
+DETECTION_BATCH_WAIT_SECONDS = float(os.environ.get("THEIA_DETECTION_BATCH_WAIT_MS", 25)) / 1000
 
-def init_tts():
+# the models of each tier (see model_registry) are loaded once and run by at most MODEL_CONCURRENCY inferences at a time
+registry = model_registry(DETECTION_BACKEND, MODEL_REGISTRY_SIZE, MODEL_CONCURRENCY, MODEL_THREADS, MODEL_REGISTRY_MEMORY_BYTES)
+_batchers = {}
+_batcher_lock = threading.Lock()
+_input_sizes = {}
+
+# cold -> loading -> ready (or failed), reported by /api/health/ready
+_model_state = "cold"
+_model_error = None
+
+def load_model(tier=None):
+    """The model for tier (fast or accurate, accurate when not given), loaded the first time it is asked for"""
+    if not registry.is_loaded(tier):
+        import transformers.utils.logging as logging
+        logging.set_verbosity_error()
+    
+    # called just like the transformers pipeline whichever backend it is
+    return registry.get(tier)
+
+def warm_up():
+    """Loads every tiers model and runs one dummy inference through each so the first real request doesn't pay for either"""
+    global _model_state, _model_error
+    if inference_pool is not None:
+        # each inference process warms its own models up once it has started
+        inference_pool.start()
+        return
+    _model_state = "loading"
     try:
-        test_tts = pyttsx3.init()
-        del test_tts
-        return True
-    except:
-        return False
+        start = time.perf_counter()
+        for tier in MODEL_TIERS:
+            load_model(tier)
+            with registry.checkout(tier) as od_pipe:
+                od_pipe(Image.new("RGB", (640, 480), (127, 127, 127)))
+        _model_state = "ready"
+        print(f"Detection models warmed up in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        _model_state = "failed"
+        _model_error = str(e)
+        print(f"Detection model warm up failed: {e}")
+
+def start_warm_up():
+    """Warms up the models in a background thread so startup isn't blocked"""
+    if inference_pool is not None:
+        inference_pool.start()
+        return
+    if _model_state in ("cold", "failed"):
+        threading.Thread(target=warm_up, name="detection-warm-up", daemon=True).start()
+
+def model_status():
+    """State of the detection models, models already loaded by requests count as ready"""
+    if inference_pool is not None:
+        status = inference_pool.status()
+        return { "state": status["state"], "error": None, "models": status }
+    if _model_state == "ready" or (_model_state != "loading" and all(registry.is_loaded(tier) for tier in MODEL_TIERS)):
+        return { "state": "ready", "error": None, "models": registry.stats() }
+    return { "state": _model_state, "error": _model_error, "models": registry.stats() }
+
+def input_sizes():
+    """Size each tiers model resizes photos to, clients can downscale to it before uploading"""
+    from detection_backends import image_processor
+    from preprocessing import image_preprocessor
+    for tier, config in MODEL_TIERS.items():
+        if tier in _input_sizes:
+            continue
+        if registry.is_loaded(tier):
+            preprocessor = registry.get(tier).preprocessor
+        else:
+            # only the processors config is read, the model isn't loaded for it
+            preprocessor = image_preprocessor.from_processor(image_processor(config["model_id"], config["image_size"]))
+        _input_sizes[tier] = { "model_id": config["model_id"], "shortest_edge": preprocessor.shortest_edge, "longest_edge": preprocessor.longest_edge }
+    return _input_sizes
+
+def model_input_size(tier=None):
+    """Shortest edge the tiers model resizes photos to, without loading the model into this process when it runs elsewhere"""
+    if inference_pool is None:
+        return load_model(tier).input_size
+    return input_sizes()[tier or DEFAULT_TIER]["shortest_edge"]
+
+def predict_batch(images, tier=None):
+    """Runs a list of images through the tiers model in one call, returns the predictions for each image"""
+    load_model(tier)
+    with registry.checkout(tier) as od_pipe:
+        return od_pipe(images, batch_size=len(images))
+
+def get_batcher(tier=None):
+    tier = tier or DEFAULT_TIER
+    with _batcher_lock:
+        if tier not in _batchers:
+            _batchers[tier] = micro_batcher(lambda images: predict_batch(images, tier), DETECTION_BATCH_SIZE, DETECTION_BATCH_WAIT_SECONDS, MODEL_CONCURRENCY)
+        return _batchers[tier]
+
+def predict(image, tier=None):
+    """Predictions for one image, batched with any other images being detected with the same tier at the same time"""
+    if inference_pool is not None:
+        return inference_pool.predict(image, tier)
+    if DETECTION_BATCH_SIZE <= 1:
+        load_model(tier)
+        with registry.checkout(tier) as od_pipe:
+            return od_pipe(image)
+    return get_batcher(tier).predict(image)
+
+def predict_region(image, tier=None, region="full"):
+    """Predictions for only the region of image (full, roi or tiles, see regions.py), in the coordinates of the whole image"""
+    if region == "full":
+        return predict(image, tier)
+    boxes = region_boxes(region, image.size)
+    crops = [image.crop(box) for box in boxes]
+    if len(crops) == 1:
+        predictions_per_box = [predict(crops[0], tier)]
+    elif inference_pool is not None:
+        # the tiles go to the processes in parallel
+        predictions_per_box = inference_pool.predict_many(crops, tier)
+    else:
+        # the tiles of one photo are one batch
+        predictions_per_box = predict_batch(crops, tier)
+    return merge_regions(predictions_per_box, boxes)
+
+def decode_for_region(photo_bytes, tier=None, region="full"):
+    """Decodes the photo just big enough for the crops of region to fill the models input"""
+    return decode_photo(photo_bytes, round(model_input_size(tier) * region_scale(region)))
+
+def init_tts():
+    """Starts the speech worker, False when there is no speech engine"""
+    return tts.available()
 
 def get_latest_photo():
     # Use relative path from services folder to data folder
@@ -45,68 +166,97 @@ def get_latest_photo():
     return None
 
 def detect_and_save(image_path):
-    od_pipe = load_model()
-    
     # Load and process image
     image = Image.open(image_path)
-    predictions = od_pipe(image)
+    predictions = predict(image)
     
-    # Create result image with bounding boxes
-    result_img = render_results_in_image(image, predictions)
+    # Hazards are spoken before anything is drawn or described
+    announce_hazards(predictions, image.size)
+    
+    # Result image with bounding boxes, drawn when it is saved below
+    result_img = result_image(image, predictions)
     
     # Create description
-    description = summarize_predictions_natural_language(predictions)
+    description = summarize_predictions_natural_language(predictions, image.size)
     
     # Save result - use absolute path from current working directory
     results_dir = Path("data/detection_results")
     results_dir.mkdir(parents=True, exist_ok=True)
     
     timestamp = int(time.time())
-    result_path = results_dir / f"result_{timestamp}.png"
-    latest_result_path = results_dir / "latest_result.png"
+    suffix = RESULT_IMAGE_FORMATS[RESULT_IMAGE_FORMAT][2]
+    result_path = results_dir / f"result_{timestamp}{suffix}"
+    latest_result_path = results_dir / f"latest_result{suffix}"
     
+    # encoded once, written twice
     result_img.save(result_path)
     result_img.save(latest_result_path)
     
     return result_img, description, result_path
 
 def play_audio(text):
-    try:
-        tts = pyttsx3.init()
-        tts.setProperty('rate', 150)
-        tts.setProperty('volume', 0.9)
-        tts.say(text)
-        tts.runAndWait()
-        del tts
-    except Exception as e:
-        print(f"Audio error: {e}")
-        print(f"Text was: {text}")
+    """Speaks text on the server without waiting for it, a newer description replaces one that hasn't been spoken yet"""
+    tts.speak(text)
 
-def detect_only(image_path):
+def announce_hazards(predictions, image_size=None, speak=True, received_at=None):
+    """The warning for the hazards in predictions (see hazards.py), spoken ahead of any description, and the hazards found
+    received_at: time.perf_counter() of when the photo arrived, to measure the time to the first hazard"""
+    found = hazards.find(predictions)
+    warning = summarizer.announce(found, image_size)
+    if warning and speak:
+        tts.speak(warning, urgent=True)
+    if received_at is not None:
+        hazards.record(time.perf_counter() - received_at if warning else None)
+    return warning, found
+
+def detect_only(image_path, tier=None):
     """Detect objects without saving results - for auto-detection"""
-    od_pipe = load_model()
-    
     # Load and process image
     image = Image.open(image_path)
-    predictions = od_pipe(image)
+    predictions = predict(image, tier)
     
     # Create description only (no saving)
-    description = summarize_predictions_natural_language(predictions)
+    description = summarize_predictions_natural_language(predictions, image.size)
     
     return description, predictions
 
-def detect_only_from_image(image):
+def detect_only_from_image(image, tier=None, region="full"):
     """Detect objects from PIL Image object without saving results"""
-    od_pipe = load_model()
-    
     # Process the image directly
-    predictions = od_pipe(image)
+    predictions = predict_region(image, tier, region)
     
     # Create description only (no saving)
-    description = summarize_predictions_natural_language(predictions)
+    description = summarize_predictions_natural_language(predictions, image.size)
     
     return description, predictions
 
+def decode_photo(photo_bytes, min_size=None):
+    """Decodes an uploaded photo from memory, jpegs are decoded at a reduced scale that still has min_size on the shortest edge"""
+    image = Image.open(io.BytesIO(photo_bytes))
+    if min_size and image.format == "JPEG":
+        image.draft("RGB", (min_size, min_size))
+    return image.convert("RGB")
+
+def detect_only_from_bytes(photo_bytes, tier=None, region="full"):
+    """Detect objects from the bytes of an uploaded photo without saving results"""
+    # the model resizes the photo down to its input size anyway, so it doesn't have to be decoded any bigger
+    image = decode_for_region(photo_bytes, tier, region)
+    return detect_only_from_image(image, tier, region)
+
+def detect_hazards_from_bytes(photo_bytes, tier=None, speak=True, received_at=None, region="full"):
+    """Warns about hazards as soon as the predictions are back, the description is left to the caller
+    returns (warning, hazards found, predictions, size of the decoded photo)"""
+    image = decode_for_region(photo_bytes, tier, region)
+    predictions = predict_region(image, tier, region)
+    warning, found = announce_hazards(predictions, image.size, speak, received_at)
+    return warning, found, predictions, image.size
+
+def detect_result_from_bytes(photo_bytes, tier=None, region="full"):
+    """Like detect_only_from_bytes plus a result_image of the photo, only drawn if something asks for it"""
+    image = decode_for_region(photo_bytes, tier, region)
+    description, predictions = detect_only_from_image(image, tier, region)
+    return description, predictions, result_image(photo_bytes, predictions, image.size)
+
 def process_photo():
     try:
         photo_path = get_latest_photo()
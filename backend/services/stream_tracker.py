@@ -0,0 +1,274 @@
+from collections import OrderedDict
+from frame_cache import frame_difference, FRAME_PIXEL_TOLERANCE, SIGNATURE_SIZE
+from summarizer import summarizer
+from hazards import hazards
+from boxes import box_area, iou
+from PIL import Image, ImageChops
+import itertools
+import io
+import threading
+import secrets
+import time
+import os
+
+# every how many frames of a stream is run through the model, the frames in between only follow the tracked objects
+STREAM_KEYFRAME_INTERVAL = int(os.environ.get("THEIA_STREAM_KEYFRAME_INTERVAL", 3))
+# fraction of a frame that can change from the last keyframe before it is made a keyframe early (see frame_cache)
+STREAM_KEYFRAME_CHANGE = float(os.environ.get("THEIA_STREAM_KEYFRAME_CHANGE", 0.15))
+# fraction of a tracked objects pixels that can change on a frame in between keyframes before it is made a keyframe early,
+# an object that moved or went away changes a lot of its own box even when it is too small to change much of the frame
+STREAM_TRACK_CHANGE = float(os.environ.get("THEIA_STREAM_TRACK_CHANGE", 0.5))
+# frames are tracked on a STREAM_THUMBNAIL_SIZE square grayscale copy, each object as a STREAM_PATCH_SIZE square of it
+STREAM_THUMBNAIL_SIZE = 64
+STREAM_PATCH_SIZE = 8
+# same label boxes of two keyframes overlapping at least this much are the same object
+STREAM_TRACK_IOU = 0.3
+# keyframes in a row an object can be missing from before it is gone, so one missed detection isn't "gone" then "new"
+STREAM_MAX_MISSED = 2
+# seconds a stream is kept without frames and how many streams there can be, the least recently used is dropped past it
+STREAM_SESSION_TTL_SECONDS = float(os.environ.get("THEIA_STREAM_SESSION_TTL", 60))
+STREAM_MAX_SESSIONS = int(os.environ.get("THEIA_STREAM_MAX_SESSIONS", 64))
+
+def frame_thumbnail(image: Image.Image) -> Image.Image:
+    """Small grayscale copy of a frame the tracks are followed on, jpegs are decoded at a reduced size to get it"""
+    if image.format == "JPEG":
+        image.draft("L", (STREAM_THUMBNAIL_SIZE * 2, STREAM_THUMBNAIL_SIZE * 2))
+    return image.convert("L").resize((STREAM_THUMBNAIL_SIZE, STREAM_THUMBNAIL_SIZE), Image.BILINEAR)
+
+def track_patch(thumbnail: Image.Image, box: dict, image_size: tuple[int, int]) -> Image.Image:
+    """The part of the thumbnail under box (in the coordinates of a image_size frame)"""
+    scale_x, scale_y = STREAM_THUMBNAIL_SIZE / image_size[0], STREAM_THUMBNAIL_SIZE / image_size[1]
+    left, top = int(box["xmin"] * scale_x), int(box["ymin"] * scale_y)
+    right, bottom = max(left + 1, round(box["xmax"] * scale_x)), max(top + 1, round(box["ymax"] * scale_y))
+    return thumbnail.crop((left, top, right, bottom)).resize((STREAM_PATCH_SIZE, STREAM_PATCH_SIZE), Image.BILINEAR)
+
+def patch_difference(a: Image.Image, b: Image.Image) -> float:
+    histogram = ImageChops.difference(a, b).histogram()
+    return sum(histogram[FRAME_PIXEL_TOLERANCE + 1:]) / (STREAM_PATCH_SIZE * STREAM_PATCH_SIZE)
+
+class track :
+    __slots__ = ("id", "label", "box", "score", "missed", "patch")
+
+    def __init__(self, id: int, prediction: dict):
+        self.id = id
+        self.label = prediction["label"]
+        self.box = prediction["box"]
+        self.score = prediction["score"]
+        self.missed = 0
+        # what the object looked like on the last keyframe it was seen on
+        self.patch = None
+
+#
+# follows objects from one keyframe to the next by matching each detection to the same label track it overlaps most
+# detections matching no track are new objects, tracks missing for more than max_missed keyframes are gone
+#
+class iou_tracker :
+
+    def __init__(self, iou_threshold: float, max_missed: int):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = []
+        self.__ids = itertools.count(1)
+
+    def update(self, predictions: list[dict]) -> tuple[list[track], list[track]]:
+        """Matches a keyframes predictions to the tracks, returns the (new, gone) tracks"""
+        pairs = []
+        for prediction_index, prediction in enumerate(predictions):
+            for track_index, tracked in enumerate(self.tracks):
+                if tracked.label == prediction["label"]:
+                    overlap = iou(tracked.box, prediction["box"])
+                    if overlap >= self.iou_threshold:
+                        pairs.append((overlap, prediction_index, track_index))
+
+        # best overlaps are matched first, each detection and track at most once
+        matched_predictions, matched_tracks = set(), set()
+        for overlap, prediction_index, track_index in sorted(pairs, reverse=True):
+            if prediction_index in matched_predictions or track_index in matched_tracks:
+                continue
+            matched_predictions.add(prediction_index)
+            matched_tracks.add(track_index)
+            tracked, prediction = self.tracks[track_index], predictions[prediction_index]
+            tracked.box, tracked.score, tracked.missed = prediction["box"], prediction["score"], 0
+
+        kept, gone = [], []
+        for track_index, tracked in enumerate(self.tracks):
+            if track_index not in matched_tracks:
+                tracked.missed += 1
+                if tracked.missed > self.max_missed:
+                    gone.append(tracked)
+                    continue
+            kept.append(tracked)
+
+        new = [track(next(self.__ids), prediction) for prediction_index, prediction in enumerate(predictions) if prediction_index not in matched_predictions]
+        self.tracks = kept + new
+        return new, gone
+
+#
+# one client streaming frames, decides which frames are keyframes and turns the tracker changes into what to say
+#
+# frames in between keyframes aren't run through the model, they are tracked cheaply: each object seen on the last
+# keyframe is compared with the same box of the frame, when one of them changed (it moved or went away) or the frame
+# as a whole did, the frame is made a keyframe early so the change is said now instead of at the next interval
+#
+class detection_stream :
+
+    def __init__(self, id: str, keyframe_interval: int, keyframe_change: float, track_change: float = STREAM_TRACK_CHANGE):
+        self.id = id
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.keyframe_change = keyframe_change
+        self.track_change = track_change
+        self.tracker = iou_tracker(STREAM_TRACK_IOU, STREAM_MAX_MISSED)
+        self.frames = 0
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.last_seen = time.monotonic()
+        # the requests of a stream are taken in order, a second request for it waits for this one
+        self.lock = threading.Lock()
+        # the frames themselves are tracked on detection workers, one at a time
+        self.__tracking = threading.Lock()
+        self.__since_keyframe = 0
+        self.__keyframe_signature = None
+        self.__keyframe_size = None
+
+    #
+    # one frame of the stream, run on a detection worker
+    # detect(photo_bytes) -> (predictions, size of the image they are for), only called for keyframes
+    # returns (keyframe, changes like update)
+    #
+    def track_frame(self, photo_bytes: bytes, detect) -> tuple[bool, list[dict]]:
+        thumbnail = frame_thumbnail(Image.open(io.BytesIO(photo_bytes)))
+        with self.__tracking:
+            keyframe = self.is_keyframe(thumbnail)
+        if not keyframe:
+            return False, []
+        predictions, image_size = detect(photo_bytes)
+        with self.__tracking:
+            return True, self.update(thumbnail, predictions, image_size)
+
+    def is_keyframe(self, thumbnail: Image.Image) -> bool:
+        """Counts the frame, True when it has to be run through the model"""
+        self.frames += 1
+        self.last_seen = time.monotonic()
+        if self.__keyframe_signature is None or self.__since_keyframe + 1 >= self.keyframe_interval:
+            return True
+        if frame_difference(self.__keyframe_signature, thumbnail.resize((SIGNATURE_SIZE, SIGNATURE_SIZE), Image.BILINEAR)) > self.keyframe_change:
+            return True
+        for tracked in self.tracker.tracks:
+            if tracked.patch is not None and patch_difference(tracked.patch, track_patch(thumbnail, tracked.box, self.__keyframe_size)) > self.track_change:
+                return True
+        self.__since_keyframe += 1
+        self.tracked_frames += 1
+        return False
+
+    #
+    # the keyframes predictions, image_size is (width, height) of the image they are for to say where things are
+    # returns the changes -> [{ "event": "new"|"gone", "label", "count", "position", "text" }]
+    #
+    def update(self, thumbnail: Image.Image, predictions: list[dict], image_size: tuple[int, int]) -> list[dict]:
+        self.keyframes += 1
+        self.__since_keyframe = 0
+        self.__keyframe_signature = thumbnail.resize((SIGNATURE_SIZE, SIGNATURE_SIZE), Image.BILINEAR)
+        self.__keyframe_size = image_size
+        new, gone = self.tracker.update(summarizer.filter(predictions))
+        for tracked in self.tracker.tracks:
+            if tracked.missed == 0:
+                tracked.patch = track_patch(thumbnail, tracked.box, image_size)
+        return self.__changes("new", new, image_size) + self.__changes("gone", gone, image_size)
+
+    def __changes(self, event: str, tracks: list[track], image_size: tuple[int, int]) -> list[dict]:
+        # label -> its tracks, several new people are one change
+        groups = {}
+        for tracked in tracks:
+            groups.setdefault(tracked.label, []).append(tracked)
+
+        changes = []
+        # hazards first, then the closest
+        ordered = sorted(groups.items(), key=lambda item: (hazards.priority(item[0]), max(box_area(tracked.box) for tracked in item[1])), reverse=True)
+        for label, grouped in ordered:
+            closest = max(grouped, key=lambda tracked: box_area(tracked.box))
+            position = summarizer.position(closest.box, image_size)
+            if event == "new":
+                text = f"new: {summarizer.counted(label, len(grouped))} {position}"
+            else:
+                text = f"gone: {label if len(grouped) == 1 else summarizer.counted(label, len(grouped))}"
+            changes.append({ "event": event, "label": label, "count": len(grouped), "position": position, "text": text })
+        return changes
+
+    def objects(self) -> list[str]:
+        return [tracked.label for tracked in self.tracker.tracks if tracked.missed == 0]
+
+#
+# the open streams by id, a stream is dropped after ttl seconds without frames
+#
+class stream_sessions :
+
+    def __init__(self, keyframe_interval: int, keyframe_change: float, ttl: float, max_sessions: int):
+        self.keyframe_interval = keyframe_interval
+        self.keyframe_change = keyframe_change
+        self.ttl = ttl
+        self.max_sessions = max(1, max_sessions)
+        self.__streams = OrderedDict()
+        self.__lock = threading.Lock()
+        self.frames = 0
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def create(self) -> detection_stream:
+        stream = detection_stream(secrets.token_urlsafe(12), self.keyframe_interval, self.keyframe_change)
+        with self.__lock:
+            self.__expire()
+            self.__streams[stream.id] = stream
+            while len(self.__streams) > self.max_sessions:
+                self.__close(self.__streams.popitem(last=False)[1])
+                self.evictions += 1
+        return stream
+
+    def get(self, id: str) -> detection_stream|None:
+        with self.__lock:
+            self.__expire()
+            stream = self.__streams.get(id)
+            if stream is not None:
+                self.__streams.move_to_end(id)
+            return stream
+
+    def close(self, id: str) -> bool:
+        with self.__lock:
+            stream = self.__streams.pop(id, None)
+            if stream is not None:
+                self.__close(stream)
+            return stream is not None
+
+    def __close(self, stream: detection_stream):
+        self.frames += stream.frames
+        self.keyframes += stream.keyframes
+        self.tracked_frames += stream.tracked_frames
+
+    def __expire(self):
+        now = time.monotonic()
+        while self.__streams:
+            id, stream = next(iter(self.__streams.items()))
+            if now - stream.last_seen <= self.ttl:
+                break
+            del self.__streams[id]
+            self.__close(stream)
+            self.expired += 1
+
+    def stats(self) -> dict:
+        with self.__lock:
+            streams = list(self.__streams.values())
+            frames = self.frames + sum(stream.frames for stream in streams)
+            keyframes = self.keyframes + sum(stream.keyframes for stream in streams)
+            tracked_frames = self.tracked_frames + sum(stream.tracked_frames for stream in streams)
+            return {
+                "streams": len(streams),
+                "frames": frames,
+                "keyframes": keyframes,
+                "keyframe_rate": round(keyframes / frames, 3) if frames else 0.0,
+                "tracked_frames": tracked_frames,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+streams = stream_sessions(STREAM_KEYFRAME_INTERVAL, STREAM_KEYFRAME_CHANGE, STREAM_SESSION_TTL_SECONDS, STREAM_MAX_SESSIONS)
@@ -0,0 +1,154 @@
+from boxes import box_area, non_max_suppression
+from hazards import hazards, HAZARD_ANNOUNCE_LIMIT
+import os
+
+# lowest confidence an object needs to be said out loud, higher than the detection threshold so unsure boxes stay quiet
+DESCRIPTION_SCORE_THRESHOLD = float(os.environ.get("THEIA_DESCRIPTION_SCORE_THRESHOLD", 0.7))
+# same label boxes overlapping more than this are the same object detected twice
+DESCRIPTION_IOU_THRESHOLD = 0.7
+# fraction of the photo an object covers from which it is close to the user
+NEAR_AREA_FRACTION = 0.1
+
+# the labels detr and yolos were trained on (coco)
+COCO_LABELS = (
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
+    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
+    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
+    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle",
+    "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange",
+    "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch", "potted plant", "bed",
+    "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone", "microwave", "oven",
+    "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear", "hair drier", "toothbrush",
+)
+IRREGULAR_PLURALS = { "person": "people", "mouse": "mice", "knife": "knives", "sheep": "sheep", "skis": "pairs of skis", "scissors": "pairs of scissors" }
+# coco labels that are already plural, said as one of them
+SINGULARS = { "skis": "pair of skis", "scissors": "pair of scissors" }
+NUMBER_WORDS = (
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+    "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen", "nineteen", "twenty",
+)
+
+# (side of the photo, close to the user) -> where it is said to be
+POSITIONS = {
+    ("left", False): "on your left", ("left", True): "close on your left",
+    ("center", False): "ahead", ("center", True): "right ahead",
+    ("right", False): "on your right", ("right", True): "close on your right",
+}
+
+def plural(label: str) -> str:
+    if label in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[label]
+    if label.endswith(("s", "x", "ch", "sh")):
+        return label + "es"
+    if label.endswith("y") and label[-2:-1] not in "aeiou":
+        return label[:-1] + "ies"
+    return label + "s"
+
+#
+# turns predictions into the sentence read out to the user, e.g.
+#   "In front of you, there are two people close on your left, one chair ahead and one dog on your right."
+#
+# objects below the score threshold are left out, duplicate boxes of one object are merged and
+# each kind of object is said once with how many there are and where the closest one is, hazards (see hazards.py)
+# first and then the closest kind first
+#
+class description_summarizer :
+
+    def __init__(self, score_threshold: float, iou_threshold: float, near_area_fraction: float):
+        self.score_threshold = score_threshold
+        self.iou_threshold = iou_threshold
+        self.near_area_fraction = near_area_fraction
+        # "one chair", "two chairs", ... are built once per label and count
+        self.__plurals = { label: plural(label) for label in COCO_LABELS }
+        self.__counted = {}
+
+    def counted(self, label: str, count: int) -> str:
+        key = (label, count)
+        phrase = self.__counted.get(key)
+        if phrase is None:
+            number = NUMBER_WORDS[count] if count < len(NUMBER_WORDS) else str(count)
+            if count == 1:
+                noun = SINGULARS.get(label, label)
+            else:
+                noun = self.__plurals.get(label) or plural(label)
+            phrase = self.__counted.setdefault(key, f"{number} {noun}")
+        return phrase
+
+    def position(self, box: dict, image_size: tuple[int, int]) -> str:
+        width, height = image_size
+        center = (box["xmin"] + box["xmax"]) / 2
+        if center < width / 3:
+            side = "left"
+        elif center > width * 2 / 3:
+            side = "right"
+        else:
+            side = "center"
+        return POSITIONS[(side, box_area(box) >= self.near_area_fraction * width * height)]
+
+    def filter(self, predictions: list[dict]) -> list[dict]:
+        confident = [prediction for prediction in predictions if prediction["score"] >= self.score_threshold]
+        return non_max_suppression(confident, self.iou_threshold)
+
+    #
+    # image_size: (width, height) of the photo the predictions are for, without it positions are left out
+    #
+    def summarize(self, predictions: list[dict], image_size: tuple[int, int]|None = None) -> str:
+        # label -> [count, area of the closest one, its box]
+        groups = {}
+        for prediction in self.filter(predictions):
+            area = box_area(prediction["box"])
+            group = groups.get(prediction["label"])
+            if group is None:
+                groups[prediction["label"]] = [1, area, prediction["box"]]
+            else:
+                group[0] += 1
+                if area > group[1]:
+                    group[1] = area
+                    group[2] = prediction["box"]
+
+        if not groups:
+            return "In front of you, there is nothing I can recognize."
+
+        ordered = sorted(groups.items(), key=lambda item: (hazards.priority(item[0]), item[1][1]), reverse=True)
+        phrases = []
+        for label, (count, area, box) in ordered:
+            phrase = self.counted(label, count)
+            if image_size is not None:
+                phrase = f"{phrase} {self.position(box, image_size)}"
+            phrases.append(phrase)
+
+        verb = "is" if ordered[0][1][0] == 1 else "are"
+        if len(phrases) == 1:
+            listed = phrases[0]
+        else:
+            listed = ", ".join(phrases[:-1]) + " and " + phrases[-1]
+        return f"In front of you, there {verb} {listed}."
+
+    #
+    # the short warning said before the description, e.g. "Careful, one car on your right and two bicycles ahead."
+    # found: hazards.find of the predictions, most urgent first, empty string when there are none
+    #
+    def announce(self, found: list[dict], image_size: tuple[int, int]|None = None, limit: int = HAZARD_ANNOUNCE_LIMIT) -> str:
+        # label -> [count, its most urgent box], in the order found has them
+        groups = {}
+        for prediction in found:
+            group = groups.get(prediction["label"])
+            if group is None:
+                if len(groups) == limit:
+                    continue
+                groups[prediction["label"]] = [1, prediction["box"]]
+            else:
+                group[0] += 1
+
+        phrases = []
+        for label, (count, box) in groups.items():
+            phrase = self.counted(label, count)
+            if image_size is not None:
+                phrase = f"{phrase} {self.position(box, image_size)}"
+            phrases.append(phrase)
+
+        if not phrases:
+            return ""
+        return f"Careful, {' and '.join(phrases)}."
+
+summarizer = description_summarizer(DESCRIPTION_SCORE_THRESHOLD, DESCRIPTION_IOU_THRESHOLD, NEAR_AREA_FRACTION)
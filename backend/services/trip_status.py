@@ -0,0 +1,74 @@
+from services.database import database
+from services.pubsub import broker
+import threading
+import time
+import os
+
+# seconds a kept snapshot is answered from memory before it is checked against the db again, changes made through
+# the routes here are emitted right away, this only catches up on ones that weren't (another server process, a direct db write)
+TRIP_SNAPSHOT_TTL_SECONDS = float(os.environ.get("THEIA_TRIP_SNAPSHOT_TTL", 30))
+
+#
+# keeps the latest trip status of each impaired user in memory and pushes a change event to the
+# ("trip", impaired_user_id) channel whenever a trip starts, is removed or completed
+#
+# the snapshot is what a new subscriber gets as its first event, it is answered without touching sqlite while it is
+# younger than ttl seconds (emit makes it new again), an older one or a missing one is read from the db and
+# published when it changed, plain status requests read the db themselves
+#
+# snapshot: { "seq": int, "event": str, "status": "active"|"inactive", "current_trip": dict|None }
+#
+class trip_status_feed :
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.__snapshots = {}
+        # impaired_user_id -> time.monotonic() the snapshot was last known to match the db
+        self.__checked = {}
+        self.__lock = threading.Lock()
+
+    def snapshot(self, impaired_user_id: int) -> dict:
+        with self.__lock:
+            snapshot = self.__snapshots.get(impaired_user_id)
+            if snapshot is not None and time.monotonic() - self.__checked[impaired_user_id] < self.ttl:
+                return snapshot
+        
+        current_trip = database.get_rows_by_key_and_table([("impaired_user_id", impaired_user_id)], "current_trip", ["to_location", "from_location"], True)
+        status = "active" if current_trip is not None else "inactive"
+        with self.__lock:
+            snapshot = self.__snapshots.get(impaired_user_id)
+            self.__checked[impaired_user_id] = time.monotonic()
+            if snapshot is not None and snapshot["status"] == status and snapshot["current_trip"] == current_trip:
+                return snapshot
+            
+            # first time asked or the db changed without an emit
+            snapshot = { "seq": snapshot["seq"] + 1 if snapshot is not None else 0, "event": "snapshot", "status": status, "current_trip": current_trip }
+            self.__snapshots[impaired_user_id] = snapshot
+            if snapshot["seq"] > 0:
+                broker.publish(("trip", impaired_user_id), [(snapshot["seq"], snapshot)])
+            return snapshot
+
+    #
+    # event: trip_started | trip_removed | trip_completed
+    # current_trip: the trip after the change (None when not on one)
+    # details: extra fields for the event like the completed destination_location
+    #
+    def emit(self, impaired_user_id: int, event: str, current_trip: dict|None, details: dict|None = None) -> dict:
+        with self.__lock:
+            previous = self.__snapshots.get(impaired_user_id)
+            snapshot = {
+                "seq": previous["seq"] + 1 if previous is not None else 1,
+                "event": event,
+                "status": "active" if current_trip is not None else "inactive",
+                "current_trip": current_trip,
+                **(details or {}),
+            }
+            self.__snapshots[impaired_user_id] = snapshot
+            self.__checked[impaired_user_id] = time.monotonic()
+            broker.publish(("trip", impaired_user_id), [(snapshot["seq"], snapshot)])
+        return snapshot
+
+    def channel(self, impaired_user_id: int):
+        return broker.channel(("trip", impaired_user_id))
+
+feed = trip_status_feed(TRIP_SNAPSHOT_TTL_SECONDS)
@@ -0,0 +1,238 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from pathlib import Path
+import tempfile
+import threading
+import time
+import os
+
+SPEECH_RATE = 150
+SPEECH_VOLUME = 0.9
+# how many synthesized descriptions (wav bytes) are kept for the audio endpoint
+TTS_CACHE_SIZE = int(os.environ.get("THEIA_TTS_CACHE_SIZE", 64))
+# seconds a description can wait to be spoken before it is too old to be worth saying
+TTS_MAX_SPEECH_AGE_SECONDS = float(os.environ.get("THEIA_TTS_MAX_SPEECH_AGE", 5))
+# seconds a request waits for a description to be synthesized
+TTS_SYNTHESIZE_TIMEOUT_SECONDS = 15
+# how many texts can wait to be synthesized, requests past it are turned away and prefetches skipped
+TTS_QUEUE_SIZE = int(os.environ.get("THEIA_TTS_QUEUE_SIZE", 8))
+# longest text that is synthesized, descriptions are far shorter
+TTS_MAX_TEXT_LENGTH = 500
+
+#
+# raised when there is no working speech engine on this machine
+#
+class tts_unavailable(Exception) :
+    pass
+
+#
+# raised when too many texts are already waiting to be synthesized
+#
+class tts_busy(Exception) :
+    pass
+
+#
+# one thread owns the only pyttsx3 engine (engines can't be shared between threads) and does all speaking
+# and synthesizing, so callers never wait on runAndWait
+#
+#   speak: only the newest description waits to be spoken, a newer one replaces it and old ones are dropped
+#          urgent ones (hazard warnings) wait apart from descriptions and are spoken before anything else
+#   synthesize: the description as wav bytes, cached by text and shared by requests asking for the same text
+#   prefetch: synthesize in the background, only once nothing is waiting to be spoken
+#
+# the engine does one thing at a time in this order -> warnings, syntheses a request waits on, speech, prefetches
+#
+class speech_service :
+
+    def __init__(self, cache_size: int, max_speech_age: float, queue_size: int):
+        self.cache_size = cache_size
+        self.max_speech_age = max_speech_age
+        self.queue_size = queue_size
+        self.__condition = threading.Condition()
+        self.__pending_speech = None
+        self.__pending_warning = None
+        self.__synthesize_queue = deque()
+        self.__prefetch_queue = deque()
+        self.__in_flight = {}
+        self.__cache = OrderedDict()
+        self.__thread = None
+        self.__ready = threading.Event()
+        self.error = None
+        self.spoken = 0
+        self.coalesced = 0
+        self.stale = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rejected = 0
+
+    def __start(self):
+        with self.__condition:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name="tts-worker", daemon=True)
+                self.__thread.start()
+
+    def available(self, timeout: float = 10) -> bool:
+        """Starts the worker and waits for its engine, False when there is no engine to speak with"""
+        self.__start()
+        self.__ready.wait(timeout)
+        return self.__ready.is_set() and self.error is None
+
+    #
+    # queues text to be spoken on the server and returns right away, urgent text isn't replaced by a description
+    # queued after it and is spoken next
+    #
+    def speak(self, text: str, urgent: bool = False):
+        self.__start()
+        with self.__condition:
+            if urgent:
+                if self.__pending_warning is not None:
+                    self.coalesced += 1
+                self.__pending_warning = (text, time.monotonic())
+            else:
+                if self.__pending_speech is not None:
+                    self.coalesced += 1
+                self.__pending_speech = (text, time.monotonic())
+            self.__condition.notify()
+
+    # the future of texts synthesis, None when the queue is full, waited ones go ahead of prefetches and speech
+    def __submit(self, text: str, waited: bool) -> Future|None:
+        with self.__condition:
+            future = self.__in_flight.get(text)
+            if future is not None:
+                if waited and text in self.__prefetch_queue:
+                    self.__prefetch_queue.remove(text)
+                    self.__synthesize_queue.append(text)
+                return future
+            if len(self.__synthesize_queue) + len(self.__prefetch_queue) >= self.queue_size:
+                self.rejected += 1
+                return None
+            future = Future()
+            self.__in_flight[text] = future
+            (self.__synthesize_queue if waited else self.__prefetch_queue).append(text)
+            self.__condition.notify()
+            return future
+
+    def cached(self, text: str) -> bytes|None:
+        with self.__condition:
+            audio = self.__cache.get(text)
+            if audio is not None:
+                self.__cache.move_to_end(text)
+            return audio
+
+    #
+    # the text as wav bytes, raises ValueError when it is too long, tts_busy, tts_unavailable or TimeoutError
+    #
+    def synthesize(self, text: str, timeout: float = TTS_SYNTHESIZE_TIMEOUT_SECONDS) -> bytes:
+        if len(text) > TTS_MAX_TEXT_LENGTH:
+            raise ValueError(f"Text is longer than {TTS_MAX_TEXT_LENGTH} characters")
+        audio = self.cached(text)
+        if audio is not None:
+            self.cache_hits += 1
+            return audio
+        self.cache_misses += 1
+        self.__start()
+        future = self.__submit(text, waited=True)
+        if future is None:
+            raise tts_busy("Too many texts are waiting to be synthesized")
+        return future.result(timeout)
+
+    def prefetch(self, text: str):
+        """Synthesizes text in the background so the audio is cached by the time it is asked for, skipped when busy"""
+        if len(text) <= TTS_MAX_TEXT_LENGTH and self.cached(text) is None:
+            self.__start()
+            self.__submit(text, waited=False)
+
+    def __run(self):
+        engine = None
+        try:
+            import pyttsx3
+            engine = pyttsx3.init()
+            engine.setProperty('rate', SPEECH_RATE)
+            engine.setProperty('volume', SPEECH_VOLUME)
+        except Exception as e:
+            self.error = str(e)
+            print(f"Audio error: {e}")
+        self.__ready.set()
+
+        while True:
+            with self.__condition:
+                while not self.__synthesize_queue and not self.__prefetch_queue and self.__pending_speech is None and self.__pending_warning is None:
+                    self.__condition.wait()
+                # warnings first, then someone waiting on a synthesis, then speech, prefetches last
+                if self.__pending_warning is not None:
+                    text, queued_at = self.__pending_warning
+                    self.__pending_warning = None
+                elif self.__synthesize_queue:
+                    self.__synthesize(engine, self.__synthesize_queue.popleft())
+                    continue
+                elif self.__pending_speech is not None:
+                    text, queued_at = self.__pending_speech
+                    self.__pending_speech = None
+                else:
+                    self.__synthesize(engine, self.__prefetch_queue.popleft())
+                    continue
+
+            if time.monotonic() - queued_at > self.max_speech_age:
+                self.stale += 1
+                continue
+            self.__speak(engine, text)
+
+    def __speak(self, engine, text: str):
+        if engine is None:
+            print(f"Text was: {text}")
+            return
+        try:
+            engine.say(text)
+            engine.runAndWait()
+            self.spoken += 1
+        except Exception as e:
+            print(f"Audio error: {e}")
+            print(f"Text was: {text}")
+
+    # called holding the condition, it is released while the engine runs
+    def __synthesize(self, engine, text: str):
+        future = self.__in_flight[text]
+        self.__condition.release()
+        try:
+            if engine is None:
+                raise tts_unavailable(f"No speech engine: {self.error}")
+            with tempfile.TemporaryDirectory() as temp_dir:
+                wav_path = Path(temp_dir) / "speech.wav"
+                engine.save_to_file(text, str(wav_path))
+                engine.runAndWait()
+                audio = wav_path.read_bytes()
+        except Exception as e:
+            audio = None
+            error = e if isinstance(e, tts_unavailable) else tts_unavailable(f"Synthesizing failed: {e}")
+        finally:
+            self.__condition.acquire()
+
+        del self.__in_flight[text]
+        if audio is None:
+            future.set_exception(error)
+            return
+        if self.cache_size > 0:
+            self.__cache[text] = audio
+            while len(self.__cache) > self.cache_size:
+                self.__cache.popitem(last=False)
+        future.set_result(audio)
+
+    def stats(self) -> dict:
+        if not self.__ready.is_set():
+            state = "starting" if self.__thread is not None else "idle"
+        else:
+            state = "ready" if self.error is None else "unavailable"
+        with self.__condition:
+            return {
+                "state": state,
+                "spoken": self.spoken,
+                "coalesced": self.coalesced,
+                "stale": self.stale,
+                "cached": len(self.__cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "queued": len(self.__synthesize_queue) + len(self.__prefetch_queue),
+                "rejected": self.rejected,
+            }
+
+tts = speech_service(TTS_CACHE_SIZE, TTS_MAX_SPEECH_AGE_SECONDS, TTS_QUEUE_SIZE)